@@ -0,0 +1,11 @@
+import asyncio
+
+from mitmproxy import ctx
+
+
+async def request(flow):
+    # Async hooks are awaited on mitmproxy's event loop, so other flows are
+    # handled while this one waits. Use await instead of blocking calls.
+    ctx.log.info("handle request: %s%s" % (flow.request.host, flow.request.path))
+    await asyncio.sleep(5)
+    ctx.log.info("start  request: %s%s" % (flow.request.host, flow.request.path))
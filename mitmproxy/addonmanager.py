@@ -1,3 +1,7 @@
+import asyncio
+import bisect
+import inspect
+import time
 import types
 import typing
 import traceback
@@ -16,24 +20,32 @@ def _get_name(itm):
     return getattr(itm, "name", itm.__class__.__name__.lower())
 
 
-def cut_traceback(tb, func_name):
+def cut_traceback(tb, *func_names):
     """
-    Cut off a traceback at the function with the given name.
-    The func_name's frame is excluded.
+    Cut off a traceback at the last function with one of the given names.
+    The function's frame is excluded.
 
     Args:
         tb: traceback object, as returned by sys.exc_info()[2]
-        func_name: function name
+        func_names: function names
 
     Returns:
         Reduced traceback.
     """
     tb_orig = tb
+    cut = None
     for _, _, fname, _ in traceback.extract_tb(tb):
         tb = tb.tb_next
-        if fname == func_name:
-            break
-    return tb or tb_orig
+        if fname in func_names:
+            cut = tb
+    return cut or tb_orig
+
+
+HANDLER_FRAMES = ("invoke_handler", "await_handler", "timed_call", "timed_await")
+"""
+    Names of the functions calling addon handlers. Tracebacks of handler
+    errors are cut at these frames.
+"""
 
 
 @contextlib.contextmanager
@@ -44,7 +56,7 @@ def safecall():
         raise
     except Exception as e:
         etype, value, tb = sys.exc_info()
-        tb = cut_traceback(tb, "invoke_addon")
+        tb = cut_traceback(tb, *HANDLER_FRAMES)
         ctx.log.error(
             "Addon error: %s" % "".join(
                 traceback.format_exception(etype, value, tb)
@@ -99,6 +111,81 @@ class Loader:
         self.master.commands.add(path, func)
 
 
+class HandlerStats:
+    """
+        Latency statistics of addon event handlers, keyed by (addon name,
+        event name). Latencies are counted in log-scale histogram buckets.
+    """
+    buckets = [10 ** (e / 2) for e in range(-12, 1)]
+    """Upper bounds of the histogram buckets in seconds, from 1us to 1s."""
+
+    def __init__(self):
+        self.data: typing.Dict[typing.Tuple[str, str], typing.Dict[str, typing.Any]] = {}
+
+    def record(self, addon: str, event: str, duration: float, error: bool) -> None:
+        d = self.data.get((addon, event))
+        if d is None:
+            d = self.data.setdefault((addon, event), dict(
+                count=0,
+                errors=0,
+                total=0.0,
+                max=0.0,
+                histogram=[0] * (len(self.buckets) + 1),
+            ))
+        d["count"] += 1
+        d["errors"] += error
+        d["total"] += duration
+        d["max"] = max(d["max"], duration)
+        d["histogram"][bisect.bisect_left(self.buckets, duration)] += 1
+
+    def timed_call(self, addon, event, func, *args, **kwargs):
+        """
+            Call a handler and record its latency. For async handlers, the
+            time until the returned awaitable is done is recorded.
+        """
+        start = time.perf_counter()
+        try:
+            ret = func(*args, **kwargs)
+        except exceptions.AddonHalt:
+            self.record(addon, event, time.perf_counter() - start, False)
+            raise
+        except Exception:
+            self.record(addon, event, time.perf_counter() - start, True)
+            raise
+        if inspect.isawaitable(ret):
+            return self.timed_await(addon, event, start, ret)
+        self.record(addon, event, time.perf_counter() - start, False)
+        return ret
+
+    async def timed_await(self, addon, event, start, aw):
+        try:
+            ret = await aw
+        except Exception:
+            self.record(addon, event, time.perf_counter() - start, True)
+            raise
+        self.record(addon, event, time.perf_counter() - start, False)
+        return ret
+
+    def summary(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+            The statistics as a list of dicts, slowest handlers first.
+        """
+        ret = []
+        for (addon, event), d in self.data.items():
+            ret.append(dict(
+                addon=addon,
+                event=event,
+                count=d["count"],
+                errors=d["errors"],
+                total=d["total"],
+                mean=d["total"] / d["count"],
+                max=d["max"],
+                histogram=list(zip(self.buckets + [None], d["histogram"])),
+            ))
+        ret.sort(key=lambda x: x["total"], reverse=True)
+        return ret
+
+
 def traverse(chain):
     """
         Recursively traverse an addon chain.
@@ -114,6 +201,15 @@ class AddonManager:
         self.lookup = {}
         self.chain = []
         self.master = master
+        self.handlers: typing.Dict[str, typing.List[typing.Tuple[typing.Any, typing.List[typing.Any]]]] = {}
+        """
+            Event name -> (top-level addon, addons in its tree implementing
+            the event) pairs. Built lazily and discarded by invalidate().
+        """
+        self.stats: typing.Optional[HandlerStats] = None
+        """
+            Handler latency statistics, or None if they are not collected.
+        """
         master.options.changed.connect(self._configure_all)
 
     def _configure_all(self, options, updated):
@@ -156,6 +252,7 @@ class AddonManager:
         for a in traverse([addon]):
             name = _get_name(a)
             self.lookup[name] = a
+        self.invalidate()
         for a in traverse([addon]):
             self.master.commands.collect_commands(a)
         self.master.options.process_deferred()
@@ -183,8 +280,45 @@ class AddonManager:
                 raise exceptions.AddonManagerError("No such addon: %s" % n)
             self.chain = [i for i in self.chain if i is not a]
             del self.lookup[_get_name(a)]
+        self.invalidate()
         self.invoke_addon(a, "done")
 
+    def invalidate(self):
+        """
+            Discard the event dispatch table. This must be called whenever
+            the addon tree changes without going through add(), register()
+            or remove(), for example when a script is reloaded.
+        """
+        self.handlers = {}
+
+    def get_handlers(self, name):
+        """
+            Retrieve the addons implementing an event as (top-level addon,
+            addons in its tree) pairs, in chain order.
+        """
+        # Proxy threads look up handlers as well, so make sure that we never
+        # store a stale entry in a table that has been invalidated meanwhile.
+        table = self.handlers
+        handlers = table.get(name)
+        if handlers is None:
+            handlers = []
+            for i in self.chain:
+                group = [a for a in traverse([i]) if getattr(a, name, None)]
+                if group:
+                    handlers.append((i, group))
+            table[name] = handlers
+        return handlers
+
+    def handles(self, name, message):
+        """
+            Does handle_lifecycle() have any handler to call for this event?
+            Flows trigger update after every event, so an addon implementing
+            update alone handles all flow events.
+        """
+        if self.get_handlers(name):
+            return True
+        return isinstance(message, flow.Flow) and bool(self.get_handlers("update"))
+
     def __len__(self):
         return len(self.chain)
 
@@ -195,6 +329,17 @@ class AddonManager:
         name = _get_name(item)
         return name in self.lookup
 
+    def modifies_messages(self, name):
+        """
+            Is the handler for the given event marked with
+            @modifies_messages on any addon?
+        """
+        for _, group in self.get_handlers(name):
+            for a in group:
+                if getattr(getattr(a, name), "modifies_messages", False):
+                    return True
+        return False
+
     async def handle_lifecycle(self, name, message):
         """
             Handle a lifecycle event.
@@ -210,7 +355,7 @@ class AddonManager:
         if isinstance(message.reply, controller.DummyReply):
             message.reply.reset()
 
-        self.trigger(name, message)
+        await self.async_trigger(name, message)
 
         if message.reply.state == "start":
             message.reply.take()
@@ -222,7 +367,29 @@ class AddonManager:
                 message.reply.mark_reset()
 
         if isinstance(message, flow.Flow):
-            self.trigger("update", [message])
+            await self.async_trigger("update", [message])
+
+    def invoke_handler(self, addon, name, *args, **kwargs):
+        """
+            Invoke an event on a single addon, ignoring its children.
+            Returns the awaitable if the handler is a coroutine function.
+        """
+        func = getattr(addon, name, None)
+        if func:
+            if callable(func):
+                if self.stats is None:
+                    return func(*args, **kwargs)
+                return self.stats.timed_call(_get_name(addon), name, func, *args, **kwargs)
+            elif isinstance(func, types.ModuleType):
+                # we gracefully exclude module imports with the same name as hooks.
+                # For example, a user may have "from mitmproxy import log" in an addon,
+                # which has the same name as the "log" hook. In this particular case,
+                # we end up in an error loop because we "log" this error.
+                pass
+            else:
+                raise exceptions.AddonManagerError(
+                    "Addon handler {} ({}) not callable".format(name, addon)
+                )
 
     def invoke_addon(self, addon, name, *args, **kwargs):
         """
@@ -231,28 +398,69 @@ class AddonManager:
         if name not in eventsequence.Events:
             raise exceptions.AddonManagerError("Unknown event: %s" % name)
         for a in traverse([addon]):
-            func = getattr(a, name, None)
-            if func:
-                if callable(func):
-                    func(*args, **kwargs)
-                elif isinstance(func, types.ModuleType):
-                    # we gracefully exclude module imports with the same name as hooks.
-                    # For example, a user may have "from mitmproxy import log" in an addon,
-                    # which has the same name as the "log" hook. In this particular case,
-                    # we end up in an error loop because we "log" this error.
-                    pass
-                else:
-                    raise exceptions.AddonManagerError(
-                        "Addon handler {} ({}) not callable".format(name, a)
-                    )
+            ret = self.invoke_handler(a, name, *args, **kwargs)
+            if inspect.isawaitable(ret):
+                asyncio.ensure_future(self.await_handler(ret))
+
+    async def await_handler(self, aw):
+        """
+            Await the result of an async handler. Errors are logged like
+            those of regular handlers.
+        """
+        with safecall():
+            await aw
+
+    def _iter_group(self, addon, group):
+        """
+            Yield the addons of a dispatch table group, which must be invoked
+            in between. If a handler changes the addon tree, e.g. by loading
+            scripts, the rest of the top-level addon's tree is traversed
+            instead.
+        """
+        handlers = self.handlers
+        for i, a in enumerate(group):
+            yield a
+            if self.handlers is not handlers:
+                done = group[:i + 1]
+                for b in traverse([addon]):
+                    if not any(b is d for d in done):
+                        yield b
+                return
 
     def trigger(self, name, *args, **kwargs):
         """
-            Trigger an event across all addons.
+            Trigger an event across all addons. Async handlers are scheduled
+            on the event loop without waiting for them.
         """
-        for i in self.chain:
+        if name not in eventsequence.Events:
+            with safecall():
+                raise exceptions.AddonManagerError("Unknown event: %s" % name)
+            return
+        for addon, group in self.get_handlers(name):
+            try:
+                with safecall():
+                    for a in self._iter_group(addon, group):
+                        ret = self.invoke_handler(a, name, *args, **kwargs)
+                        if inspect.isawaitable(ret):
+                            asyncio.ensure_future(self.await_handler(ret))
+            except exceptions.AddonHalt:
+                return
+
+    async def async_trigger(self, name, *args, **kwargs):
+        """
+            Trigger an event across all addons, awaiting async handlers in
+            turn. Other events can be handled while a handler is suspended.
+        """
+        if name not in eventsequence.Events:
+            with safecall():
+                raise exceptions.AddonManagerError("Unknown event: %s" % name)
+            return
+        for addon, group in self.get_handlers(name):
             try:
                 with safecall():
-                    self.invoke_addon(i, name, *args, **kwargs)
+                    for a in self._iter_group(addon, group):
+                        ret = self.invoke_handler(a, name, *args, **kwargs)
+                        if inspect.isawaitable(ret):
+                            await self.await_handler(ret)
             except exceptions.AddonHalt:
                 return
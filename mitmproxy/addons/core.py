@@ -3,6 +3,7 @@ import typing
 import os
 
 from mitmproxy.utils import human
+from mitmproxy import addonmanager
 from mitmproxy import ctx
 from mitmproxy import exceptions
 from mitmproxy import command
@@ -34,6 +35,13 @@ class Core:
             to the reverse proxy target.
             """
         )
+        loader.add_option(
+            "addon_stats", bool, False,
+            """
+            Record call counts, errors and latency histograms of addon event
+            handlers. See the addons.stats command.
+            """
+        )
 
     def configure(self, updated):
         opts = ctx.options
@@ -58,6 +66,19 @@ class Core:
                     "Invalid body size limit specification: %s" %
                     opts.body_size_limit
                 )
+        if "websocket_retain_size" in updated:
+            try:
+                human.parse_size(opts.websocket_retain_size)
+            except ValueError as e:
+                raise exceptions.OptionsError(
+                    "Invalid WebSocket retain size specification: %s" %
+                    opts.websocket_retain_size
+                )
+        if "addon_stats" in updated:
+            if not opts.addon_stats:
+                ctx.master.addons.stats = None
+            elif ctx.master.addons.stats is None:
+                ctx.master.addons.stats = addonmanager.HandlerStats()
         if "mode" in updated:
             mode = opts.mode
             if mode.startswith("reverse:") or mode.startswith("upstream:"):
@@ -97,6 +118,30 @@ class Core:
         except exceptions.OptionsError as e:
             raise exceptions.CommandError(e) from e
 
+    @command.command("addons.stats")
+    def addons_stats(self) -> mitmproxy.types.Data:
+        """
+            Addon event handler statistics, slowest handlers first: addon,
+            event, calls, errors, total, mean and maximum time in
+            milliseconds. Requires the addon_stats option.
+        """
+        stats = ctx.master.addons.stats
+        if stats is None:
+            raise exceptions.CommandError("Addon statistics are disabled, set addon_stats to enable them.")
+        rows: typing.List[typing.List[str]] = [
+            [
+                s["addon"],
+                s["event"],
+                str(s["count"]),
+                str(s["errors"]),
+                "%.3f" % (s["total"] * 1000),
+                "%.3f" % (s["mean"] * 1000),
+                "%.3f" % (s["max"] * 1000),
+            ]
+            for s in stats.summary()
+        ]
+        return rows  # type: ignore
+
     @command.command("flow.resume")
     def resume(self, flows: typing.Sequence[flow.Flow]) -> None:
         """
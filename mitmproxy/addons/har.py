@@ -0,0 +1,337 @@
+import base64
+import collections
+import json
+import os.path
+import typing
+
+from datetime import datetime
+from datetime import timezone
+
+from mitmproxy import command
+from mitmproxy import ctx
+from mitmproxy import exceptions
+from mitmproxy import flow
+from mitmproxy import flowfilter
+from mitmproxy import http
+from mitmproxy import version
+from mitmproxy.net.http import cookies
+from mitmproxy.utils import human
+from mitmproxy.utils import strutils
+import mitmproxy.types
+
+MAX_CONNECTIONS = 10000
+"""Number of server connections remembered to tell new from reused ones."""
+
+
+def format_cookies(cookie_list):
+    rv = []
+
+    for name, value, attrs in cookie_list:
+        cookie_har = {
+            "name": name,
+            "value": value,
+        }
+
+        # HAR only needs some attributes
+        for key in ["path", "domain", "comment"]:
+            if key in attrs:
+                cookie_har[key] = attrs[key]
+
+        # These keys need to be boolean!
+        for key in ["httpOnly", "secure"]:
+            cookie_har[key] = bool(key in attrs)
+
+        # Expiration time needs to be formatted
+        expire_ts = cookies.get_expiration_ts(attrs)
+        if expire_ts is not None:
+            cookie_har["expires"] = datetime.fromtimestamp(expire_ts, timezone.utc).isoformat()
+
+        rv.append(cookie_har)
+
+    return rv
+
+
+def format_request_cookies(fields):
+    return format_cookies(cookies.group_cookies(fields))
+
+
+def format_response_cookies(fields):
+    return format_cookies((c[0], c[1][0], c[1][1]) for c in fields)
+
+
+def name_value(obj):
+    """
+        Convert (key, value) pairs to HAR format.
+    """
+    return [{"name": k, "value": v} for k, v in obj.items()]
+
+
+def entry(f: http.HTTPFlow, new_connection: bool = True) -> dict:
+    """
+        Convert a flow with a response to a HAR entry. Connect and SSL
+        timings are only given for the first flow of a server connection.
+    """
+    # -1 indicates that these values do not apply to current request
+    ssl_time = -1
+    connect_time = -1
+
+    if new_connection and f.server_conn and f.server_conn.timestamp_tcp_setup:
+        connect_time = f.server_conn.timestamp_tcp_setup - f.server_conn.timestamp_start
+        if f.server_conn.timestamp_tls_setup is not None:
+            ssl_time = f.server_conn.timestamp_tls_setup - f.server_conn.timestamp_tcp_setup
+
+    # Calculate raw timings from timestamps. DNS timings can not be calculated
+    # for lack of a way to measure it. The same goes for HAR blocked.
+    # mitmproxy will open a server connection as soon as it receives the host
+    # and port from the client connection. So, the time spent waiting is actually
+    # spent waiting between request.timestamp_end and response.timestamp_start
+    # thus it correlates to HAR wait instead.
+    timings_raw = {
+        'send': f.request.timestamp_end - f.request.timestamp_start,
+        'receive': f.response.timestamp_end - f.response.timestamp_start,
+        'wait': f.response.timestamp_start - f.request.timestamp_end,
+        'connect': connect_time,
+        'ssl': ssl_time,
+    }
+
+    # HAR timings are integers in ms, so we re-encode the raw timings to that format.
+    timings = {k: int(1000 * v) if v != -1 else -1 for k, v in timings_raw.items()}
+
+    # full_time is the sum of all timings.
+    # Timings set to -1 will be ignored as per spec.
+    full_time = sum(v for v in timings.values() if v > -1)
+
+    started_date_time = datetime.fromtimestamp(f.request.timestamp_start, timezone.utc).isoformat()
+
+    # Response body size and encoding
+    response_body = f.response.get_content(strict=False) or b""
+    response_body_size = len(f.response.raw_content or b"")
+    response_body_compression = len(response_body) - response_body_size
+
+    e: typing.Dict[str, typing.Any] = {
+        "startedDateTime": started_date_time,
+        "time": full_time,
+        "request": {
+            "method": f.request.method,
+            "url": f.request.url,
+            "httpVersion": f.request.http_version,
+            "cookies": format_request_cookies(f.request.cookies.fields),
+            "headers": name_value(f.request.headers),
+            "queryString": name_value(f.request.query or {}),
+            "headersSize": len(str(f.request.headers)),
+            "bodySize": len(f.request.raw_content or b""),
+        },
+        "response": {
+            "status": f.response.status_code,
+            "statusText": f.response.reason,
+            "httpVersion": f.response.http_version,
+            "cookies": format_response_cookies(f.response.cookies.fields),
+            "headers": name_value(f.response.headers),
+            "content": {
+                "size": response_body_size,
+                "compression": response_body_compression,
+                "mimeType": f.response.headers.get('Content-Type', '')
+            },
+            "redirectURL": f.response.headers.get('Location', ''),
+            "headersSize": len(str(f.response.headers)),
+            "bodySize": response_body_size,
+        },
+        "cache": {},
+        "timings": timings,
+    }
+
+    # Store binary data as base64
+    if strutils.is_mostly_bin(response_body):
+        e["response"]["content"]["text"] = base64.b64encode(response_body).decode()
+        e["response"]["content"]["encoding"] = "base64"
+    else:
+        e["response"]["content"]["text"] = f.response.get_text(strict=False)
+
+    if f.request.method in ["POST", "PUT", "PATCH"]:
+        params = [
+            {"name": a, "value": b}
+            for a, b in f.request.urlencoded_form.items(multi=True)
+        ]
+        e["request"]["postData"] = {
+            "mimeType": f.request.headers.get("Content-Type", ""),
+            "text": f.request.get_text(strict=False),
+            "params": params
+        }
+
+    if f.server_conn and f.server_conn.ip_address:
+        e["serverIPAddress"] = str(f.server_conn.ip_address[0])
+
+    return e
+
+
+class HARWriter:
+    """
+        Writes HAR documents entry by entry, so that only the entry being
+        written is held in memory. If a maximum size is given, a new file
+        is started once the current one has reached it. The path is then a
+        template, which may contain {n}, the number of the file. If it
+        does not, .{n} is inserted before the extension.
+    """
+
+    def __init__(self, path: str, max_size: int = 0) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.fo: typing.Optional[typing.BinaryIO] = None
+        self.n = 0
+        self.size = 0
+        self.entries = 0
+        """Number of entries written to the current file."""
+        self.paths: typing.List[str] = []
+        self.connections = collections.OrderedDict()  # type: collections.OrderedDict
+
+        head, tail = json.dumps({
+            "log": {
+                "version": "1.2",
+                "creator": {
+                    "name": "mitmproxy",
+                    "version": version.VERSION,
+                },
+                "entries": [],
+            }
+        }).rsplit("[]", 1)
+        self.head = (head + "[\n").encode()
+        self.tail = ("\n]" + tail + "\n").encode()
+        self._open()
+
+    def file_path(self, n: int) -> str:
+        path = os.path.expanduser(self.path)
+        if not self.max_size:
+            return path
+        if "{n}" not in path:
+            root, ext = os.path.splitext(path)
+            path = root + ".{n}" + ext
+        return path.replace("{n}", str(n))
+
+    def _open(self):
+        path = self.file_path(self.n)
+        self.n += 1
+        self.fo = open(path, "wb")
+        self.paths.append(path)
+        self.fo.write(self.head)
+        self.size = len(self.head)
+        self.entries = 0
+
+    def _new_connection(self, f: http.HTTPFlow) -> bool:
+        if not f.server_conn:
+            return False
+        conn = f.server_conn.id
+        if conn in self.connections:
+            return False
+        self.connections[conn] = None
+        if len(self.connections) > MAX_CONNECTIONS:
+            self.connections.popitem(last=False)
+        return True
+
+    def add(self, f: http.HTTPFlow) -> None:
+        if self.max_size and self.entries and self.size >= self.max_size:
+            self.close()
+            self._open()
+        data = json.dumps(entry(f, self._new_connection(f))).encode()
+        if self.entries:
+            data = b",\n" + data
+        self.fo.write(data)
+        self.size += len(data)
+        self.entries += 1
+
+    def close(self) -> None:
+        """
+            Complete and close the current file.
+        """
+        self.fo.write(self.tail)
+        self.fo.close()
+
+
+class Har:
+    def __init__(self):
+        self.writer: typing.Optional[HARWriter] = None
+        self.filt = None
+
+    def load(self, loader):
+        loader.add_option(
+            "har_file", typing.Optional[str], None,
+            """
+            Write HTTP flows to a HAR file as they complete. Entries are
+            written incrementally, so the file is only a complete HAR
+            document once mitmproxy exits or the option is unset. Use with
+            -nr to convert a flow file.
+            """
+        )
+        loader.add_option(
+            "har_filter", typing.Optional[str], None,
+            "Filter which flows are written to the HAR file."
+        )
+        loader.add_option(
+            "har_split_size", typing.Optional[str], None,
+            """
+            Start a new HAR file when the current one reaches this size.
+            Understands k/m/g suffixes, i.e. 100m for 100 megabytes. The
+            file name may contain {n}, the number of the file, otherwise
+            .{n} is inserted before the extension.
+            """
+        )
+
+    def configure(self, updated):
+        if "har_filter" in updated:
+            if ctx.options.har_filter:
+                self.filt = flowfilter.parse(ctx.options.har_filter)
+                if not self.filt:
+                    raise exceptions.OptionsError(
+                        "Invalid filter specification: %s" % ctx.options.har_filter
+                    )
+            else:
+                self.filt = None
+        if "har_split_size" in updated:
+            try:
+                human.parse_size(ctx.options.har_split_size)
+            except ValueError:
+                raise exceptions.OptionsError(
+                    "Invalid size specification for har_split_size: %s" % ctx.options.har_split_size
+                )
+        if {"har_file", "har_split_size"} & set(updated):
+            self.done()
+            if ctx.options.har_file:
+                try:
+                    self.writer = HARWriter(
+                        ctx.options.har_file,
+                        human.parse_size(ctx.options.har_split_size) or 0,
+                    )
+                except IOError as v:
+                    raise exceptions.OptionsError(str(v))
+
+    @command.command("har.file")
+    def file(self, flows: typing.Sequence[flow.Flow], path: mitmproxy.types.Path) -> None:
+        """
+            Export HTTP flows with a response to a HAR file.
+        """
+        exported = [f for f in flows if isinstance(f, http.HTTPFlow) and f.response]
+        try:
+            w = HARWriter(path)
+            for f in exported:
+                w.add(f)
+            w.close()
+        except IOError as v:
+            raise exceptions.CommandError(v) from v
+        ctx.log.alert("Exported %s flows." % len(exported))
+
+    def response(self, f):
+        if not self.writer:
+            return
+        if not self.filt or flowfilter.match(self.filt, f):
+            try:
+                self.writer.add(f)
+            except IOError as v:
+                ctx.log.error("Error writing to HAR file: %s" % v)
+                self.writer = None
+
+    def done(self):
+        if self.writer:
+            writer, self.writer = self.writer, None
+            try:
+                writer.close()
+            except IOError as v:
+                ctx.log.error("Error writing to HAR file: %s" % v)
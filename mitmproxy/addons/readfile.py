@@ -1,4 +1,5 @@
 import asyncio
+import concurrent.futures
 import os.path
 import sys
 import typing
@@ -27,6 +28,13 @@ class ReadFile:
             "readfile_filter", typing.Optional[str], None,
             "Read only matching flows."
         )
+        loader.add_option(
+            "readfile_workers", int, 1,
+            """
+            Number of processes decoding the flow file in parallel. 0 uses
+            one process per CPU. Not used with lazy_bodies.
+            """
+        )
 
     def configure(self, updated):
         if "readfile_filter" in updated:
@@ -41,7 +49,7 @@ class ReadFile:
 
     async def load_flows(self, fo: typing.IO[bytes]) -> int:
         cnt = 0
-        freader = io.FlowReader(fo)
+        freader = io.FlowReader(fo, ctx.options.lazy_bodies)
         try:
             for flow in freader.stream():
                 if self.filter and not self.filter(flow):
@@ -57,9 +65,36 @@ class ReadFile:
         else:
             return cnt
 
+    async def load_flows_parallel(self, path: str) -> int:
+        cnt = 0
+        freader = io.ParallelFlowReader(
+            path,
+            ctx.options.readfile_workers,
+            ctx.options.readfile_filter,
+        )
+        with concurrent.futures.ProcessPoolExecutor(freader.workers) as executor:
+            futures: typing.List[concurrent.futures.Future] = []
+            try:
+                futures = freader.submit(executor)
+                for fut in futures:
+                    for flow in await asyncio.wrap_future(fut):
+                        await ctx.master.load_flow(flow)
+                        cnt += 1
+            except exceptions.FlowReadException:
+                for fut in futures:
+                    fut.cancel()
+                if cnt:
+                    ctx.log.warn("Flow file corrupted - loaded %i flows." % cnt)
+                else:
+                    ctx.log.error("Flow file corrupted.")
+                raise
+        return cnt
+
     async def load_flows_from_path(self, path: str) -> int:
         path = os.path.expanduser(path)
         try:
+            if ctx.options.readfile_workers != 1 and not ctx.options.lazy_bodies:
+                return await self.load_flows_parallel(path)
             with open(path, "rb") as f:
                 return await self.load_flows(f)
         except IOError as e:
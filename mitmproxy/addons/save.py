@@ -1,4 +1,6 @@
 import os.path
+import queue
+import time
 import typing
 
 from mitmproxy import command
@@ -7,9 +9,237 @@ from mitmproxy import flowfilter
 from mitmproxy import io
 from mitmproxy import ctx
 from mitmproxy import flow
+from mitmproxy import websocket
+from mitmproxy.coretypes import basethread
+from mitmproxy.io import compressed
+from mitmproxy.utils import human
 import mitmproxy.types
 
 
+def snapshot(f: flow.Flow) -> typing.Union[dict, flow.Flow]:
+    """
+        The state of a flow, to be written while the flow itself may still
+        change. WebSocket flows with spilled messages are copied instead,
+        as the copy shares the spill file rather than loading the messages.
+    """
+    messages = getattr(f, "messages", None)
+    if isinstance(messages, websocket.WebSocketMessages) and messages.spilled:
+        c = f.copy()
+        c.id = f.id
+        return c
+    return f.get_state()
+
+
+class StreamWriter(basethread.BaseThread):
+    """
+        Writes flows to a FlowWriter on a background thread, so that slow
+        disks don't stall the event loop. Flows wait in a bounded queue and
+        are written in batches. After each batch, the file is flushed or
+        fsynced, depending on the sync policy.
+
+        Flows may be queued as get_state() data, which is serialized on the
+        writer thread. Queued flows must not change anymore, so live flows
+        should be added as snapshot().
+    """
+    batch_size = 100
+
+    def __init__(self, writer: io.FlowWriter, max_queue: int = 1000, overflow: str = "block", sync: str = "flush") -> None:
+        super().__init__("save stream writer", daemon=True)
+        self.writer = writer
+        self.queue: queue.Queue = queue.Queue(max_queue)
+        self.overflow = overflow
+        self.sync = sync
+        self.dropped = 0
+        """Number of flows dropped because the queue was full."""
+        self.error: typing.Optional[Exception] = None
+        """The error that stopped the writer, if any."""
+        self.start()
+
+    def add(self, f: typing.Union[dict, flow.Flow]) -> bool:
+        """
+            Queue a flow or its state to be written. Returns False if the queue is full
+            and the overflow policy is "drop".
+        """
+        if self.overflow == "drop":
+            try:
+                self.queue.put_nowait(f)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        else:
+            self.queue.put(f)
+        return True
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            for f in batch:
+                if f is None:
+                    self._close()
+                    return
+                if not self.error:
+                    try:
+                        if isinstance(f, dict):
+                            self.writer.add_state(f)
+                        else:
+                            self.writer.add(f)
+                    except Exception as e:
+                        self.error = e
+            if not self.error:
+                try:
+                    self._sync()
+                except Exception as e:
+                    self.error = e
+
+    def _files(self):
+        fo = self.writer.fo
+        if isinstance(fo, compressed.BlockWriter):
+            # Flushing a BlockWriter would finish the current block, so we
+            # only flush the underlying file.
+            fo = fo.fo
+        return [fo, self.writer.index] if self.writer.index else [fo]
+
+    def _sync(self):
+        if self.sync == "none":
+            return
+        for fo in self._files():
+            fo.flush()
+            if self.sync == "fsync":
+                os.fsync(fo.fileno())
+
+    def _close(self):
+        try:
+            self.writer.fo.close()
+            if self.writer.index:
+                self.writer.index.close()
+        except Exception as e:
+            self.error = self.error or e
+
+    def close(self) -> None:
+        """
+            Write all queued flows, close the files and wait for the writer
+            to finish.
+        """
+        self.queue.put(None)
+        self.join()
+
+
+class RotatingFlowWriter:
+    """
+        Writes flows to a series of files, starting a new file when the
+        current one has grown too large, too old or holds too many flows.
+        Flows are never split across files. If a retention size is given,
+        the oldest files are deleted when the files written so far exceed it.
+
+        File names are made from a template, which may contain strftime
+        placeholders and {n}, the number of the file. If it does not
+        contain {n}, .{n} is appended, so that files started within the
+        same strftime period do not overwrite each other. A template
+        starting with + appends to existing files.
+    """
+
+    def __init__(
+        self,
+        template: str,
+        open_writer: typing.Callable[[str], io.FlowWriter],
+        max_size: int = 0,
+        max_age: float = 0,
+        max_flows: int = 0,
+        retain_size: int = 0,
+    ) -> None:
+        self.template = template
+        self.open_writer = open_writer
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_flows = max_flows
+        self.retain_size = retain_size
+        self.n = 0
+        self.paths: typing.List[str] = []
+        self.writer: io.FlowWriter = None
+        self.opened = 0.0
+        self.flows = 0
+        self._open()
+
+    @property
+    def fo(self):
+        return self.writer.fo
+
+    @property
+    def index(self):
+        return self.writer.index
+
+    def path(self, n: int) -> str:
+        append = self.template.startswith("+")
+        template = self.template[1:] if append else self.template
+        if "{n}" not in template:
+            template += ".{n}"
+        path = time.strftime(template).replace("{n}", str(n))
+        return "+" + path if append else path
+
+    def _open(self):
+        path = self.path(self.n)
+        self.n += 1
+        self.writer = self.open_writer(path)
+        path = os.path.expanduser(path.lstrip("+"))
+        # Never list a file twice, or _expire() may delete the current one.
+        if path not in self.paths:
+            self.paths.append(path)
+        self.opened = time.time()
+        self.flows = 0
+
+    def _size(self) -> int:
+        fo = self.writer.fo
+        if isinstance(fo, compressed.BlockWriter):
+            return fo.fo.tell() + fo.size
+        return fo.tell()
+
+    def full(self) -> bool:
+        return bool(
+            (self.max_flows and self.flows >= self.max_flows) or
+            (self.max_age and time.time() - self.opened >= self.max_age) or
+            (self.max_size and self._size() >= self.max_size)
+        )
+
+    def rotate(self) -> None:
+        self.writer.fo.close()
+        if self.writer.index:
+            self.writer.index.close()
+        self._open()
+        if self.retain_size:
+            self._expire()
+
+    def _expire(self):
+        def size(path):
+            return sum(
+                os.path.getsize(p) for p in (path, io.index_path(path)) if os.path.exists(p)
+            )
+
+        sizes = [size(p) for p in self.paths]
+        while len(self.paths) > 1 and sum(sizes) > self.retain_size:
+            path = self.paths.pop(0)
+            sizes.pop(0)
+            for p in (path, io.index_path(path)):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def add(self, f: flow.Flow) -> None:
+        if self.flows and self.full():
+            self.rotate()
+        self.writer.add(f)
+        self.flows += 1
+
+    def add_state(self, state: dict) -> None:
+        if self.flows and self.full():
+            self.rotate()
+        self.writer.add_state(state)
+        self.flows += 1
+
+
 class Save:
     def __init__(self):
         self.stream = None
@@ -25,22 +255,130 @@ class Save:
             "save_stream_filter", typing.Optional[str], None,
             "Filter which flows are written to file."
         )
+        loader.add_option(
+            "save_stream_index", bool, False,
+            """
+            Maintain an index of the flows written to a file, so that single
+            flows can be read without parsing the whole file. The index is
+            stored next to the file, with an .idx suffix.
+            """
+        )
+        loader.add_option(
+            "save_stream_queue", int, 1000,
+            """
+            Maximum number of flows waiting to be written to the stream file.
+            Flows are written on a background thread. 0 means unlimited.
+            """
+        )
+        loader.add_option(
+            "save_stream_overflow", str, "block",
+            """
+            What to do with a flow when the stream file queue is full: block
+            the event loop until there is room, or drop the flow.
+            """,
+            choices=["block", "drop"]
+        )
+        loader.add_option(
+            "save_stream_sync", str, "flush",
+            """
+            When to push flows written to the stream file to disk: leave it
+            to the operating system, flush after each batch of flows, or
+            flush and fsync after each batch.
+            """,
+            choices=["none", "flush", "fsync"]
+        )
+        loader.add_option(
+            "save_stream_compress", bool, False,
+            """
+            Compress the flows written to a file. When appending to an
+            existing file, the file's format is kept.
+            """
+        )
+        loader.add_option(
+            "save_stream_rotate_size", typing.Optional[str], None,
+            """
+            Start a new stream file when the current one reaches this size.
+            Understands k/m/g suffixes, i.e. 100m for 100 megabytes. When
+            rotating, the stream file name is a template, which may contain
+            strftime placeholders and {n}, the number of the file. If it
+            does not contain {n}, .{n} is appended.
+            """
+        )
+        loader.add_option(
+            "save_stream_rotate_age", int, 0,
+            "Start a new stream file when the current one is older than this many seconds."
+        )
+        loader.add_option(
+            "save_stream_rotate_flows", int, 0,
+            "Start a new stream file when the current one holds this many flows."
+        )
+        loader.add_option(
+            "save_stream_retain_size", typing.Optional[str], None,
+            """
+            Delete the oldest rotated stream files when all files written
+            in this session exceed this size. Understands k/m/g suffixes.
+            """
+        )
 
-    def open_file(self, path):
+    def open_file(self, path, compress=False):
         if path.startswith("+"):
-            path = path[1:]
-            mode = "ab"
+            path = os.path.expanduser(path[1:])
+            f = open(path, "ab")
         else:
-            mode = "wb"
-        path = os.path.expanduser(path)
-        return open(path, mode)
+            path = os.path.expanduser(path)
+            # Flows read lazily from this file may still use it.
+            f = io.create(path)
+        if f.tell():
+            with open(path, "rb") as existing:
+                compress = compressed.is_compressed(existing)
+        if compress:
+            f = compressed.BlockWriter(f)
+        return f
+
+    def open_index(self, path):
+        if path.startswith("+"):
+            return open(io.index_path(os.path.expanduser(path[1:])), "ab")
+        return open(io.index_path(os.path.expanduser(path)), "wb")
 
     def start_stream_to_path(self, path, flt):
+        compress = ctx.options.save_stream_compress
+        index = ctx.options.save_stream_index
+
+        def open_writer(path):
+            f = self.open_file(path, compress)
+            try:
+                idx = self.open_index(path) if index else None
+            except IOError:
+                f.close()
+                raise
+            return io.FlowWriter(f, idx)
+
+        rotate = (
+            ctx.options.save_stream_rotate_size or
+            ctx.options.save_stream_rotate_age or
+            ctx.options.save_stream_rotate_flows
+        )
         try:
-            f = self.open_file(path)
+            if rotate:
+                writer = RotatingFlowWriter(
+                    path,
+                    open_writer,
+                    human.parse_size(ctx.options.save_stream_rotate_size) or 0,
+                    ctx.options.save_stream_rotate_age,
+                    ctx.options.save_stream_rotate_flows,
+                    human.parse_size(ctx.options.save_stream_retain_size) or 0,
+                )
+            else:
+                writer = open_writer(path)
         except IOError as v:
             raise exceptions.OptionsError(str(v))
-        self.stream = io.FilteredFlowWriter(f, flt)
+        self.filt = flt
+        self.stream = StreamWriter(
+            writer,
+            ctx.options.save_stream_queue,
+            ctx.options.save_stream_overflow,
+            ctx.options.save_stream_sync,
+        )
         self.active_flows = set()
 
     def configure(self, updated):
@@ -54,7 +392,23 @@ class Save:
                     )
             else:
                 self.filt = None
-        if "save_stream_file" in updated or "save_stream_filter" in updated:
+        if "save_stream_queue" in updated and ctx.options.save_stream_queue < 0:
+            raise exceptions.OptionsError("save_stream_queue must not be negative.")
+        for option in ("save_stream_rotate_size", "save_stream_retain_size"):
+            if option in updated:
+                try:
+                    human.parse_size(getattr(ctx.options, option))
+                except ValueError:
+                    raise exceptions.OptionsError(
+                        "Invalid size specification for %s: %s" % (option, getattr(ctx.options, option))
+                    )
+        stream_options = {
+            "save_stream_file", "save_stream_filter", "save_stream_index", "save_stream_compress",
+            "save_stream_queue", "save_stream_overflow", "save_stream_sync",
+            "save_stream_rotate_size", "save_stream_rotate_age", "save_stream_rotate_flows",
+            "save_stream_retain_size",
+        }
+        if stream_options & set(updated):
             if self.stream:
                 self.done()
             if ctx.options.save_stream_file:
@@ -76,13 +430,40 @@ class Save:
         f.close()
         ctx.log.alert("Saved %s flows." % len(flows))
 
+    @command.command("save.index")
+    def index(self, path: mitmproxy.types.Path) -> None:
+        """
+            Build the index of an existing flow file, which allows reading
+            single flows without parsing the whole file.
+        """
+        p = os.path.expanduser(path)
+        try:
+            with open(p, "rb") as f:
+                entries = io.FlowReader(f).build_index()
+            with open(io.index_path(p), "wb") as f:
+                io.write_index(f, entries)
+        except IOError as v:
+            raise exceptions.CommandError(v) from v
+        except exceptions.FlowReadException as v:
+            raise exceptions.CommandError(v) from v
+        ctx.log.alert("Indexed %s flows." % len(entries))
+
     def tcp_start(self, flow):
         if self.stream:
             self.active_flows.add(flow)
 
+    def add(self, flow):
+        if self.stream.error:
+            self.done()
+            return
+        if self.filt and not flowfilter.match(self.filt, flow):
+            return
+        if not self.stream.add(snapshot(flow)) and self.stream.dropped == 1:
+            ctx.log.warn("Stream file queue is full, dropping flows.")
+
     def tcp_end(self, flow):
         if self.stream:
-            self.stream.add(flow)
+            self.add(flow)
             self.active_flows.discard(flow)
 
     def websocket_start(self, flow):
@@ -91,12 +472,12 @@ class Save:
 
     def websocket_end(self, flow):
         if self.stream:
-            self.stream.add(flow)
+            self.add(flow)
             self.active_flows.discard(flow)
 
     def response(self, flow):
         if self.stream:
-            self.stream.add(flow)
+            self.add(flow)
             self.active_flows.discard(flow)
 
     def request(self, flow):
@@ -105,8 +486,13 @@ class Save:
 
     def done(self):
         if self.stream:
+            stream, self.stream = self.stream, None
             for f in self.active_flows:
-                self.stream.add(f)
+                if not self.filt or flowfilter.match(self.filt, f):
+                    stream.queue.put(snapshot(f))
             self.active_flows = set([])
-            self.stream.fo.close()
-            self.stream = None
+            stream.close()
+            if stream.error:
+                ctx.log.error("Error writing to stream file: %s" % stream.error)
+            if stream.dropped:
+                ctx.log.warn("Stream file queue was full, dropped %s flows." % stream.dropped)
@@ -13,6 +13,8 @@ from mitmproxy import flow
 from mitmproxy import command
 from mitmproxy import eventsequence
 from mitmproxy import ctx
+from mitmproxy.script.concurrent import pool as concurrent_pool
+from mitmproxy.script.offload import pool as offload_pool
 import mitmproxy.types as mtypes
 
 
@@ -54,7 +56,7 @@ def script_error_handler(path, exc, msg="", tb=False):
     log_msg = "in script {}:{} {}".format(path, lineno, exception)
     if tb:
         etype, value, tback = sys.exc_info()
-        tback = addonmanager.cut_traceback(tback, "invoke_addon")
+        tback = addonmanager.cut_traceback(tback, *addonmanager.HANDLER_FRAMES)
         log_msg = log_msg + "\n" + "".join(traceback.format_exception(etype, value, tback))
     ctx.log.error(log_msg)
 
@@ -101,6 +103,7 @@ class Script:
             ns = load_script(self.fullpath)
             ctx.master.addons.register(ns)
             self.ns = ns
+        ctx.master.addons.invalidate()
         if self.ns:
             # We're already running, so we have to explicitly register and
             # configure the addon
@@ -141,10 +144,39 @@ class ScriptLoader:
             "scripts", typing.Sequence[str], [],
             "Execute a script."
         )
+        loader.add_option(
+            "concurrent_workers", int, concurrent_pool.max_workers,
+            "Maximum number of threads running @concurrent hooks."
+        )
+        loader.add_option(
+            "concurrent_queue", int, concurrent_pool.max_queue,
+            """
+            Maximum number of @concurrent hook calls waiting for a free
+            thread. 0 means unlimited.
+            """
+        )
+        loader.add_option(
+            "concurrent_overflow", str, concurrent_pool.overflow,
+            """
+            What to do with a @concurrent hook call when the queue is full:
+            hold the flow back until there is room, or kill the flow.
+            """,
+            choices=["block", "kill"]
+        )
+        loader.add_option(
+            "offload_workers", int, 0,
+            """
+            Number of worker processes running @offload hooks. 0 means one
+            per CPU core.
+            """
+        )
 
     def running(self):
         self.is_running = True
 
+    def done(self):
+        offload_pool.shutdown()
+
     @command.command("script.run")
     def script_run(self, flows: typing.Sequence[flow.Flow], path: mtypes.Path) -> None:
         """
@@ -168,7 +200,39 @@ class ScriptLoader:
                     for evt, arg in eventsequence.iterate(f):
                         ctx.master.addons.invoke_addon(mod, evt, arg)
 
+    @command.command("script.concurrent.stats")
+    def concurrent_stats(self) -> mtypes.Data:
+        """
+            Statistics of the thread pool running @concurrent hooks: workers,
+            busy workers, queued and completed calls, calls killed because
+            the queue was full, and the mean and maximum time calls waited
+            in the queue in milliseconds.
+        """
+        s = concurrent_pool.stats()
+        rows: typing.List[typing.List[str]] = [
+            ["workers", str(s["workers"])],
+            ["active", str(s["active"])],
+            ["queued", str(s["queued"])],
+            ["completed", str(s["completed"])],
+            ["killed", str(s["killed"])],
+            ["mean wait", "%.3f" % (s["avg_wait_time"] * 1000)],
+            ["max wait", "%.3f" % (s["max_wait_time"] * 1000)],
+        ]
+        return rows  # type: ignore
+
     def configure(self, updated):
+        if {"concurrent_workers", "concurrent_queue", "concurrent_overflow"} & set(updated):
+            if ctx.options.concurrent_workers < 1:
+                raise exceptions.OptionsError("concurrent_workers must be at least 1.")
+            concurrent_pool.configure(
+                ctx.options.concurrent_workers,
+                ctx.options.concurrent_queue,
+                ctx.options.concurrent_overflow,
+            )
+        if "offload_workers" in updated:
+            if ctx.options.offload_workers < 0:
+                raise exceptions.OptionsError("offload_workers must not be negative.")
+            offload_pool.configure(ctx.options.offload_workers)
         if "scripts" in updated:
             for s in ctx.options.scripts:
                 if ctx.options.scripts.count(s) > 1:
@@ -201,6 +265,7 @@ class ScriptLoader:
                     newscripts.append(sc)
 
             self.addons = ordered
+            ctx.master.addons.invalidate()
 
             for s in newscripts:
                 ctx.master.addons.register(s)
@@ -9,7 +9,10 @@ The View:
   removed from the store.
 """
 import collections
+import itertools
+import os.path
 import typing
+import uuid
 
 import blinker
 import sortedcontainers
@@ -21,7 +24,9 @@ from mitmproxy import command
 from mitmproxy import connections
 from mitmproxy import ctx
 from mitmproxy import io
-from mitmproxy import http  # noqa
+from mitmproxy import http
+from mitmproxy import websocket
+from mitmproxy.utils import human
 
 # The underlying sorted list implementation expects the sort key to be stable
 # for the lifetime of the object. However, if we sort by size, for instance,
@@ -82,14 +87,21 @@ class OrderRequestURL(_OrderKey):
         return f.request.url
 
 
+def body_size(f: mitmproxy.flow.Flow) -> int:
+    """
+        The total size of the request and response bodies of an HTTP flow.
+    """
+    s = 0
+    if isinstance(f, http.HTTPFlow):
+        s += f.request.raw_content_size
+        if f.response:
+            s += f.response.raw_content_size
+    return s
+
+
 class OrderKeySize(_OrderKey):
     def generate(self, f: http.HTTPFlow) -> int:
-        s = 0
-        if f.request.raw_content:
-            s += len(f.request.raw_content)
-        if f.response and f.response.raw_content:
-            s += len(f.response.raw_content)
-        return s
+        return body_size(f)
 
 
 matchall = flowfilter.parse(".")
@@ -103,6 +115,130 @@ orders = [
 ]
 
 
+class FlowIndex:
+    """
+        Secondary indexes of the flows in a store by the features that
+        common filter predicates test: flow type, method, domain, response
+        code, content type and the marked flag. A filter is narrowed down
+        to candidate flows through the indexes, regular expressions are
+        only matched against the distinct indexed values. The candidates
+        still have to be checked against the full filter.
+
+        Features are indexed when a flow is added or updated, so flows
+        must be updated after they are marked or unmarked, as the
+        flow.mark commands do.
+    """
+    def __init__(self) -> None:
+        self._seq = itertools.count()
+        self.order: typing.Dict[str, int] = {}
+        self.features: typing.Dict[str, typing.Set[typing.Tuple[str, typing.Any]]] = {}
+        self.index: typing.Dict[str, typing.Dict[typing.Any, typing.Set[str]]] = collections.defaultdict(dict)
+
+    @staticmethod
+    def _features(f: mitmproxy.flow.Flow) -> typing.Set[typing.Tuple[str, typing.Any]]:
+        features: typing.Set[typing.Tuple[str, typing.Any]] = {("type", f.type)}
+        if f.marked:
+            features.add(("marked", True))
+        hf = f.handshake_flow if isinstance(f, websocket.WebSocketFlow) else f
+        if isinstance(hf, http.HTTPFlow) and hf.request:
+            features.add(("host", hf.request.host))
+            features.add(("host", hf.request.pretty_host))
+        if isinstance(f, http.HTTPFlow):
+            features.add(("method", f.request.data.method))  # type: ignore
+            for m in (f.request, f.response):
+                if m:
+                    for name, value in m.headers.fields:
+                        if name.lower() == b"content-type":
+                            features.add(("content_type", value))
+            if f.response:
+                features.add(("code", f.response.status_code))
+        return features
+
+    def add(self, f: mitmproxy.flow.Flow) -> None:
+        self.order[f.id] = next(self._seq)
+        self.update(f)
+
+    def update(self, f: mitmproxy.flow.Flow) -> None:
+        old = self.features.get(f.id, set())
+        new = self._features(f)
+        if old == new:
+            return
+        for kind, value in old - new:
+            ids = self.index[kind][value]
+            ids.discard(f.id)
+            if not ids:
+                del self.index[kind][value]
+        for kind, value in new - old:
+            self.index[kind].setdefault(value, set()).add(f.id)
+        self.features[f.id] = new
+
+    def remove(self, f: mitmproxy.flow.Flow) -> None:
+        for kind, value in self.features.pop(f.id, ()):
+            ids = self.index[kind][value]
+            ids.discard(f.id)
+            if not ids:
+                del self.index[kind][value]
+        self.order.pop(f.id, None)
+
+    def clear(self) -> None:
+        self.order.clear()
+        self.features.clear()
+        self.index.clear()
+
+    def _search(self, kind: str, rex) -> typing.Set[str]:
+        ids: typing.Set[str] = set()
+        for value, matching in self.index[kind].items():
+            if rex.search(value):
+                ids |= matching
+        return ids
+
+    def lookup(self, flt: flowfilter.TFilter) -> typing.Optional[typing.Set[str]]:
+        """
+            The IDs of the flows that may match a filter, or None if the
+            filter cannot be narrowed down through the indexes.
+        """
+        if isinstance(flt, flowfilter.FAnd):
+            sets = [s for s in map(self.lookup, flt.lst) if s is not None]
+            if not sets:
+                return None
+            sets.sort(key=len)
+            return sets[0].intersection(*sets[1:])
+        if isinstance(flt, flowfilter.FOr):
+            ids: typing.Set[str] = set()
+            for i in flt.lst:
+                s = self.lookup(i)
+                if s is None:
+                    return None
+                ids |= s
+            return ids
+        if isinstance(flt, flowfilter.FHTTP):
+            return self.index["type"].get("http", set())
+        if isinstance(flt, flowfilter.FWebSocket):
+            return self.index["type"].get("websocket", set())
+        if isinstance(flt, flowfilter.FTCP):
+            return self.index["type"].get("tcp", set())
+        if isinstance(flt, flowfilter.FMarked):
+            return self.index["marked"].get(True, set())
+        if isinstance(flt, flowfilter.FCode):
+            return self.index["code"].get(flt.num, set())
+        if isinstance(flt, flowfilter.FMethod):
+            return self._search("method", flt.re)
+        if isinstance(flt, flowfilter.FDomain):
+            return self._search("host", flt.re)
+        if isinstance(flt, flowfilter.FContentType):
+            return self._search("content_type", flt.re)
+        return None
+
+    def candidates(self, flt: flowfilter.TFilter, store: typing.Mapping[str, mitmproxy.flow.Flow]) -> typing.Iterable:
+        """
+            The flows of the store that may match a filter, in store order.
+        """
+        ids = self.lookup(flt)
+        if ids is None:
+            return store.values()
+        return [store[i] for i in sorted(ids, key=self.order.__getitem__)]
+
+
 class View(collections.Sequence):
     def __init__(self):
         super().__init__()
@@ -120,6 +256,16 @@ class View(collections.Sequence):
         self.order_reversed = False
         self.focus_follow = False
 
+        # Retention limits, 0 means unlimited.
+        self.max_flows = 0
+        self.max_size = 0
+        self.keep_filter: typing.Optional[flowfilter.TFilter] = None
+        self.evict_writer: typing.Optional[io.FlowWriter] = None
+        # Body sizes of the flows in the store, by flow ID.
+        self._sizes: typing.Dict[str, int] = {}
+        self._size = 0
+        self._index = FlowIndex()
+
         self._view = sortedcontainers.SortedListWithKey(
             key = self.order_key
         )
@@ -162,6 +308,33 @@ class View(collections.Sequence):
             "console_focus_follow", bool, False,
             "Focus follows new flows."
         )
+        loader.add_option(
+            "view_max_flows", int, 0,
+            """
+            Maximum number of flows kept in the view store. Once it is
+            exceeded, the oldest flows are evicted. 0 means unlimited.
+            """
+        )
+        loader.add_option(
+            "view_max_size", typing.Optional[str], None,
+            """
+            Maximum total size of the request and response bodies of the
+            flows kept in the view store. Once it is exceeded, the oldest
+            flows are evicted. Understands k/m/g suffixes, i.e. 100m for 100
+            megabytes.
+            """
+        )
+        loader.add_option(
+            "view_keep_filter", typing.Optional[str], None,
+            """
+            Never evict flows matching this filter from the view store.
+            Marked and intercepted flows are never evicted either.
+            """
+        )
+        loader.add_option(
+            "view_evict_file", typing.Optional[str], None,
+            "Append flows evicted from the view store to this file."
+        )
 
     def store_count(self):
         return len(self._store)
@@ -212,10 +385,11 @@ class View(collections.Sequence):
 
     def _refilter(self):
         self._view.clear()
-        for i in self._store.values():
-            if self.show_marked and not i.marked:
-                continue
-            if self.filter(i):
+        flt = self.filter
+        if self.show_marked:
+            flt = flowfilter.FAnd([flowfilter.FMarked(), flt])
+        for i in self._index.candidates(flt, self._store):
+            if flt(i):
                 self._base_add(i)
         self.sig_view_refresh.send(self)
 
@@ -279,6 +453,9 @@ class View(collections.Sequence):
         """
         self._store.clear()
         self._view.clear()
+        self._sizes.clear()
+        self._size = 0
+        self._index.clear()
         self.sig_view_refresh.send(self)
         self.sig_store_refresh.send(self)
 
@@ -289,6 +466,8 @@ class View(collections.Sequence):
         for flow in self._store.copy().values():
             if not flow.marked:
                 self._store.pop(flow.id)
+                self._size -= self._sizes.pop(flow.id, 0)
+                self._index.remove(flow)
 
         self._refilter()
         self.sig_store_refresh.send(self)
@@ -302,11 +481,14 @@ class View(collections.Sequence):
         for f in flows:
             if f.id not in self._store:
                 self._store[f.id] = f
+                self._resize(f)
+                self._index.add(f)
                 if self.filter(f):
                     self._base_add(f)
                     if self.focus_follow:
                         self.focus.flow = f
                     self.sig_view_add.send(self, flow=f)
+        self._evict()
 
     def get_by_id(self, flow_id: str) -> typing.Optional[mitmproxy.flow.Flow]:
         """
@@ -361,11 +543,11 @@ class View(collections.Sequence):
         """
         try:
             with open(path, "rb") as f:
-                for i in io.FlowReader(f).stream():
-                    # Do this to get a new ID, so we can load the same file N times and
-                    # get new flows each time. It would be more efficient to just have a
-                    # .newid() method or something.
-                    self.add([i.copy()])
+                for i in io.FlowReader(f, ctx.options.lazy_bodies).stream():
+                    # Assign a new ID, so we can load the same file N times and
+                    # get new flows each time.
+                    i.id = str(uuid.uuid4())
+                    self.add([i])
         except IOError as e:
             ctx.log.error(e.strerror)
         except exceptions.FlowReadException as e:
@@ -409,17 +591,60 @@ class View(collections.Sequence):
             if f.id in self._store:
                 if f.killable:
                     f.kill()
-                if f in self._view:
-                    # We manually pass the index here because multiple flows may have the same
-                    # sorting key, and we cannot reconstruct the index from that.
-                    idx = self._view.index(f)
-                    self._view.remove(f)
-                    self.sig_view_remove.send(self, flow=f, index=idx)
-                del self._store[f.id]
-                self.sig_store_remove.send(self, flow=f)
+                self._remove(f)
         if len(flows) > 1:
             ctx.log.alert("Removed %s flows" % len(flows))
 
+    def _remove(self, f: mitmproxy.flow.Flow) -> None:
+        if f in self._view:
+            # We manually pass the index here because multiple flows may have the same
+            # sorting key, and we cannot reconstruct the index from that.
+            idx = self._view.index(f)
+            self._view.remove(f)
+            self.sig_view_remove.send(self, flow=f, index=idx)
+        del self._store[f.id]
+        self._size -= self._sizes.pop(f.id, 0)
+        self._index.remove(f)
+        self.sig_store_remove.send(self, flow=f)
+
+    def _resize(self, f: mitmproxy.flow.Flow) -> None:
+        size = body_size(f)
+        self._size += size - self._sizes.get(f.id, 0)
+        self._sizes[f.id] = size
+
+    def _keep(self, f: mitmproxy.flow.Flow) -> bool:
+        return f.marked or f.intercepted or bool(self.keep_filter and self.keep_filter(f))
+
+    def _evict(self) -> None:
+        """
+            Evict the oldest flows from the store until it is within the
+            retention limits again. Flows that should be kept are skipped.
+        """
+        count, size = len(self._store), self._size
+
+        def over():
+            return (self.max_flows and count > self.max_flows) or (self.max_size and size > self.max_size)
+
+        if not over():
+            return
+        evicted = []
+        for f in self._store.values():
+            if not self._keep(f):
+                evicted.append(f)
+                count -= 1
+                size -= self._sizes.get(f.id, 0)
+                if not over():
+                    break
+        if self.evict_writer:
+            try:
+                for f in evicted:
+                    self.evict_writer.add(f)
+                self.evict_writer.fo.flush()
+            except IOError as e:
+                ctx.log.error("Error writing evicted flows: %s" % e)
+        for f in evicted:
+            self._remove(f)
+
     @command.command("view.resolve")
     def resolve(self, spec: str) -> typing.Sequence[mitmproxy.flow.Flow]:
         """
@@ -434,14 +659,14 @@ class View(collections.Sequence):
         elif spec == "@hidden":
             return [i for i in self._store.values() if i not in self._view]
         elif spec == "@marked":
-            return [i for i in self._store.values() if i.marked]
+            return [i for i in self._index.candidates(flowfilter.FMarked(), self._store) if i.marked]
         elif spec == "@unmarked":
             return [i for i in self._store.values() if not i.marked]
         else:
             filt = flowfilter.parse(spec)
             if not filt:
                 raise exceptions.CommandError("Invalid flow filter: %s" % spec)
-            return [i for i in self._store.values() if filt(i)]
+            return [i for i in self._index.candidates(filt, self._store) if filt(i)]
 
     @command.command("view.create")
     def create(self, method: str, url: str) -> None:
@@ -477,6 +702,40 @@ class View(collections.Sequence):
             self.set_reversed(ctx.options.view_order_reversed)
         if "console_focus_follow" in updated:
             self.focus_follow = ctx.options.console_focus_follow
+        if "view_keep_filter" in updated:
+            self.keep_filter = None
+            if ctx.options.view_keep_filter:
+                self.keep_filter = flowfilter.parse(ctx.options.view_keep_filter)
+                if not self.keep_filter:
+                    raise exceptions.OptionsError(
+                        "Invalid keep filter: %s" % ctx.options.view_keep_filter
+                    )
+        if "view_max_size" in updated:
+            try:
+                self.max_size = human.parse_size(ctx.options.view_max_size) or 0
+            except ValueError:
+                raise exceptions.OptionsError(
+                    "Invalid size specification for view_max_size: %s" % ctx.options.view_max_size
+                )
+        if "view_max_flows" in updated:
+            if ctx.options.view_max_flows < 0:
+                raise exceptions.OptionsError("view_max_flows must not be negative.")
+            self.max_flows = ctx.options.view_max_flows
+        if "view_evict_file" in updated:
+            self.done()
+            if ctx.options.view_evict_file:
+                try:
+                    f = open(os.path.expanduser(ctx.options.view_evict_file), "ab")
+                except IOError as e:
+                    raise exceptions.OptionsError(str(e))
+                self.evict_writer = io.FlowWriter(f)
+        if {"view_max_flows", "view_max_size", "view_keep_filter"} & set(updated):
+            self._evict()
+
+    def done(self):
+        if self.evict_writer:
+            self.evict_writer.fo.close()
+            self.evict_writer = None
 
     def request(self, f):
         self.add([f])
@@ -502,6 +761,8 @@ class View(collections.Sequence):
         """
         for f in flows:
             if f.id in self._store:
+                self._resize(f)
+                self._index.update(f)
                 if self.filter(f):
                     if f not in self._view:
                         self._base_add(f)
@@ -523,6 +784,7 @@ class View(collections.Sequence):
                     else:
                         self._view.remove(f)
                         self.sig_view_remove.send(self, flow=f, index=idx)
+        self._evict()
 
 
 class Focus:
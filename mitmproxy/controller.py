@@ -18,10 +18,15 @@ class Channel:
         Decorate a message with a reply attribute, and send it to the master.
         Then wait for a response.
 
+        If no addon handles the event, nor update for flows, the message is
+        acknowledged right away without a round trip to the master.
+
         Raises:
             exceptions.Kill: All connections should be closed immediately.
         """
         if not self.should_exit.is_set():
+            if not self.master.addons.handles(mtype, m):
+                return self._ack(m)
             m.reply = Reply(m)
             asyncio.run_coroutine_threadsafe(
                 self.master.addons.handle_lifecycle(mtype, m),
@@ -32,17 +37,79 @@ class Channel:
                 raise exceptions.Kill()
             return g
 
-    def tell(self, mtype, m):
+    def ask_all(self, mtypes, m):
+        """
+        Send consecutive events for the same message, as if ask() was
+        called for each of them in turn. The events that addons handle are
+        sent to the master in a single round trip, unless a handler takes
+        the reply, e.g. to intercept the flow.
+
+        Raises:
+            exceptions.Kill: All connections should be closed immediately.
+        """
+        if self.should_exit.is_set():
+            return None
+        mtypes = [mtype for mtype in mtypes if self.master.addons.handles(mtype, m)]
+        if not mtypes:
+            return self._ack(m)
+        if len(mtypes) == 1:
+            return self.ask(mtypes[0], m)
+
+        done = queue.Queue()
+        asyncio.run_coroutine_threadsafe(
+            self._handle_all(mtypes, m, done),
+            self.loop,
+        )
+        g, reply, remaining = done.get()
+        if reply:
+            # A handler has taken the reply, wait until it is committed.
+            g = reply.q.get()
+        if g == exceptions.Kill:
+            raise exceptions.Kill()
+        if remaining:
+            return self.ask_all(remaining, m)
+        return g
+
+    async def _handle_all(self, mtypes, m, done):
+        for i, mtype in enumerate(mtypes):
+            m.reply = Reply(m)
+            await self.master.addons.handle_lifecycle(mtype, m)
+            if m.reply.state != "committed":
+                done.put((None, m.reply, mtypes[i + 1:]))
+                return
+            g = m.reply.q.get_nowait()
+            if g == exceptions.Kill or i == len(mtypes) - 1:
+                done.put((g, None, []))
+                return
+
+    def _ack(self, m):
+        m.reply = Reply(m)
+        m.reply.take()
+        m.reply.ack()
+        m.reply.commit()
+        return m.reply.q.get_nowait()
+
+    def tell(self, mtype, m, prepare=None):
         """
         Decorate a message with a dummy reply attribute, send it to the master,
         then return immediately.
+
+        If given, prepare is called on the master's event loop right before
+        the message is handled. This allows changes to the message, such as
+        appending to flow.messages, to happen in order with event handling.
         """
         if not self.should_exit.is_set():
-            m.reply = DummyReply()
-            asyncio.run_coroutine_threadsafe(
-                self.master.addons.handle_lifecycle(mtype, m),
-                self.loop,
-            )
+            if prepare:
+                coro = self._prepare_and_handle(mtype, m, prepare)
+            else:
+                m.reply = DummyReply()
+                coro = self.master.addons.handle_lifecycle(mtype, m)
+            asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _prepare_and_handle(self, mtype, m, prepare):
+        prepare()
+        m.reply = DummyReply()
+        await self.master.addons.handle_lifecycle(mtype, m)
 
 
 NO_REPLY = object()  # special object we can distinguish from a valid "None" reply.
@@ -0,0 +1,33 @@
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class LazyBytes:
+
+    """
+        A byte string that stays in a buffer, e.g. an mmap of a flow file,
+        until it is loaded. HTTP messages hold their bodies as LazyBytes
+        when flows are read lazily, and load them on every access.
+    """
+
+    __slots__ = ("buf", "start", "end")
+
+    def __init__(self, buf, start: int, end: int) -> None:
+        self.buf = buf
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def load(self) -> bytes:
+        return self.buf[self.start:self.end]
+
+    def update_hash(self, h) -> None:
+        """
+            Feed the bytes to a hashlib object, one chunk at a time.
+        """
+        for i in range(self.start, self.end, HASH_CHUNK_SIZE):
+            h.update(self.buf[i:min(i + HASH_CHUNK_SIZE, self.end)])
+
+    def __repr__(self):
+        return "LazyBytes(%d bytes)" % len(self)
@@ -1,6 +1,7 @@
 from abc import ABCMeta, abstractmethod
 
 from collections.abc import MutableMapping
+from mitmproxy.coretypes import revision
 from mitmproxy.coretypes import serializable
 
 
@@ -156,7 +157,7 @@ class _MultiDict(MutableMapping, metaclass=ABCMeta):
             return super().items()
 
 
-class MultiDict(_MultiDict, serializable.Serializable):
+class MultiDict(revision.Revisioned, _MultiDict, serializable.Serializable):
     def __init__(self, fields=()):
         super().__init__()
         self.fields = tuple(
@@ -0,0 +1,52 @@
+import itertools
+import typing
+
+_next = itertools.count(1).__next__
+
+
+class Revisioned:
+
+    """
+        An object that is stamped with a new revision whenever an attribute
+        that is part of its state is assigned, so that changes can be
+        detected without comparing state.
+
+        Revisions are drawn from a single global counter: a new revision is
+        newer than every revision handed out before, including those of
+        the objects it replaces. In-place changes of mutable attribute
+        values are not tracked. The revision is kept in a slot, so that it
+        does not show up in the instance __dict__, and is not pickled, as
+        other processes have their own counter.
+    """
+
+    __slots__ = ("_revision",)
+
+    _revisioned: typing.Optional[typing.AbstractSet[str]] = None
+    """The attributes that are stamped when assigned, None for all."""
+
+    def __setattr__(self, name, value, _setattr=object.__setattr__):
+        _setattr(self, name, value)
+        if self._revisioned is None or name in self._revisioned:
+            _setattr(self, "_revision", _next())
+
+    def __getstate__(self):
+        return self.__dict__
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        stamp(self)
+
+
+def stamp(obj: Revisioned) -> None:
+    """
+        Give an object a new revision, e.g. after assigning attributes
+        with object.__setattr__.
+    """
+    object.__setattr__(obj, "_revision", _next())
+
+
+def revision(obj: Revisioned) -> int:
+    """
+        The revision of an object, 0 if it has never been stamped.
+    """
+    return getattr(obj, "_revision", 0)
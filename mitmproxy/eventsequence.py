@@ -55,11 +55,11 @@ def _iterate_http(f: http.HTTPFlow) -> TEventGenerator:
 
 def _iterate_websocket(f: websocket.WebSocketFlow) -> TEventGenerator:
     messages = f.messages
-    f.messages = []
+    f.messages = websocket.WebSocketMessages()
     f.reply = controller.DummyReply()
     yield "websocket_start", f
-    while messages:
-        f.messages.append(messages.pop(0))
+    for message in messages:
+        f.messages.append(message)
         yield "websocket_message", f
     if f.error:
         yield "websocket_error", f
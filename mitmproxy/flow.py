@@ -6,6 +6,7 @@ from mitmproxy import connections
 from mitmproxy import controller, exceptions  # noqa
 from mitmproxy import stateobject
 from mitmproxy import version
+from mitmproxy.coretypes import revision
 
 
 class Error(stateobject.StateObject):
@@ -75,6 +76,8 @@ class Flow(stateobject.StateObject):
         self.error: typing.Optional[Error] = None
         self.intercepted: bool = False
         self._backup: typing.Optional[Flow] = None
+        self._backup_token: typing.Optional[typing.Tuple] = None
+        self._modified: typing.Optional[typing.Tuple] = None
         self.reply: typing.Optional[controller.Reply] = None
         self.marked: bool = False
         self.metadata: typing.Dict[str, typing.Any] = dict()
@@ -102,6 +105,7 @@ class Flow(stateobject.StateObject):
         state.pop("version")
         if "backup" in state:
             self._backup = state.pop("backup")
+            self._backup_token = None
         super().set_state(state)
 
     @classmethod
@@ -117,14 +121,47 @@ class Flow(stateobject.StateObject):
             f.reply = controller.DummyReply()
         return f
 
+    def __getstate__(self):
+        # State tokens refer to revisions of this process.
+        d = super().__getstate__().copy()
+        d["_backup_token"] = None
+        d["_modified"] = None
+        return d
+
+    def _state_parts(self) -> typing.List[typing.Any]:
+        """
+            The objects making up the state of this flow, which are stamped
+            with a new revision when changed. List and dict attributes of
+            plain values are changed in place, and are compared directly.
+        """
+        return [self, self.client_conn, self.server_conn, self.server_conn and self.server_conn.via, self.error]
+
+    def _state_token(self) -> typing.Tuple:
+        """
+            A value that changes whenever the state of this flow changes.
+        """
+        parts = [p for p in self._state_parts() if p is not None]
+        return (
+            max(revision.revision(p) for p in parts),
+            # Metadata or TLS extensions may have been changed in place.
+            [p.container_state() for p in parts if isinstance(p, stateobject.StateObject)],
+        )
+
     def modified(self):
         """
             Has this Flow been modified?
         """
-        if self._backup:
-            return self._backup != self.get_state()
-        else:
+        if not self._backup:
             return False
+        token = self._state_token()
+        if self._backup_token is not None:
+            return token != self._backup_token
+        # The backup was loaded with the flow, so its token is not known.
+        if self._modified and self._modified[0] == token:
+            return self._modified[1]
+        modified = self._backup != self.get_state()
+        self._modified = (token, modified)
+        return modified
 
     def backup(self, force=False):
         """
@@ -133,6 +170,7 @@ class Flow(stateobject.StateObject):
         """
         if not self._backup:
             self._backup = self.get_state()
+            self._backup_token = self._state_token()
 
     def revert(self):
         """
@@ -141,6 +179,7 @@ class Flow(stateobject.StateObject):
         if self._backup:
             self.set_state(self._backup)
             self._backup = None
+            self._backup_token = None
 
     @property
     def killable(self):
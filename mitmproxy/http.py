@@ -17,6 +17,8 @@ class HTTPRequest(http.Request):
     # This is a very thin wrapper on top of :py:class:`mitmproxy.net.http.Request` and
     # may be removed in the future.
 
+    _revisioned = frozenset({"data", "is_replay"})
+
     def __init__(
             self,
             first_line_format,
@@ -92,6 +94,8 @@ class HTTPResponse(http.Response):
     # This is a very thin wrapper on top of :py:class:`mitmproxy.net.http.Response` and
     # may be removed in the future.
 
+    _revisioned = frozenset({"data", "is_replay"})
+
     def __init__(
             self,
             http_version,
@@ -181,6 +185,13 @@ class HTTPFlow(flow.Flow):
         s += ">"
         return s.format(flow=self)
 
+    def _state_parts(self):
+        parts = super()._state_parts()
+        for m in (self.request, self.response):
+            if m:
+                parts.extend((m, m.data, m.data.headers))
+        return parts
+
     def copy(self):
         f = super().copy()
         if self.request:
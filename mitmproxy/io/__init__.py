@@ -1,7 +1,11 @@
 
 from .io import FlowWriter, FlowReader, FilteredFlowWriter, read_flows_from_paths
+from .io import create, index_path, read_index, write_index
+from .parallel import ParallelFlowReader
 
 
 __all__ = [
-    "FlowWriter", "FlowReader", "FilteredFlowWriter", "read_flows_from_paths"
+    "FlowWriter", "FlowReader", "FilteredFlowWriter", "read_flows_from_paths",
+    "create", "index_path", "read_index", "write_index",
+    "ParallelFlowReader",
 ]
@@ -0,0 +1,159 @@
+"""
+Compressed flow files.
+
+A compressed flow file starts with a magic string, followed by zlib blocks
+stored as tnetstring byte strings. Each block holds one or more complete
+flows and can be decompressed on its own, so that readers can seek to a
+block using the file index and blocks can be decoded in parallel.
+"""
+import typing
+import zlib
+
+from mitmproxy.io import tnetstring
+
+MAGIC = b"mitmz\n"
+"""Flow files always start with a digit, so this cannot be a flow file."""
+
+BLOCK_SIZE = 256 * 1024
+"""Uncompressed size after which a block is finished."""
+
+
+def is_compressed(fo: typing.BinaryIO) -> bool:
+    """
+    Check whether a file is a compressed flow file, without consuming
+    anything from it.
+    """
+    peek = getattr(fo, "peek", None)
+    if peek:
+        head = peek(len(MAGIC))[:len(MAGIC)]
+        if len(head) == len(MAGIC) or not fo.seekable():
+            return head == MAGIC
+    pos = fo.tell()
+    head = fo.read(len(MAGIC))
+    fo.seek(pos)
+    return head == MAGIC
+
+
+class BlockWriter:
+    """
+    A write-only file object that compresses everything written to it into
+    zlib blocks. Blocks are only finished at record boundaries, which the
+    caller marks with end_record().
+    """
+
+    def __init__(self, fo: typing.BinaryIO, block_size: int = BLOCK_SIZE, level: int = 6) -> None:
+        self.fo = fo
+        self.block_size = block_size
+        self.level = level
+        self.buf: typing.List[bytes] = []
+        self.size = 0
+        """Uncompressed size of the current block."""
+        if fo.tell() == 0:
+            fo.write(MAGIC)
+
+    def write(self, data: bytes) -> int:
+        self.buf.append(data)
+        self.size += len(data)
+        return len(data)
+
+    def tell(self) -> typing.Tuple[int, int]:
+        """
+        The position of the next record: the file offset of its block and
+        its offset in the uncompressed block.
+        """
+        return self.fo.tell(), self.size
+
+    def end_record(self) -> None:
+        if self.size >= self.block_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buf:
+            tnetstring.dump(zlib.compress(b"".join(self.buf), self.level), self.fo)
+            self.buf = []
+            self.size = 0
+        self.fo.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.fo.close()
+
+
+class BlockReader:
+    """
+    A read-only file object returning the uncompressed contents of a
+    compressed flow file. The magic string must already be consumed.
+    """
+
+    def __init__(self, fo: typing.BinaryIO) -> None:
+        self.fo = fo
+        self.buf = b""
+        self.pos = 0
+        self.block_start: typing.Optional[int] = None
+        self.next_block_start: typing.Optional[int] = None
+        try:
+            self.next_block_start = fo.tell()
+        except OSError:
+            # We can't seek in pipes, so there's no need to know positions.
+            pass
+
+    def _next_block(self) -> bool:
+        try:
+            block = tnetstring.load(self.fo)
+        except ValueError as e:
+            if str(e) == "not a tnetstring: empty file":
+                return False
+            raise
+        if not isinstance(block, bytes):
+            raise ValueError("invalid compressed block")
+        try:
+            self.buf = zlib.decompress(block)
+        except zlib.error as e:
+            raise ValueError("invalid compressed block: {}".format(e))
+        self.pos = 0
+        self.block_start = self.next_block_start
+        if self.block_start is not None:
+            self.next_block_start = self.fo.tell()
+        return True
+
+    def read(self, n: int = -1) -> bytes:
+        chunks = []
+        while n != 0:
+            if self.pos >= len(self.buf) and not self._next_block():
+                break
+            end = len(self.buf) if n < 0 else min(len(self.buf), self.pos + n)
+            chunks.append(self.buf[self.pos:end])
+            n -= end - self.pos
+            self.pos = end
+        return b"".join(chunks)
+
+    def peek(self, n: int = 1) -> bytes:
+        """
+        Return buffered data without consuming it. Like the peek() of
+        buffered files, this may return less than n bytes.
+        """
+        if self.pos >= len(self.buf):
+            self._next_block()
+        return self.buf[self.pos:self.pos + n]
+
+    def tell(self) -> typing.Tuple[int, int]:
+        """
+        The current position: the file offset of the current block and the
+        offset in the uncompressed block.
+        """
+        if self.pos >= len(self.buf):
+            return self.next_block_start, 0
+        return self.block_start, self.pos
+
+    def seek(self, block_start: int, offset: int = 0) -> None:
+        """
+        Seek to an offset in the block at the given file offset.
+        """
+        self.fo.seek(block_start)
+        self.buf = b""
+        self.pos = 0
+        self.next_block_start = block_start
+        if offset:
+            if not self._next_block():
+                raise ValueError("invalid compressed block offset")
+            self.pos = offset
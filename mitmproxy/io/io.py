@@ -1,14 +1,21 @@
+import mmap
 import os
-from typing import Type, Iterable, Dict, Union, Any, cast  # noqa
+import stat
+import tempfile
+import weakref
+from typing import Type, Iterable, Dict, List, Optional, Tuple, Union, Any, BinaryIO, cast  # noqa
 
 from mitmproxy import exceptions
 from mitmproxy import flow
 from mitmproxy import flowfilter
 from mitmproxy import http
 from mitmproxy import tcp
+from mitmproxy import version
 from mitmproxy import websocket
+from mitmproxy.coretypes import lazybytes
 
 from mitmproxy.io import compat
+from mitmproxy.io import compressed
 from mitmproxy.io import tnetstring
 
 FLOW_TYPES: Dict[str, Type[flow.Flow]] = dict(
@@ -17,54 +24,314 @@ FLOW_TYPES: Dict[str, Type[flow.Flow]] = dict(
     tcp=tcp.TCPFlow,
 )
 
+LAZY_BODY_SIZE = 4096
+"""Minimum size of message bodies that are read lazily."""
+
+_mapped: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+"""Live mmaps of lazily read flow files, by (device, inode, id)."""
+
+
+def create(path: str) -> BinaryIO:
+    """
+        Open a file for writing, truncating it. If lazily read flows may
+        still refer to a memory mapping of the file, it is replaced by a new
+        file instead: truncating a mapped file makes the next access to the
+        mapping crash the process with SIGBUS. The mapping keeps the
+        contents of the old file available.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return open(path, "wb")
+    if not any(k[:2] == (st.st_dev, st.st_ino) for k in list(_mapped.keys())):
+        return open(path, "wb")
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".mitmproxy-")
+    try:
+        os.chmod(tmp, stat.S_IMODE(st.st_mode))
+        os.replace(tmp, path)
+    except OSError:
+        os.close(fd)
+        os.unlink(tmp)
+        raise
+    return open(fd, "wb")
+
+
+def index_path(path: str) -> str:
+    """
+        The path of the index file of a flow file.
+    """
+    return path + ".idx"
+
+
+def index_entry(f: flow.Flow, offset: Union[int, Tuple[int, int]]) -> Dict[str, Any]:
+    """
+        The index entry of a flow stored at the given offset of a flow file.
+        In compressed files, the offset is a (file offset of the block,
+        offset in the uncompressed block) tuple.
+    """
+    if isinstance(f, http.HTTPFlow):
+        timestamp = f.request.timestamp_start
+        host = f.request.host
+    else:
+        timestamp = f.client_conn.timestamp_start
+        host = f.server_conn.address[0] if f.server_conn.address else ""
+    return _index_entry(f.id, f.type, timestamp, host, offset)
+
+
+def state_index_entry(state: Dict[str, Any], offset: Union[int, Tuple[int, int]]) -> Dict[str, Any]:
+    """
+        The index entry of a flow stored at the given offset, made from the
+        flow's get_state() data.
+    """
+    if state["type"] == "http":
+        timestamp = state["request"]["timestamp_start"]
+        host = state["request"]["host"]
+        try:
+            host = host.decode("idna")
+        except UnicodeError:
+            host = host.decode("utf8", "surrogateescape")
+    else:
+        timestamp = state["client_conn"]["timestamp_start"]
+        address = state["server_conn"]["address"]
+        host = address[0] if address else ""
+    return _index_entry(state["id"], state["type"], timestamp, host, offset)
+
+
+def _index_entry(id, type, timestamp, host, offset) -> Dict[str, Any]:
+    offset_in_block = None
+    if isinstance(offset, tuple):
+        offset, offset_in_block = offset
+    entry = dict(
+        id=id,
+        offset=offset,
+        timestamp=timestamp,
+        host=host,
+        type=type,
+    )
+    if offset_in_block is not None:
+        entry["offset_in_block"] = offset_in_block
+    return entry
+
+
+def read_index(fo) -> List[Dict[str, Any]]:
+    """
+        Read all entries of an index file.
+    """
+    entries: List[Dict[str, Any]] = []
+    try:
+        while True:
+            entry = tnetstring.load(fo)
+            if not isinstance(entry, dict):
+                raise exceptions.FlowReadException("Invalid index format.")
+            entries.append(entry)
+    except ValueError as e:
+        if str(e) == "not a tnetstring: empty file":
+            return entries
+        raise exceptions.FlowReadException("Invalid index format.")
+
+
+def write_index(fo, entries: Iterable[Dict[str, Any]]) -> None:
+    """
+        Write index entries to an index file.
+    """
+    for e in entries:
+        tnetstring.dump(e, fo)
+
 
 class FlowWriter:
-    def __init__(self, fo):
+    """
+        Writes flows to a file. If an index file object is given, an index
+        entry is appended to it for each flow. Pass a compressed.BlockWriter
+        to write a compressed flow file.
+    """
+    def __init__(self, fo, index=None):
         self.fo = fo
+        self.index = index
 
     def add(self, flow):
-        d = flow.get_state()
-        tnetstring.dump(d, self.fo)
+        messages = getattr(flow, "messages", None)
+        if isinstance(messages, websocket.WebSocketMessages) and messages.spilled:
+            offset = self.fo.tell()
+            self._add_spilled(flow)
+            self._end_record(index_entry(flow, offset))
+        else:
+            self.add_state(flow.get_state())
+
+    def add_state(self, state: Dict[str, Any]) -> None:
+        """
+            Write a flow given as get_state() data.
+        """
+        offset = self.fo.tell()
+        tnetstring.dump(state, self.fo)
+        self._end_record(state_index_entry(state, offset))
+
+    def _end_record(self, entry: Dict[str, Any]) -> None:
+        if isinstance(self.fo, compressed.BlockWriter):
+            self.fo.end_record()
+        # Only index flows that have been written completely.
+        if self.index:
+            write_index(self.index, [entry])
+
+    def _add_spilled(self, flow):
+        """
+            Write a WebSocket flow whose older messages have been evicted to
+            disk. The spill file already holds the tnetstring-encoded message
+            states, so it is copied over instead of loading every message.
+        """
+        with flow.messages.spill_snapshot() as (_, spill_size):
+            d = flow.get_state()
+            recent = tnetstring.dumps(d.pop("messages"))
+            recent = recent[recent.index(b":") + 1:-1]
+            rest = tnetstring.dumps(d)
+            rest = rest[rest.index(b":") + 1:-1]
+            key = tnetstring.dumps("messages")
+            messages_length = spill_size + len(recent)
+            messages_header = b"%d:" % messages_length
+            length = len(rest) + len(key) + len(messages_header) + messages_length + 1
+
+            self.fo.write(b"%d:" % length)
+            self.fo.write(rest)
+            self.fo.write(key)
+            self.fo.write(messages_header)
+            flow.messages.write_spilled(self.fo)
+            self.fo.write(recent)
+            self.fo.write(b"]}")
+
+
+def _load_lazy(value: Any) -> Any:
+    """
+        Replace all LazyBytes in a flow state with their contents.
+    """
+    if isinstance(value, lazybytes.LazyBytes):
+        return value.load()
+    if isinstance(value, dict):
+        return {k: _load_lazy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_load_lazy(v) for v in value]
+    return value
 
 
 class FlowReader:
-    def __init__(self, fo):
+    """
+        Reads flows from a file. Compressed flow files are detected
+        automatically.
+
+        If lazy is set, the file is memory-mapped and large message bodies
+        are only read when they are accessed. The file must not be modified
+        while flows read from it are in use; create() replaces it instead of
+        truncating it. Compressed files and files that cannot be mapped,
+        such as pipes, are read eagerly.
+    """
+    def __init__(self, fo, lazy: bool = False) -> None:
+        self.mmap: Optional[mmap.mmap] = None
+        self.offset = 0
+        if compressed.is_compressed(fo):
+            fo.read(len(compressed.MAGIC))
+            fo = compressed.BlockReader(fo)
+        elif lazy:
+            try:
+                self.mmap = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+                self.offset = fo.tell()
+                st = os.fstat(fo.fileno())
+                _mapped[(st.st_dev, st.st_ino, id(self.mmap))] = self.mmap
+            except (OSError, ValueError):
+                # Not a regular file, or an empty one.
+                pass
         self.fo = fo
 
+    def _load(self) -> Any:
+        if self.mmap is None:
+            return tnetstring.load(self.fo)
+        loaded, self.offset = tnetstring.load_at(
+            self.mmap,
+            self.offset,
+            ("content", b"content"),
+            LAZY_BODY_SIZE,
+        )
+        if isinstance(loaded, dict):
+            # Backups are compared to the current state, and older formats
+            # are migrated, so those must not contain lazy bodies.
+            if loaded.get("version") != version.FLOW_FORMAT_VERSION:
+                loaded = _load_lazy(loaded)
+            elif "backup" in loaded:
+                loaded["backup"] = _load_lazy(loaded["backup"])
+        return loaded
+
+    def _tell(self) -> Union[int, Tuple[int, int]]:
+        if self.mmap is not None:
+            return self.offset
+        return self.fo.tell()
+
+    def _read(self) -> flow.Flow:
+        # FIXME: This cast hides a lack of dynamic type checking
+        loaded = cast(
+            Dict[Union[bytes, str], Any],
+            self._load(),
+        )
+        if not isinstance(loaded, dict):
+            raise exceptions.FlowReadException("Invalid data format.")
+        try:
+            mdata = compat.migrate_flow(loaded)
+        except ValueError as e:
+            raise exceptions.FlowReadException(str(e))
+        if mdata["type"] not in FLOW_TYPES:
+            raise exceptions.FlowReadException("Unknown flow type: {}".format(mdata["type"]))
+        return FLOW_TYPES[mdata["type"]].from_state(mdata)
+
     def stream(self) -> Iterable[flow.Flow]:
         """
             Yields Flow objects from the dump.
         """
         try:
             while True:
-                # FIXME: This cast hides a lack of dynamic type checking
-                loaded = cast(
-                    Dict[Union[bytes, str], Any],
-                    tnetstring.load(self.fo),
-                )
-                try:
-                    mdata = compat.migrate_flow(loaded)
-                except ValueError as e:
-                    raise exceptions.FlowReadException(str(e))
-                if mdata["type"] not in FLOW_TYPES:
-                    raise exceptions.FlowReadException("Unknown flow type: {}".format(mdata["type"]))
-                yield FLOW_TYPES[mdata["type"]].from_state(mdata)
+                yield self._read()
         except ValueError as e:
             if str(e) == "not a tnetstring: empty file":
                 return  # Error is due to EOF
             raise exceptions.FlowReadException("Invalid data format.")
 
+    def read_at(self, entry: Dict[str, Any]) -> flow.Flow:
+        """
+            Read the flow of an index entry. The file must be seekable.
+        """
+        try:
+            if isinstance(self.fo, compressed.BlockReader):
+                self.fo.seek(entry["offset"], entry.get("offset_in_block", 0))
+            elif self.mmap is not None:
+                self.offset = entry["offset"]
+            else:
+                self.fo.seek(entry["offset"])
+            f = self._read()
+        except ValueError:
+            raise exceptions.FlowReadException("Invalid data format.")
+        if f.id != entry["id"]:
+            raise exceptions.FlowReadException("Index does not match flow file.")
+        return f
 
-class FilteredFlowWriter:
-    def __init__(self, fo, flt):
-        self.fo = fo
+    def build_index(self) -> List[Dict[str, Any]]:
+        """
+            Read the whole dump and return an index entry for each flow.
+        """
+        entries = []
+        try:
+            while True:
+                offset = self._tell()
+                entries.append(index_entry(self._read(), offset))
+        except ValueError as e:
+            if str(e) == "not a tnetstring: empty file":
+                return entries
+            raise exceptions.FlowReadException("Invalid data format.")
+
+
+class FilteredFlowWriter(FlowWriter):
+    def __init__(self, fo, flt, index=None):
+        super().__init__(fo, index)
         self.flt = flt
 
     def add(self, f: flow.Flow):
         if self.flt and not flowfilter.match(self.flt, f):
             return
-        d = f.get_state()
-        tnetstring.dump(d, self.fo)
+        super().add(f)
 
 
 def read_flows_from_paths(paths):
@@ -0,0 +1,121 @@
+"""
+Parallel decoding of flow files.
+
+A flow file is split into chunks at record boundaries, i.e. between flows
+or between the blocks of a compressed file. The chunks are decoded, and
+optionally filtered, in a process pool. Worker processes return the
+decoded flows, which are yielded in their original order.
+"""
+import concurrent.futures
+import io
+import os
+import typing
+
+from mitmproxy import exceptions
+from mitmproxy import flow
+from mitmproxy import flowfilter
+from mitmproxy.io import compressed
+from mitmproxy.io import tnetstring
+from mitmproxy.io.io import FlowReader
+
+CHUNKS_PER_WORKER = 4
+"""Smaller chunks balance the load between workers better."""
+
+MIN_CHUNK_SIZE = 1024 * 1024
+
+
+def record_offsets(fo: typing.BinaryIO) -> typing.Iterator[int]:
+    """
+    Yield the file offsets of all top-level tnetstrings, starting at the
+    current position. Only the length prefixes are read.
+    """
+    while True:
+        offset = fo.tell()
+        try:
+            length = tnetstring._read_length(fo)
+        except ValueError as e:
+            if str(e) == "not a tnetstring: empty file":
+                return
+            raise exceptions.FlowReadException("Invalid data format.")
+        yield offset
+        fo.seek(length + 1, os.SEEK_CUR)
+
+
+def _decode(path: str, start: int, end: int, is_compressed: bool, flt: typing.Optional[str]) -> typing.List[flow.Flow]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        fo: typing.Any = io.BytesIO(f.read(end - start))
+    if is_compressed:
+        fo = compressed.BlockReader(fo)
+    flows = list(FlowReader(fo).stream())
+    if flt:
+        match = flowfilter.parse(flt)
+        flows = [f for f in flows if match(f)]
+    return flows
+
+
+class ParallelFlowReader:
+    """
+        Reads the flows of a flow file in a process pool. With workers set to
+        0, one worker per CPU is used.
+    """
+    def __init__(
+        self,
+        path: str,
+        workers: int = 0,
+        flt: typing.Optional[str] = None,
+        chunk_size: typing.Optional[int] = None,
+    ) -> None:
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.flt = flt
+        self.chunk_size = chunk_size
+
+    def chunks(self) -> typing.Tuple[bool, typing.List[typing.Tuple[int, int]]]:
+        """
+            Split the file at record boundaries. Returns whether the file is
+            compressed and the (start, end) file offsets of the chunks.
+        """
+        with open(self.path, "rb") as f:
+            is_compressed = compressed.is_compressed(f)
+            if is_compressed:
+                f.seek(len(compressed.MAGIC))
+            size = os.fstat(f.fileno()).st_size
+            chunk_size = self.chunk_size or max(
+                size // (self.workers * CHUNKS_PER_WORKER),
+                MIN_CHUNK_SIZE
+            )
+            chunks = []
+            start = f.tell()
+            for offset in record_offsets(f):
+                if offset - start >= chunk_size:
+                    chunks.append((start, offset))
+                    start = offset
+            end = f.tell()
+        if end > start:
+            chunks.append((start, end))
+        return is_compressed, chunks
+
+    def submit(self, executor: concurrent.futures.Executor) -> typing.List[concurrent.futures.Future]:
+        """
+            Submit all chunks to an executor. The results of the futures
+            are lists of flows, in the order of the chunks.
+        """
+        is_compressed, chunks = self.chunks()
+        return [
+            executor.submit(_decode, self.path, start, end, is_compressed, self.flt)
+            for start, end in chunks
+        ]
+
+    def stream(self) -> typing.Iterable[flow.Flow]:
+        """
+            Yields Flow objects from the dump.
+        """
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as executor:
+            futures = self.submit(executor)
+            try:
+                for fut in futures:
+                    yield from fut.result()
+            finally:
+                for fut in futures:
+                    fut.cancel()
@@ -22,6 +22,7 @@ This module gives you the following functions:
     :dumps:   dump an object as a tnetstring to a string
     :load:    load a tnetstring-encoded object from a file
     :loads:   load a tnetstring-encoded object from a string
+    :load_at: load a tnetstring-encoded object at an offset of a buffer
 
 Note that since parsing a tnetstring requires reading all the data into memory
 at once, there's no efficiency gain from using the file-based versions of these
@@ -41,9 +42,13 @@ all other strings are returned as plain bytes.
 """
 
 import collections
+import mmap
 import typing
 
+from mitmproxy.coretypes.lazybytes import LazyBytes
+
 TSerializable = typing.Union[None, str, bool, int, float, bytes, list, tuple, dict]
+Buffer = typing.Union[bytes, mmap.mmap]
 
 
 def dumps(value: TSerializable) -> bytes:
@@ -153,7 +158,9 @@ def loads(string: bytes) -> TSerializable:
     """
     This function parses a tnetstring into a python object.
     """
-    return pop(string)[0]
+    if not isinstance(string, bytes):
+        string = bytes(string)
+    return _parse(string, 0, len(string))[0]
 
 
 def load(file_handle: typing.BinaryIO) -> TSerializable:
@@ -163,8 +170,29 @@ def load(file_handle: typing.BinaryIO) -> TSerializable:
     python object.  The file must support the read() method, and this
     function promises not to read more data than necessary.
     """
-    #  Read the length prefix one char at a time.
-    #  Note that the netstring spec explicitly forbids padding zeros.
+    data_length = _read_length(file_handle)
+    data = file_handle.read(data_length + 1)
+    if len(data) != data_length + 1:
+        raise ValueError("not a tnetstring: invalid length prefix: {}".format(data_length))
+    return _parse_value(data[-1], data, 0, data_length)
+
+
+def _read_length(file_handle: typing.BinaryIO) -> int:
+    """
+    Read the length prefix of a tnetstring, including the colon.
+    """
+    #  Buffered files let us look at the length prefix without consuming
+    #  anything else. Note that the netstring spec explicitly forbids
+    #  padding zeros.
+    peek = getattr(file_handle, "peek", None)
+    if peek:
+        head = peek(11)[:11]
+        colon = head.find(b":")
+        if 0 < colon < 10 and head[:colon].isdigit():
+            file_handle.read(colon + 1)
+            return int(head[:colon])
+
+    #  Otherwise, or if the prefix is invalid, read it one char at a time.
     c = file_handle.read(1)
     if c == b"":  # we want to detect this special case.
         raise ValueError("not a tnetstring: empty file")
@@ -176,18 +204,58 @@ def load(file_handle: typing.BinaryIO) -> TSerializable:
         c = file_handle.read(1)
     if c != b":":
         raise ValueError("not a tnetstring: missing or invalid length prefix")
+    return int(data_length)
+
 
-    data = file_handle.read(int(data_length))
-    data_type = file_handle.read(1)[0]
+def parse(data_type: int, data: bytes) -> TSerializable:
+    return _parse_value(data_type, data, 0, len(data))
 
-    return parse(data_type, data)
 
+def load_at(
+    data: Buffer,
+    offset: int,
+    lazy_keys: typing.Container = (),
+    lazy_size: int = 0,
+) -> typing.Tuple[TSerializable, int]:
+    """
+    Parse the tnetstring at the given offset of a buffer, e.g. an mmap of a
+    file. Returns the parsed object and the offset of the next tnetstring.
 
-def parse(data_type: int, data: bytes) -> TSerializable:
+    Byte strings of at least lazy_size bytes that are stored under one of
+    lazy_keys in a dictionary are not copied, but returned as LazyBytes
+    referencing the buffer.
+    """
+    if offset >= len(data):
+        raise ValueError("not a tnetstring: empty file")
+    return _parse(data, offset, len(data), (lazy_keys, lazy_size) if lazy_keys else None)
+
+
+def _parse_value(data_type: int, data: Buffer, start: int, end: int, lazy=None) -> TSerializable:
+    """
+    Parse the payload of a tnetstring, which is data[start:end].
+    Containers are parsed in place by offset, only leaf values are copied.
+    """
     if data_type == ord(b','):
-        return data
+        return data[start:end]
     if data_type == ord(b';'):
-        return data.decode("utf8")
+        return data[start:end].decode("utf8")
+    if data_type == ord(b']'):
+        l = []
+        while start < end:
+            item, start = _parse(data, start, end, lazy)
+            l.append(item)
+        return l
+    if data_type == ord(b'}'):
+        d = {}
+        while start < end:
+            key, start = _parse(data, start, end)
+            if lazy and key in lazy[0]:
+                val, start = _parse_lazy(data, start, end, lazy)
+            else:
+                val, start = _parse(data, start, end, lazy)
+            d[key] = val  # type: ignore
+        return d
+    data = data[start:end]
     if data_type == ord(b'#'):
         try:
             return int(data)
@@ -209,42 +277,59 @@ def parse(data_type: int, data: bytes) -> TSerializable:
         if data:
             raise ValueError("not a tnetstring: invalid null literal")
         return None
-    if data_type == ord(b']'):
-        l = []
-        while data:
-            item, data = pop(data)
-            l.append(item)  # type: ignore
-        return l
-    if data_type == ord(b'}'):
-        d = {}
-        while data:
-            key, data = pop(data)
-            val, data = pop(data)
-            d[key] = val  # type: ignore
-        return d
     raise ValueError("unknown type tag: {}".format(data_type))
 
 
+def _parse(data: Buffer, start: int, end: int, lazy=None) -> typing.Tuple[TSerializable, int]:
+    """
+    Parse the tnetstring at data[start:end]. Returns the parsed object and
+    the offset of the remaining data.
+    """
+    start, stop = _header(data, start, end)
+    # Parse the data based on the type tag.
+    return _parse_value(data[stop], data, start, stop, lazy), stop + 1
+
+
+def _parse_lazy(data: Buffer, start: int, end: int, lazy) -> typing.Tuple[typing.Union[TSerializable, LazyBytes], int]:
+    start, stop = _header(data, start, end)
+    if data[stop] == ord(b',') and stop - start >= lazy[1]:
+        return LazyBytes(data, start, stop), stop + 1
+    return _parse_value(data[stop], data, start, stop, lazy), stop + 1
+
+
+def _header(data: Buffer, start: int, end: int) -> typing.Tuple[int, int]:
+    """
+    Parse the length prefix of the tnetstring at data[start:end]. Returns the
+    offsets of its payload, the type tag is at the end offset.
+    """
+    colon = data.find(b':', start, end)
+    try:
+        if colon < 0:
+            raise ValueError
+        length = int(data[start:colon])
+        if length < 0:
+            raise ValueError
+    except ValueError:
+        raise ValueError("not a tnetstring: missing or invalid length prefix: {}".format(data[start:end]))
+    start = colon + 1
+    stop = start + length
+    if stop >= end:
+        #  This fires if the remaining data is shorter than the length
+        #  prefix, so we don't need to further validate the length.
+        raise ValueError("not a tnetstring: invalid length prefix: {}".format(length))
+    return start, stop
+
+
 def pop(data: bytes) -> typing.Tuple[TSerializable, bytes]:
     """
     This function parses a tnetstring into a python object.
     It returns a tuple giving the parsed object and a string
     containing any unparsed data from the end of the string.
     """
-    #  Parse out data length, type and remaining string.
-    try:
-        blength, data = data.split(b':', 1)
-        length = int(blength)
-    except ValueError:
-        raise ValueError("not a tnetstring: missing or invalid length prefix: {}".format(data))
-    try:
-        data, data_type, remain = data[:length], data[length], data[length + 1:]
-    except IndexError:
-        #  This fires if len(data) < dlen, meaning we don't need
-        #  to further validate that data is the right length.
-        raise ValueError("not a tnetstring: invalid length prefix: {}".format(length))
-    # Parse the data based on the type tag.
-    return parse(data_type, data), remain
+    if not isinstance(data, bytes):
+        data = bytes(data)
+    value, offset = _parse(data, 0, len(data))
+    return value, data[offset:]
 
 
-__all__ = ["dump", "dumps", "load", "loads", "pop"]
+__all__ = ["dump", "dumps", "load", "loads", "load_at", "pop"]
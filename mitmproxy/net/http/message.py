@@ -1,18 +1,36 @@
+import hashlib
 import re
 from typing import Optional, Union  # noqa
 
 from mitmproxy.utils import strutils
 from mitmproxy.net.http import encoding
+from mitmproxy.coretypes import lazybytes
+from mitmproxy.coretypes import revision
 from mitmproxy.coretypes import serializable
 from mitmproxy.net.http import headers
 
 
-class MessageData(serializable.Serializable):
-    content: bytes = None
+class MessageData(revision.Revisioned, serializable.Serializable):
+    @property
+    def content(self) -> bytes:
+        content = self.__dict__.get("content")
+        if isinstance(content, lazybytes.LazyBytes):
+            # Not stored, so that bodies that are only looked at do not
+            # stay in memory.
+            return content.load()
+        return content
+
+    @content.setter
+    def content(self, content):
+        # Bodies of lazily loaded flows are only read when accessed.
+        self.__dict__["content"] = content
 
     def __eq__(self, other):
         if isinstance(other, MessageData):
-            return self.__dict__ == other.__dict__
+            return (
+                self.content == other.content and
+                dict(self.__dict__, content=None) == dict(other.__dict__, content=None)
+            )
         return False
 
     def set_state(self, state):
@@ -24,6 +42,7 @@ class MessageData(serializable.Serializable):
     def get_state(self):
         state = vars(self).copy()
         state["headers"] = state["headers"].get_state()
+        state["content"] = self.content
         return state
 
     @classmethod
@@ -32,9 +51,12 @@ class MessageData(serializable.Serializable):
         return cls(**state)
 
 
-class Message(serializable.Serializable):
+class Message(revision.Revisioned, serializable.Serializable):
     data: MessageData = None
 
+    # Other attributes are properties of data, or not part of the state.
+    _revisioned = frozenset({"data"})
+
     def __eq__(self, other):
         if isinstance(other, Message):
             return self.data == other.data
@@ -78,6 +100,30 @@ class Message(serializable.Serializable):
     def raw_content(self, content):
         self.data.content = content
 
+    @property
+    def raw_content_size(self) -> int:
+        """
+        The length of the raw HTTP message body. Unlike len(raw_content),
+        this does not load the body of a lazily read flow.
+        """
+        return len(self.data.__dict__.get("content") or b"")
+
+    @property
+    def raw_content_hash(self) -> Optional[str]:
+        """
+        The SHA-256 hex digest of the raw HTTP message body, None if there is
+        no body. Lazily read bodies are hashed without loading them.
+        """
+        content = self.data.__dict__.get("content")
+        if not content:
+            return None
+        h = hashlib.sha256()
+        if isinstance(content, lazybytes.LazyBytes):
+            content.update_hash(h)
+        else:
+            h.update(content)
+        return h.hexdigest()
+
     def get_content(self, strict: bool=True) -> bytes:
         """
         The HTTP message body decoded with the content-encoding header (e.g. gzip)
@@ -103,22 +103,17 @@ class Writer(_FileLike):
 
 class Reader(_FileLike):
 
-    def read(self, length):
+    def _read_chunk(self, length, start):
         """
-            If length is -1, we read until connection closes.
+            Read up to length bytes with a single successful call to the
+            underlying file object. Returns b"" if the connection was closed.
         """
-        result = b''
-        start = time.time()
-        while length == -1 or length > 0:
-            if length == -1 or length > self.BLOCKSIZE:
-                rlen = self.BLOCKSIZE
-            else:
-                rlen = length
+        while True:
             try:
-                data = self.o.read(rlen)
+                data = self.o.read(length)
             except SSL.ZeroReturnError:
                 # TLS connection was shut down cleanly
-                break
+                return b""
             except (SSL.WantWriteError, SSL.WantReadError):
                 # From the OpenSSL docs:
                 # If the underlying BIO is non-blocking, SSL_read() will also return when the
@@ -136,19 +131,43 @@ class Reader(_FileLike):
                 raise exceptions.TcpDisconnect(str(e))
             except SSL.SysCallError as e:
                 if e.args == (-1, 'Unexpected EOF'):
-                    break
+                    return b""
                 raise exceptions.TlsException(str(e))
             except SSL.Error as e:
                 raise exceptions.TlsException(str(e))
             self.first_byte_timestamp = self.first_byte_timestamp or time.time()
+            return data
+
+    def read(self, length):
+        """
+            If length is -1, we read until connection closes.
+        """
+        chunks = []
+        start = time.time()
+        while length == -1 or length > 0:
+            if length == -1 or length > self.BLOCKSIZE:
+                rlen = self.BLOCKSIZE
+            else:
+                rlen = length
+            data = self._read_chunk(rlen, start)
             if not data:
                 break
-            result += data
+            chunks.append(data)
             if length != -1:
                 length -= len(data)
+        result = b"".join(chunks)
         self.add_log(result)
         return result
 
+    def read1(self, length):
+        """
+            Read up to length bytes, returning as soon as any data is available.
+            Returns b"" if the connection was closed.
+        """
+        data = self._read_chunk(length, time.time())
+        self.add_log(data)
+        return data
+
     def readline(self, size=None):
         result = b''
         bytes_read = 0
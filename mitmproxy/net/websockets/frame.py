@@ -1,8 +1,7 @@
 import os
 import struct
-import io
 
-from mitmproxy.net import tcp
+from mitmproxy import exceptions
 from mitmproxy.utils import strutils
 from mitmproxy.utils import bits
 from mitmproxy.utils import human
@@ -15,6 +14,9 @@ MAX_64_BIT_INT = (1 << 64)
 
 DEFAULT = object()
 
+# number of extended payload length bytes for a given length code
+EXTENDED_LENGTH_SIZE = {126: 2, 127: 8}
+
 # RFC 6455, Section 5.2 - Base Framing Protocol
 OPCODE = bidi.BiDi(
     CONTINUE=0x00,
@@ -43,6 +45,14 @@ CLOSE_REASON = bidi.BiDi(
 )
 
 
+def _check_available(view, offset, length):
+    available = len(view) - offset
+    if available < length:
+        raise exceptions.TcpReadIncomplete(
+            "Expected %s bytes, got %s" % (length, max(available, 0))
+        )
+
+
 class FrameHeader:
 
     def __init__(
@@ -147,11 +157,16 @@ class FrameHeader:
         return b
 
     @classmethod
-    def from_file(cls, fp):
+    def _remaining_length(cls, second_byte):
         """
-          read a WebSocket frame header
+          Number of header bytes that follow the first two bytes
         """
-        first_byte, second_byte = fp.safe_read(2)
+        mask_bit = bits.getbit(second_byte, 7)
+        length_code = second_byte & 0x7F
+        return EXTENDED_LENGTH_SIZE.get(length_code, 0) + (4 if mask_bit else 0)
+
+    @classmethod
+    def _parse(cls, first_byte, second_byte, remainder):
         fin = bits.getbit(first_byte, 7)
         rsv1 = bits.getbit(first_byte, 6)
         rsv2 = bits.getbit(first_byte, 5)
@@ -162,16 +177,19 @@ class FrameHeader:
 
         # payload_length > 125 indicates you need to read more bytes
         # to get the actual payload length
+        offset = 0
         if length_code <= 125:
             payload_length = length_code
         elif length_code == 126:
-            payload_length, = struct.unpack("!H", fp.safe_read(2))
+            payload_length, = struct.unpack_from("!H", remainder)
+            offset = 2
         else:  # length_code == 127:
-            payload_length, = struct.unpack("!Q", fp.safe_read(8))
+            payload_length, = struct.unpack_from("!Q", remainder)
+            offset = 8
 
         # masking key only present if mask bit set
         if mask_bit == 1:
-            masking_key = fp.safe_read(4)
+            masking_key = bytes(remainder[offset:offset + 4])
         else:
             masking_key = None
 
@@ -187,6 +205,33 @@ class FrameHeader:
             masking_key=masking_key,
         )
 
+    @classmethod
+    def from_file(cls, fp):
+        """
+          read a WebSocket frame header
+        """
+        first_byte, second_byte = fp.safe_read(2)
+        # read extended payload length and masking key in one go
+        remaining = cls._remaining_length(second_byte)
+        remainder = fp.safe_read(remaining) if remaining else b""
+        return cls._parse(first_byte, second_byte, remainder)
+
+    @classmethod
+    def from_buffer(cls, buf, offset=0):
+        """
+          read a WebSocket frame header from a bytes-like object at the given
+          offset, without copying the buffer.
+
+          Returns a (header, header_length) tuple.
+        """
+        view = memoryview(buf)
+        _check_available(view, offset, 2)
+        first_byte, second_byte = view[offset], view[offset + 1]
+        remaining = cls._remaining_length(second_byte)
+        _check_available(view, offset + 2, remaining)
+        header = cls._parse(first_byte, second_byte, view[offset + 2:offset + 2 + remaining])
+        return header, 2 + remaining
+
     def __eq__(self, other):
         if isinstance(other, FrameHeader):
             return bytes(self) == bytes(other)
@@ -231,7 +276,32 @@ class Frame:
           Construct a websocket frame from an in-memory bytestring
           to construct a frame from a stream of bytes, use from_file() directly
         """
-        return cls.from_file(tcp.Reader(io.BytesIO(bytestring)))
+        frame, _ = cls.from_buffer(bytestring)
+        return frame
+
+    @classmethod
+    def from_buffer(cls, buf, offset=0):
+        """
+          Construct a websocket frame from a bytes-like object at the given
+          offset. The buffer is only sliced through a memoryview, the payload
+          is the only part that is copied.
+
+          Returns a (frame, frame_length) tuple.
+        """
+        view = memoryview(buf)
+        header, header_length = FrameHeader.from_buffer(view, offset)
+        start = offset + header_length
+        end = start + header.payload_length
+        _check_available(view, start, header.payload_length)
+        payload = view[start:end]
+        if header.mask == 1 and header.masking_key:
+            payload = Masker(header.masking_key)(payload)
+        else:
+            payload = bytes(payload)
+
+        frame = cls(payload)
+        frame.header = header
+        return frame, end - offset
 
     def __repr__(self):
         ret = repr(self.header)
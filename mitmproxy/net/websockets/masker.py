@@ -12,12 +12,16 @@ class Masker:
         self.offset = 0
 
     def mask(self, offset, data):
-        result = bytearray(data)
-        for i in range(len(data)):
-            result[i] ^= self.key[offset % 4]
-            offset += 1
-        result = bytes(result)
-        return result
+        # XOR the whole payload at once by treating both the payload and the
+        # repeated key as one big integer, instead of looping over every byte.
+        length = len(data)
+        if not length:
+            return b""
+        shift = offset % 4
+        key = self.key[shift:] + self.key[:shift]
+        keystream = (key * (length // 4 + 1))[:length]
+        result = int.from_bytes(data, "big") ^ int.from_bytes(keystream, "big")
+        return result.to_bytes(length, "big")
 
     def __call__(self, data):
         ret = self.mask(self.offset, data)
@@ -20,6 +20,14 @@ class Options(optmanager.OptManager):
             "showhost", bool, False,
             "Use the Host header to construct URLs for display."
         )
+        self.add_option(
+            "lazy_bodies", bool, False,
+            """
+            Read large message bodies from flow files only when they are
+            accessed. Flow files are memory-mapped and must not be modified
+            while their flows are loaded.
+            """
+        )
 
         # Proxy options
         self.add_option(
@@ -108,12 +116,45 @@ class Options(optmanager.OptManager):
             "Enable/disable WebSocket support. "
             "WebSocket support is enabled by default.",
         )
+        self.add_option(
+            "websocket_retain_messages", int, 0,
+            """
+            Number of WebSocket messages per flow to keep in memory. Older
+            messages are moved to a temporary spill file and loaded on demand.
+            0 keeps all messages in memory.
+            """
+        )
+        self.add_option(
+            "websocket_retain_size", Optional[str], None,
+            """
+            Byte size of WebSocket message content per flow to keep in memory.
+            Older messages are moved to a temporary spill file and loaded on
+            demand. Understands k/m/g suffixes, i.e. 3m for 3 megabytes.
+            """
+        )
+        self.add_option(
+            "websocket_spill_dir", Optional[str], None,
+            """
+            Directory for WebSocket message spill files. Defaults to the
+            system's temporary directory.
+            """
+        )
         self.add_option(
             "rawtcp", bool, False,
             "Enable/disable experimental raw TCP support. TCP connections starting with non-ascii "
             "bytes are treated as if they would match tcp_hosts. The heuristic is very rough, use "
             "with caution. Disabled by default. "
         )
+        self.add_option(
+            "tcp_async_messages", bool, False,
+            """
+            Deliver tcp_message events to addons without waiting for them, so
+            that raw TCP data is relayed immediately. Addons that modify TCP
+            messages must mark their tcp_message handler with
+            @mitmproxy.script.modifies_messages, which restores blocking
+            delivery for all addons.
+            """
+        )
 
         self.add_option(
             "spoof_source_address", bool, False,
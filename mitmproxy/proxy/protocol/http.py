@@ -396,13 +396,14 @@ class HttpLayer(base.Layer):
                 # no further manipulation of self.server_conn beyond this point
                 # we can safely set it as the final attribute value here.
                 f.server_conn = self.server_conn
+
+                self.log("response", "debug", [repr(f.response)])
+                self.channel.ask("response", f)
             else:
                 # response was set by an inline script.
                 # we now need to emulate the responseheaders hook.
-                self.channel.ask("responseheaders", f)
-
-            self.log("response", "debug", [repr(f.response)])
-            self.channel.ask("response", f)
+                self.log("response", "debug", [repr(f.response)])
+                self.channel.ask_all(["responseheaders", "response"], f)
 
             if not f.response.stream:
                 # no streaming:
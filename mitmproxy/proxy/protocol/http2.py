@@ -1,11 +1,12 @@
 import threading
 import time
 import functools
-from typing import Dict, Callable, Any, List  # noqa
+from typing import Dict, Callable, Any, List, Tuple  # noqa
 
 import h2.exceptions
 from h2 import connection
 from h2 import events
+from hyperframe.frame import WindowUpdateFrame
 import queue
 
 from mitmproxy import connections  # noqa
@@ -27,14 +28,36 @@ class SafeH2Connection(connection.H2Connection):
         self.conn = conn
         self.lock = threading.RLock()
 
-    def safe_acknowledge_received_data(self, acknowledged_size: int, stream_id: int):
+    def safe_acknowledge_connection_data(self, acknowledged_size: int):
+        """
+        Hand back connection-level flow-control credit for received data.
+        The stream-level window stays consumed until safe_acknowledge_stream_data is called,
+        so that a single slow stream does not block all other streams of the connection.
+        """
         if acknowledged_size == 0:
             return
 
         with self.lock:
-            self.acknowledge_received_data(acknowledged_size, stream_id)
+            increment = self._inbound_flow_control_window_manager.process_bytes(acknowledged_size)
+            if increment:
+                f = WindowUpdateFrame(0)
+                f.window_increment = increment
+                self._prepare_for_sending([f])
             self.conn.send(self.data_to_send())
 
+    def safe_acknowledge_stream_data(self, acknowledged_size: int, stream_id: int):
+        """
+        Hand back stream-level flow-control credit for data that has been consumed.
+        """
+        if acknowledged_size == 0:
+            return
+
+        with self.lock:
+            stream = self.streams.get(stream_id)
+            if stream is not None and stream.open:
+                self._prepare_for_sending(stream.acknowledge_received_data(acknowledged_size))
+                self.conn.send(self.data_to_send())
+
     def safe_reset_stream(self, stream_id: int, error_code: int):
         with self.lock:
             try:
@@ -81,6 +104,62 @@ class SafeH2Connection(connection.H2Connection):
             self.conn.send(self.data_to_send())
 
 
+class FlowControlledQueue:
+    """
+    Body data received on a single HTTP/2 stream that has not been consumed yet.
+
+    Stream-level flow-control credit is only handed back to the sender once
+    the data has been taken out of the queue. If the body is streamed, the
+    sender can therefore never be more than one stream window ahead of the
+    other side of the proxy. Once it is known that the body will be buffered
+    in full anyway, acknowledge_all() returns all held back credit and
+    further data is acknowledged as soon as it arrives.
+    """
+
+    def __init__(self) -> None:
+        self.queue: queue.Queue[Tuple[bytes, int]] = queue.Queue()
+        self.lock = threading.Lock()
+        self.deferred = True
+        self.unacknowledged_length = 0
+        self._acknowledge: Callable[[int], None] = None
+
+        # gauges for the amount of data held in memory for this stream
+        self.buffered_length = 0
+        self.max_buffered_length = 0
+
+    def put(self, data: bytes, flow_controlled_length: int, acknowledge: Callable[[int], None]) -> None:
+        with self.lock:
+            self.buffered_length += len(data)
+            self.max_buffered_length = max(self.max_buffered_length, self.buffered_length)
+            self.queue.put((data, flow_controlled_length))
+            if self.deferred:
+                self.unacknowledged_length += flow_controlled_length
+                self._acknowledge = acknowledge
+                return
+        acknowledge(flow_controlled_length)
+
+    def get(self, timeout: float = None) -> bytes:
+        data, flow_controlled_length = self.queue.get(timeout=timeout)
+        with self.lock:
+            self.buffered_length -= len(data)
+            acknowledged_length = min(flow_controlled_length, self.unacknowledged_length)
+            self.unacknowledged_length -= acknowledged_length
+        if acknowledged_length:
+            self._acknowledge(acknowledged_length)
+        return data
+
+    def acknowledge_all(self) -> None:
+        with self.lock:
+            self.deferred = False
+            acknowledged_length = self.unacknowledged_length
+            self.unacknowledged_length = 0
+        if acknowledged_length:
+            self._acknowledge(acknowledged_length)
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+
 class Http2Layer(base.Layer):
 
     if False:
@@ -193,12 +272,17 @@ class Http2Layer(base.Layer):
             )
             self.log("HTTP body too large. Limit is {}.".format(bsl), "info")
         else:
-            self.streams[eid].data_queue.put(event.data)
-            self.streams[eid].queued_data_length += len(event.data)
-            self.connections[source_conn].safe_acknowledge_received_data(
+            if source_conn == self.server_conn:
+                data_queue = self.streams[eid].response_data_queue
+            else:
+                data_queue = self.streams[eid].request_data_queue
+            data_queue.put(
+                event.data,
                 event.flow_controlled_length,
-                event.stream_id
+                functools.partial(self.connections[source_conn].safe_acknowledge_stream_data, stream_id=event.stream_id)
             )
+            self.streams[eid].queued_data_length += len(event.data)
+            self.connections[source_conn].safe_acknowledge_connection_data(event.flow_controlled_length)
         return True
 
     def _handle_stream_ended(self, eid):
@@ -393,12 +477,12 @@ class Http2SingleStreamLayer(httpbase._HttpTransmissionLayer, basethread.BaseThr
         self.timestamp_end: float = None
 
         self.request_arrived = threading.Event()
-        self.request_data_queue: queue.Queue[bytes] = queue.Queue()
+        self.request_data_queue = FlowControlledQueue()
         self.request_queued_data_length = 0
         self.request_data_finished = threading.Event()
 
         self.response_arrived = threading.Event()
-        self.response_data_queue: queue.Queue[bytes] = queue.Queue()
+        self.response_data_queue = FlowControlledQueue()
         self.response_queued_data_length = 0
         self.response_data_finished = threading.Event()
 
@@ -432,11 +516,8 @@ class Http2SingleStreamLayer(httpbase._HttpTransmissionLayer, basethread.BaseThr
         return True
 
     @property
-    def data_queue(self):
-        if self.response_arrived.is_set():
-            return self.response_data_queue
-        else:
-            return self.request_data_queue
+    def buffered_data_length(self):
+        return self.request_data_queue.buffered_length + self.response_data_queue.buffered_length
 
     @property
     def queued_data_length(self):
@@ -489,6 +570,8 @@ class Http2SingleStreamLayer(httpbase._HttpTransmissionLayer, basethread.BaseThr
     @detect_zombie_stream
     def read_request_body(self, request):
         if not request.stream:
+            # The body is buffered in full, holding back flow-control credit would only stall the client.
+            self.request_data_queue.acknowledge_all()
             self.request_data_finished.wait()
 
         while True:
@@ -603,6 +686,9 @@ class Http2SingleStreamLayer(httpbase._HttpTransmissionLayer, basethread.BaseThr
 
     @detect_zombie_stream
     def read_response_body(self, request, response):
+        if not response.stream:
+            self.response_data_queue.acknowledge_all()
+
         while True:
             try:
                 yield self.response_data_queue.get(timeout=0.1)
@@ -1,3 +1,5 @@
+import functools
+import os
 import socket
 
 from OpenSSL import SSL
@@ -11,11 +13,38 @@ from mitmproxy.proxy.protocol import base
 
 class RawTCPLayer(base.Layer):
     chunk_size = 4096
+    """Initial read size. Reads that fill the buffer double it up to max_chunk_size."""
+    max_chunk_size = 256 * 1024
+    splice_size = 64 * 1024
+    """Bytes moved per splice() call, which matches the default pipe capacity on Linux."""
 
     def __init__(self, ctx, ignore=False):
         self.ignore = ignore
         super().__init__(ctx)
 
+    def can_splice(self):
+        """
+        Ignored plain TCP connections can be relayed in the kernel with
+        splice(2), which is available from Python 3.10 on Linux.
+        """
+        return (
+            self.ignore and
+            hasattr(os, "splice") and
+            not isinstance(self.client_conn.connection, SSL.Connection) and
+            not isinstance(self.server_conn.connection, SSL.Connection)
+        )
+
+    def blocking(self):
+        """
+        Should the proxy wait for tcp_message handlers? This is checked for
+        each message, as scripts with @modifies_messages handlers may be
+        loaded or reloaded while the connection is open.
+        """
+        return (
+            not self.config.options.tcp_async_messages or
+            self.channel.master.addons.modifies_messages("tcp_message")
+        )
+
     def __call__(self):
         self.connect()
 
@@ -28,14 +57,26 @@ class RawTCPLayer(base.Layer):
         client = self.client_conn.connection
         server = self.server_conn.connection
         conns = [client, server]
+        read_sizes = {client: self.chunk_size, server: self.chunk_size}
+        pipes = {}
 
         try:
+            if self.can_splice():
+                pipes = {client: os.pipe(), server: os.pipe()}
             while not self.channel.should_exit.is_set():
                 r = mitmproxy.net.tcp.ssl_read_select(conns, 10)
                 for conn in r:
                     dst = server if conn == client else client
 
-                    size = conn.recv_into(buf, self.chunk_size)
+                    if pipes:
+                        size = self._splice(conn, dst, pipes[conn])
+                    else:
+                        read_size = read_sizes[conn]
+                        if len(buf) < read_size:
+                            buf = memoryview(bytearray(read_size))
+                        size = conn.recv_into(buf, read_size)
+                        if size == read_size and read_size < self.max_chunk_size:
+                            read_sizes[conn] = read_size * 2
                     if not size:
                         conns.remove(conn)
                         # Shutdown connection to the other peer
@@ -50,16 +91,45 @@ class RawTCPLayer(base.Layer):
                             return
                         continue
 
+                    if pipes:
+                        continue
+                    if self.ignore:
+                        dst.sendall(buf[:size])
+                        continue
+
                     tcp_message = tcp.TCPMessage(dst == server, buf[:size].tobytes())
-                    if not self.ignore:
+                    if self.blocking():
                         f.messages.append(tcp_message)
                         self.channel.ask("tcp_message", f)
-                    dst.sendall(tcp_message.content)
+                        dst.sendall(tcp_message.content)
+                    else:
+                        dst.sendall(tcp_message.content)
+                        # Append on the master's event loop, so that handlers
+                        # still see their message as f.messages[-1].
+                        self.channel.tell(
+                            "tcp_message", f,
+                            functools.partial(f.messages.append, tcp_message)
+                        )
 
         except (socket.error, exceptions.TcpException, SSL.Error) as e:
             if not self.ignore:
                 f.error = flow.Error("TCP connection closed unexpectedly: {}".format(repr(e)))
                 self.channel.tell("tcp_error", f)
         finally:
+            for pipe in pipes.values():
+                os.close(pipe[0])
+                os.close(pipe[1])
             if not self.ignore:
                 self.channel.tell("tcp_end", f)
+
+    def _splice(self, src, dst, pipe):
+        """
+        Move the data available on src to dst through a pipe without copying
+        it to user space. Returns the number of bytes moved, 0 on EOF.
+        """
+        r, w = pipe
+        size = os.splice(src.fileno(), w, self.splice_size, flags=os.SPLICE_F_MOVE)
+        left = size
+        while left:
+            left -= os.splice(r, dst.fileno(), left, flags=os.SPLICE_F_MOVE)
+        return size
@@ -1,5 +1,7 @@
+import collections
 import queue
 import socket
+import typing
 from OpenSSL import SSL
 
 
@@ -14,7 +16,55 @@ from mitmproxy.proxy.protocol import base
 from mitmproxy.net import tcp
 from mitmproxy.net import websockets
 from mitmproxy.websocket import WebSocketFlow, WebSocketMessage
-from mitmproxy.utils import strutils
+from mitmproxy.utils import strutils, human
+
+
+DATA_OPCODES = {
+    websockets.OPCODE.CONTINUE,
+    websockets.OPCODE.TEXT,
+    websockets.OPCODE.BINARY,
+}
+
+
+class RawFrameBuffer:
+    """
+        Splits the raw byte stream received from one endpoint into frames and
+        groups data frames by message, so that unmodified messages can be
+        forwarded as they were received.
+
+        Only frame headers are parsed here, payloads are neither unmasked nor
+        decoded. Control frames are skipped, they are handled by wsproto.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames = []
+        self.messages = collections.deque()
+
+    def receive_bytes(self, data):
+        self.buffer += data
+        offset = 0
+        while True:
+            try:
+                header, header_length = websockets.FrameHeader.from_buffer(self.buffer, offset)
+            except exceptions.TcpReadIncomplete:
+                break
+            end = offset + header_length + header.payload_length
+            if end > len(self.buffer):
+                break
+            if header.opcode in DATA_OPCODES:
+                self.frames.append(bytes(self.buffer[offset:end]))
+                if header.fin:
+                    self.messages.append(self.frames)
+                    self.frames = []
+            offset = end
+        del self.buffer[:offset]
+
+    def pop_message(self):
+        """
+            Returns the raw frames of the oldest completely received message.
+        """
+        return self.messages.popleft()
 
 
 class WebSocketLayer(base.Layer):
@@ -38,6 +88,8 @@ class WebSocketLayer(base.Layer):
         This layer is transparent to any negotiated extensions.
         This layer is transparent to any negotiated subprotocols.
         Only raw frames are forwarded to the other endpoint.
+        If no extensions are negotiated, messages that have not been modified
+        are forwarded with their original framing, without encoding them again.
 
         WebSocket messages are stored in a WebSocketFlow.
     """
@@ -66,6 +118,13 @@ class WebSocketLayer(base.Layer):
             for conn in self.connections.values():
                 conn.extensions[0].finalize(conn, handshake_flow.response.headers['Sec-WebSocket-Extensions'])
 
+        # Extensions such as permessage-deflate keep state across messages,
+        # so frames can only be passed through verbatim without them.
+        self.raw_frame_buffers: typing.Dict[object, RawFrameBuffer] = {}
+        if not extensions:
+            self.raw_frame_buffers[self.client_conn] = RawFrameBuffer()
+            self.raw_frame_buffers[self.server_conn] = RawFrameBuffer()
+
         data = self.connections[self.server_conn].bytes_to_send()
         self.connections[self.client_conn].receive_bytes(data)
 
@@ -95,6 +154,9 @@ class WebSocketLayer(base.Layer):
 
         if event.message_finished:
             original_chunk_sizes = [len(f) for f in fb]
+            raw_frames = None
+            if source_conn in self.raw_frame_buffers:
+                raw_frames = self.raw_frame_buffers[source_conn].pop_message()
 
             if isinstance(event, events.TextReceived):
                 message_type = wsproto.frame_protocol.Opcode.TEXT
@@ -110,7 +172,11 @@ class WebSocketLayer(base.Layer):
             self.flow.messages.append(websocket_message)
             self.channel.ask("websocket_message", self.flow)
 
-            if not self.flow.stream and not websocket_message.killed:
+            if raw_frames is not None and not self.flow.stream and not websocket_message.killed and \
+                    websocket_message.content == payload:
+                # message is unmodified, we can forward the frames as they were received
+                other_conn.send(b"".join(raw_frames))
+            elif not self.flow.stream and not websocket_message.killed:
                 def get_chunk(payload):
                     if len(payload) == length:
                         # message has the same length, we can reuse the same sizes
@@ -178,6 +244,11 @@ class WebSocketLayer(base.Layer):
 
     def __call__(self):
         self.flow = WebSocketFlow(self.client_conn, self.server_conn, self.handshake_flow)
+        self.flow.messages.set_retention(
+            self.config.options.websocket_retain_messages,
+            human.parse_size(self.config.options.websocket_retain_size),
+            self.config.options.websocket_spill_dir,
+        )
         self.flow.metadata['websocket_handshake'] = self.handshake_flow.id
         self.handshake_flow.metadata['websocket_flow'] = self.flow.id
         self.channel.ask("websocket_start", self.flow)
@@ -196,8 +267,12 @@ class WebSocketLayer(base.Layer):
                     other_conn = self.server_conn if conn == self.client_conn.connection else self.client_conn
                     is_server = (source_conn == self.server_conn)
 
-                    frame = websockets.Frame.from_file(source_conn.rfile)
-                    self.connections[source_conn].receive_bytes(bytes(frame))
+                    data = source_conn.rfile.read1(source_conn.rfile.BLOCKSIZE)
+                    if not data:
+                        raise exceptions.TcpDisconnect()
+                    if source_conn in self.raw_frame_buffers:
+                        self.raw_frame_buffers[source_conn].receive_bytes(data)
+                    self.connections[source_conn].receive_bytes(data)
                     source_conn.send(self.connections[source_conn].bytes_to_send())
 
                     if close_received:
@@ -1,5 +1,9 @@
 from .concurrent import concurrent
+from .modifies import modifies_messages
+from .offload import offload
 
 __all__ = [
     "concurrent",
+    "modifies_messages",
+    "offload",
 ]
@@ -2,15 +2,145 @@
 This module provides a @concurrent decorator primitive to
 offload computations from mitmproxy's main master thread.
 """
+import collections
+import threading
+import time
+import traceback
+import typing
 
+from mitmproxy import ctx
 from mitmproxy import eventsequence
 from mitmproxy.coretypes import basethread
 
 
+Call = typing.Tuple[float, str, typing.Callable[[], None]]
+"""(time queued, hook name, function) of a @concurrent hook call."""
+
+
 class ScriptThread(basethread.BaseThread):
     name = "ScriptThread"
 
 
+class ThreadPool:
+    """
+    A pool of ScriptThreads running @concurrent hooks.
+
+    Calls wait in a bounded queue until a worker is free. If the queue is
+    full, the overflow policy decides what happens: "block" holds the call
+    back until there is room in the queue, "kill" kills the flow instead.
+    Calls are submitted from the event loop, which never waits for the
+    pool; a held back call only delays its own flow.
+    """
+
+    def __init__(self, max_workers: int = 32, max_queue: int = 1024, overflow: str = "block") -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.queue: typing.Deque[Call] = collections.deque()
+        self.held: typing.Deque[Call] = collections.deque()
+        """Calls held back because the queue was full."""
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        """Notified when a call is queued or workers need to retire."""
+        self.workers = 0
+        self.active = 0
+        """Number of workers currently running a hook."""
+        self.started = 0
+        self.completed = 0
+        self.killed = 0
+        """Number of calls rejected because the queue was full."""
+        self.wait_time = 0.0
+        """Total time calls have spent waiting in the queue."""
+        self.max_wait_time = 0.0
+
+    def configure(self, max_workers: int, max_queue: int, overflow: str) -> None:
+        with self.lock:
+            self.max_workers = max_workers
+            self.max_queue = max_queue
+            self.overflow = overflow
+            # The queue may have room for held back calls now.
+            self._fill()
+            self._spawn()
+            # Wake idle workers, so that the ones over max_workers retire.
+            self.ready.notify_all()
+
+    def _full(self) -> bool:
+        return bool(self.max_queue and len(self.queue) >= self.max_queue)
+
+    def _fill(self) -> None:
+        while self.held and not self._full():
+            self.queue.append(self.held.popleft())
+
+    def _spawn(self) -> None:
+        while self.workers - self.active < len(self.queue) and self.workers < self.max_workers:
+            self.workers += 1
+            ScriptThread("script.concurrent", target=self._work, daemon=True).start()
+
+    def submit(self, name: str, fn) -> bool:
+        """
+        Queue fn to be run by a worker. Returns False if the queue is full
+        and the overflow policy is "kill".
+        """
+        call = (time.time(), name, fn)
+        with self.lock:
+            if self._full() or self.held:
+                if self.overflow == "kill":
+                    self.killed += 1
+                    return False
+                self.held.append(call)
+            else:
+                self.queue.append(call)
+                self.ready.notify()
+            self._spawn()
+        return True
+
+    def _work(self):
+        while True:
+            with self.lock:
+                while not self.queue and self.workers <= self.max_workers:
+                    self.ready.wait()
+                if self.workers > self.max_workers:
+                    self.workers -= 1
+                    return
+                queued, name, fn = self.queue.popleft()
+                self._fill()
+                wait = time.time() - queued
+                self.active += 1
+                self.started += 1
+                self.wait_time += wait
+                self.max_wait_time = max(self.max_wait_time, wait)
+            threading.current_thread().name = "script.concurrent (%s)" % name
+            try:
+                fn()
+            except Exception as e:
+                # Keep the worker alive, but report the error. ctx.log must be
+                # called on the event loop.
+                ctx.master.channel.loop.call_soon_threadsafe(
+                    ctx.log.error,
+                    "script.concurrent (%s): %s\n%s" % (name, e, traceback.format_exc())
+                )
+            finally:
+                threading.current_thread().name = "script.concurrent"
+                with self.lock:
+                    self.active -= 1
+                    self.completed += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(
+                workers=self.workers,
+                active=self.active,
+                queued=len(self.queue) + len(self.held),
+                completed=self.completed,
+                killed=self.killed,
+                avg_wait_time=self.wait_time / self.started if self.started else 0.0,
+                max_wait_time=self.max_wait_time,
+            )
+
+
+pool = ThreadPool()
+
+
 def concurrent(fn):
     if fn.__name__ not in eventsequence.Events - {"load", "configure"}:
         raise NotImplementedError(
@@ -30,9 +160,10 @@ def concurrent(fn):
                     obj.reply.ack()
                 obj.reply.commit()
         obj.reply.take()
-        ScriptThread(
-            "script.concurrent (%s)" % fn.__name__,
-            target=run
-        ).start()
+        if not pool.submit(fn.__name__, run):
+            ctx.log.warn(
+                "script.concurrent (%s): queue is full, killing %s" % (fn.__name__, obj)
+            )
+            obj.reply.kill()
 
     return _concurrent
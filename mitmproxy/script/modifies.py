@@ -0,0 +1,13 @@
+"""
+This module provides a @modifies_messages decorator to mark event handlers
+that change the messages they are given, so that they must be waited for.
+"""
+
+
+def modifies_messages(fn):
+    if fn.__name__ != "tcp_message":
+        raise NotImplementedError(
+            "Modifies messages decorator not supported for '%s' method." % fn.__name__
+        )
+    fn.modifies_messages = True
+    return fn
@@ -0,0 +1,169 @@
+"""
+This module provides an @offload decorator primitive to run CPU-bound
+event handlers in a separate worker process, so that they are not
+serialized by the GIL.
+
+The flow is sent to the worker as get_state() data, and the fields the
+worker changed are applied to the live flow with set_state(). If the live
+flow is killed or changed while the handler runs, e.g. by another addon
+or by the user, the changes made by the worker are discarded. Offloaded
+handlers must be module-level functions, as the worker process looks them
+up by name.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import importlib
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import threading
+import traceback
+import typing
+
+from mitmproxy import ctx
+from mitmproxy import eventsequence
+from mitmproxy import exceptions
+from mitmproxy import flow
+from mitmproxy.io import io
+
+Ref = typing.Tuple[str, str, str]
+"""(module name, file name, qualified name) of an offloaded function."""
+
+_modules: typing.Dict[typing.Tuple[str, float], typing.Any] = {}
+
+
+def _load(ref: Ref):
+    """
+    Find the undecorated function in the worker process. Scripts are not
+    importable by name, so they are loaded from their file.
+    """
+    module, path, qualname = ref
+    if module.startswith("__mitmproxy_script__."):
+        key = (path, os.path.getmtime(path))
+        if key not in _modules:
+            loader = importlib.machinery.SourceFileLoader(module, path)
+            spec = importlib.util.spec_from_loader(module, loader=loader)
+            m = importlib.util.module_from_spec(spec)
+            sys.path.insert(0, os.path.dirname(path))
+            try:
+                loader.exec_module(m)
+            finally:
+                sys.path.pop(0)
+            _modules[key] = m
+        obj = _modules[key]
+    else:
+        obj = importlib.import_module(module)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return getattr(obj, "__wrapped__", obj)
+
+
+def _run(ref: Ref, state: dict) -> typing.Tuple[dict, typing.List[str]]:
+    """
+    Run an offloaded handler in a worker process. Bodies the handler did not
+    change are not sent back; their names are returned instead.
+    """
+    f = io.FLOW_TYPES[state["type"]].from_state(state)
+    _load(ref)(f)
+    new_state = f.get_state()
+    unchanged = []
+    for part in ("request", "response"):
+        old, new = state.get(part), new_state.get(part)
+        if old and new and old["content"] == new["content"]:
+            new["content"] = None
+            unchanged.append(part)
+    return new_state, unchanged
+
+
+class ProcessPool:
+    """
+    The pool of worker processes running @offload hooks. Worker processes
+    are only started when the first hook is called.
+    """
+
+    def __init__(self, max_workers: typing.Optional[int] = None) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor: typing.Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self.lock = threading.Lock()
+
+    def configure(self, max_workers: int) -> None:
+        with self.lock:
+            max_workers = max_workers or os.cpu_count() or 1
+            if max_workers != self.max_workers:
+                self.max_workers = max_workers
+                if self.executor:
+                    self.executor.shutdown(wait=False)
+                    self.executor = None
+
+    def submit(self, ref: Ref, state: dict) -> concurrent.futures.Future:
+        with self.lock:
+            if not self.executor:
+                self.executor = concurrent.futures.ProcessPoolExecutor(self.max_workers)
+            return self.executor.submit(_run, ref, state)
+
+    def shutdown(self) -> None:
+        with self.lock:
+            if self.executor:
+                self.executor.shutdown()
+                self.executor = None
+
+
+pool = ProcessPool()
+
+
+def offload(fn):
+    if fn.__name__ not in eventsequence.Events - {"load", "configure"}:
+        raise NotImplementedError(
+            "Offload decorator not supported for '%s' method." % fn.__name__
+        )
+    if "." in fn.__qualname__:
+        raise NotImplementedError(
+            "Offload decorator only supports module-level functions, not '%s'." % fn.__qualname__
+        )
+    ref = (fn.__module__, fn.__code__.co_filename, fn.__qualname__)
+
+    @functools.wraps(fn)
+    def _offload(f):
+        if not isinstance(f, flow.Flow):
+            raise NotImplementedError(
+                "Offload decorator not supported for '%s' method." % fn.__name__
+            )
+        state = f.get_state()
+        token = f._state_token()
+        # Submit before taking the reply: if this fails, e.g. because the
+        # pool is broken, the error is logged and the flow continues.
+        future = pool.submit(ref, state)
+        f.reply.take()
+
+        async def apply(future):
+            try:
+                new_state, unchanged = await future
+                for part in unchanged:
+                    new_state[part]["content"] = state[part]["content"]
+                changed = {k: v for k, v in new_state.items() if state.get(k) != v}
+                if changed and (f.reply.value == exceptions.Kill or f._state_token() != token):
+                    ctx.log.warn(
+                        "script.offload (%s): flow changed while the hook ran, "
+                        "discarding the changes made by the hook." % fn.__name__
+                    )
+                elif changed:
+                    # The live flow still has the state sent to the worker.
+                    f.set_state(dict(state, **changed))
+            except Exception as e:
+                ctx.log.error(
+                    "script.offload (%s): %s\n%s" % (
+                        fn.__name__,
+                        e,
+                        "".join(traceback.format_exception(type(e), e, e.__traceback__))
+                    )
+                )
+            if f.reply.state == "taken":
+                if not f.reply.has_message:
+                    f.reply.ack()
+                f.reply.commit()
+
+        asyncio.ensure_future(apply(asyncio.wrap_future(future)))
+
+    return _offload
@@ -1,12 +1,14 @@
+import functools
 import typing
 from typing import Any  # noqa
 from typing import MutableMapping  # noqa
 
+from mitmproxy.coretypes import revision
 from mitmproxy.coretypes import serializable
 from mitmproxy.utils import typecheck
 
 
-class StateObject(serializable.Serializable):
+class StateObject(revision.Revisioned, serializable.Serializable):
     """
     An object with serializable state.
 
@@ -21,74 +23,143 @@ class StateObject(serializable.Serializable):
     Serializable protocol.
     """
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)  # type: ignore
+        # Other attributes, such as a flow's reply, do not stamp a revision.
+        cls._revisioned = frozenset(cls._stateobject_attributes or ())
+
     def get_state(self):
         """
         Retrieve object state.
         """
-        state = {}
-        for attr, cls in self._stateobject_attributes.items():
-            val = getattr(self, attr)
-            state[attr] = get_state(cls, val)
-        return state
+        return {
+            attr: get(getattr(self, attr))
+            for attr, get, _ in _serializers(type(self))
+        }
+
+    def container_state(self) -> typing.List[typing.Any]:
+        """
+        The state of list and dict attributes of plain values. These may be
+        changed in place, which does not stamp a new revision.
+        """
+        return [
+            get(getattr(self, attr))
+            for attr, get, _ in _serializers(type(self))
+            if _is_container(type(self)._stateobject_attributes[attr])
+        ]
 
     def set_state(self, state):
         """
         Load object state from data returned by a get_state call.
         """
         state = state.copy()
-        for attr, cls in self._stateobject_attributes.items():
+        # Assign without stamping a revision for each attribute.
+        _setattr = object.__setattr__
+        for attr, _, make in _serializers(type(self)):
             val = state.pop(attr)
             if val is None:
-                setattr(self, attr, val)
+                _setattr(self, attr, val)
             else:
                 curr = getattr(self, attr)
                 if hasattr(curr, "set_state"):
                     curr.set_state(val)
                 else:
-                    setattr(self, attr, make_object(cls, val))
+                    _setattr(self, attr, make(val))
+        revision.stamp(self)
         if state:
             raise RuntimeWarning("Unexpected State in __setstate__: {}".format(state))
 
 
-def _process(typeinfo: typecheck.Type, val: typing.Any, make: bool) -> typing.Any:
-    if val is None:
-        return None
-    elif make and hasattr(typeinfo, "from_state"):
-        return typeinfo.from_state(val)
-    elif not make and hasattr(val, "get_state"):
-        return val.get_state()
+Serializer = typing.Callable[[typing.Any], typing.Any]
+
+_cache: typing.Dict[type, typing.List[typing.Tuple[str, Serializer, Serializer]]] = {}
+
+
+def _serializers(cls: type) -> typing.List[typing.Tuple[str, Serializer, Serializer]]:
+    """
+    The (attribute, get_state, make_object) functions of a StateObject
+    class, compiled from _stateobject_attributes on first use.
+    """
+    try:
+        return _cache[cls]
+    except KeyError:
+        ret = _cache[cls] = [
+            (attr, _compile(typeinfo, False), _compile(typeinfo, True))
+            for attr, typeinfo in cls._stateobject_attributes.items()  # type: ignore
+        ]
+        return ret
+
+
+def _is_container(typeinfo: typecheck.Type) -> bool:
+    typename = str(typeinfo)
+    if typename.startswith("typing.List"):
+        # Lists of objects, such as TCP messages, are tracked by their owner.
+        return not hasattr(typecheck.sequence_type(typeinfo), "from_state")
+    return typename.startswith("typing.Dict")
+
+
+@functools.lru_cache(maxsize=None)
+def _compile(typeinfo: typecheck.Type, make: bool) -> Serializer:
+    """
+    Build a function that creates an object from its state (make=True) or
+    returns the state of an object (make=False). Type inspection happens
+    here once, not on every call.
+    """
+    if make and hasattr(typeinfo, "from_state"):
+        from_state = typeinfo.from_state
+
+        def process(val):
+            return None if val is None else from_state(val)
+        return process
 
     typename = str(typeinfo)
 
     if typename.startswith("typing.List"):
-        T = typecheck.sequence_type(typeinfo)
-        return [_process(T, x, make) for x in val]
+        f = _compile(typecheck.sequence_type(typeinfo), make)
+
+        def convert(val):
+            return [f(x) for x in val]
     elif typename.startswith("typing.Tuple"):
         Ts = typecheck.tuple_types(typeinfo)
-        if len(Ts) != len(val):
-            raise ValueError("Invalid data. Expected {}, got {}.".format(Ts, val))
-        return tuple(
-            _process(T, x, make) for T, x in zip(Ts, val)
-        )
+        fs = [_compile(T, make) for T in Ts]
+
+        def convert(val):
+            if len(fs) != len(val):
+                raise ValueError("Invalid data. Expected {}, got {}.".format(Ts, val))
+            return tuple(f(x) for f, x in zip(fs, val))
     elif typename.startswith("typing.Dict"):
         k_cls, v_cls = typecheck.mapping_types(typeinfo)
-        return {
-            _process(k_cls, k, make): _process(v_cls, v, make)
-            for k, v in val.items()
-        }
+        kf = _compile(k_cls, make)
+        vf = _compile(v_cls, make)
+
+        def convert(val):
+            return {kf(k): vf(v) for k, v in val.items()}
     elif typename.startswith("typing.Any"):
-        # FIXME: Remove this when we remove flow.metadata
-        assert isinstance(val, (int, str, bool, bytes))
-        return val
+        def convert(val):
+            # FIXME: Remove this when we remove flow.metadata
+            assert isinstance(val, (int, str, bool, bytes))
+            return val
     else:
-        return typeinfo(val)
+        convert = typeinfo
+
+    if make:
+        def process(val):
+            return None if val is None else convert(val)
+    else:
+        def process(val):
+            if val is None:
+                return None
+            elif hasattr(val, "get_state"):
+                return val.get_state()
+            return convert(val)
+    return process
 
 
 def make_object(typeinfo: typecheck.Type, val: typing.Any) -> typing.Any:
     """Create an object based on the state given in val."""
-    return _process(typeinfo, val, True)
+    return _compile(typeinfo, True)(val)
 
 
 def get_state(typeinfo: typecheck.Type, val: typing.Any) -> typing.Any:
     """Get the state of the object given as val."""
-    return _process(typeinfo, val, False)
+    return _compile(typeinfo, False)(val)
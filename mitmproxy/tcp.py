@@ -3,10 +3,11 @@ import time
 from typing import List
 
 from mitmproxy import flow
+from mitmproxy.coretypes import revision
 from mitmproxy.coretypes import serializable
 
 
-class TCPMessage(serializable.Serializable):
+class TCPMessage(revision.Revisioned, serializable.Serializable):
 
     def __init__(self, from_client, content, timestamp=None):
         self.from_client = from_client
@@ -45,3 +46,10 @@ class TCPFlow(flow.Flow):
 
     def __repr__(self):
         return "<TCPFlow ({} messages)>".format(len(self.messages))
+
+    def _state_parts(self):
+        return super()._state_parts() + self.messages
+
+    def _state_token(self):
+        # Messages are appended and removed in place.
+        return super()._state_token() + (len(self.messages),)
@@ -19,6 +19,11 @@ class TestAddons(addonmanager.AddonManager):
             self.master.logs.append(args[0])
         super().trigger(event, *args, **kwargs)
 
+    async def async_trigger(self, event, *args, **kwargs):
+        if event == "log":
+            self.master.logs.append(args[0])
+        await super().async_trigger(event, *args, **kwargs)
+
 
 class RecordingMaster(mitmproxy.master.Master):
     def __init__(self, *args, **kwargs):
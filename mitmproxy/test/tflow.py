@@ -88,7 +88,7 @@ def twebsocketflow(client_conn=True, server_conn=True, messages=True, err=None,
     if err is True:
         err = terr()
 
-    f.messages = messages
+    f.messages = websocket.WebSocketMessages(messages)
     f.error = err
     f.reply = controller.DummyReply()
     return f
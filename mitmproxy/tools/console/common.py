@@ -213,8 +213,8 @@ def format_flow(f, focus, extended=False, hostheader=False, max_url_len=False):
         marked=f.marked,
     )
     if f.response:
-        if f.response.raw_content:
-            contentdesc = human.pretty_size(len(f.response.raw_content))
+        if f.response.raw_content_size:
+            contentdesc = human.pretty_size(f.response.raw_content_size)
         elif f.response.raw_content is None:
             contentdesc = "[content missing]"
         else:
@@ -1,4 +1,3 @@
-import hashlib
 import json
 import logging
 import os.path
@@ -50,9 +49,9 @@ def flow_to_json(flow: mitmproxy.flow.Flow) -> dict:
 
     if isinstance(flow, http.HTTPFlow):
         if flow.request:
-            if flow.request.raw_content:
-                content_length = len(flow.request.raw_content)
-                content_hash = hashlib.sha256(flow.request.raw_content).hexdigest()
+            if flow.request.raw_content_size:
+                content_length = flow.request.raw_content_size
+                content_hash = flow.request.raw_content_hash
             else:
                 content_length = None
                 content_hash = None
@@ -72,9 +71,9 @@ def flow_to_json(flow: mitmproxy.flow.Flow) -> dict:
                 "pretty_host": flow.request.pretty_host,
             }
         if flow.response:
-            if flow.response.raw_content:
-                content_length = len(flow.response.raw_content)
-                content_hash = hashlib.sha256(flow.response.raw_content).hexdigest()
+            if flow.response.raw_content_size:
+                content_length = flow.response.raw_content_size
+                content_hash = flow.response.raw_content_hash
             else:
                 content_length = None
                 content_hash = None
@@ -406,6 +405,15 @@ class Events(RequestHandler):
         self.write([logentry_to_json(e) for e in self.master.events.data])
 
 
+class AddonStats(RequestHandler):
+    def get(self):
+        stats = self.master.addons.stats
+        self.write(dict(
+            enabled=stats is not None,
+            handlers=stats.summary() if stats else [],
+        ))
+
+
 class Settings(RequestHandler):
     def get(self):
         self.write(dict(
@@ -485,6 +493,7 @@ class Application(tornado.web.Application):
             (
                 r"/flows/(?P<flow_id>[0-9a-f\-]+)/(?P<message>request|response)/content/(?P<content_view>[0-9a-zA-Z\-\_]+)(?:\.json)?",
                 FlowContentView),
+            (r"/addons/stats(?:\.json)?", AddonStats),
             (r"/settings(?:\.json)?", Settings),
             (r"/clear", ClearAll),
             (r"/options(?:\.json)?", Options),
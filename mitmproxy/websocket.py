@@ -1,17 +1,22 @@
-import time
+import collections.abc
+import contextlib
 import queue
-from typing import List, Optional
+import tempfile
+import threading
+import time
+from typing import IO, BinaryIO, List, Optional, cast
 
 from wsproto.frame_protocol import CloseReason
 from wsproto.frame_protocol import Opcode
 
 from mitmproxy import flow
 from mitmproxy.net import websockets
+from mitmproxy.coretypes import revision
 from mitmproxy.coretypes import serializable
 from mitmproxy.utils import strutils, human
 
 
-class WebSocketMessage(serializable.Serializable):
+class WebSocketMessage(revision.Revisioned, serializable.Serializable):
     """
     A WebSocket message sent from one endpoint to the other.
     """
@@ -56,6 +61,214 @@ class WebSocketMessage(serializable.Serializable):
         self.killed = True
 
 
+class WebSocketMessages(collections.abc.Sequence):
+    """
+    The sequence of messages exchanged over a WebSocket connection.
+
+    By default, all messages are kept in memory. Once a retention policy is
+    set with set_retention(), older messages are evicted to a temporary spill
+    file and read back lazily when accessed. Messages loaded from the spill
+    file are fresh copies, so modifying them has no effect.
+
+    Copies made with copy() share the spill file. It is append-only, and a
+    sequence only appends to it as long as no copy has done so, otherwise
+    it continues in a private copy of its own part of the file.
+    """
+
+    def __init__(self, messages=()) -> None:
+        self.max_count = 0
+        self.max_size = 0
+        self.spill_dir: Optional[str] = None
+
+        self.recent: List[WebSocketMessage] = []
+        """Messages that are still held in memory, oldest first."""
+        self.recent_size = 0
+        self.spill_file: Optional[IO[bytes]] = None
+        self.spill_lock = threading.Lock()
+        """Guards the spill file, which may be shared with copies."""
+        self.spill_size = 0
+        """The end of this sequence's part of the spill file."""
+        self.spill_offsets: List[int] = []
+        """Offsets of the spilled messages in the spill file."""
+        self.spilled_revision = 0
+        """The newest revision of the spilled messages."""
+        self.lock = threading.RLock()
+        self._snapshot = False
+        for m in messages:
+            self.append(m)
+
+    def set_retention(self, max_count: int = 0, max_size: Optional[int] = 0, spill_dir: Optional[str] = None) -> None:
+        """
+        Keep at most max_count messages or max_size bytes of message
+        content in memory. A value of 0 or None disables the respective limit.
+        """
+        with self.lock:
+            self.max_count = max_count or 0
+            self.max_size = max_size or 0
+            self.spill_dir = spill_dir
+            self._evict()
+
+    @property
+    def spilled(self) -> int:
+        """The number of messages that have been evicted to the spill file."""
+        return len(self.spill_offsets)
+
+    def append(self, message: WebSocketMessage) -> None:
+        with self.lock:
+            self.recent.append(message)
+            self.recent_size += len(message.content)
+            self._evict()
+
+    def _evict(self):
+        from mitmproxy.io import tnetstring  # mitmproxy.io imports this module.
+        while len(self.recent) > 1 and (
+            (self.max_count and len(self.recent) > self.max_count) or
+            (self.max_size and self.recent_size > self.max_size)
+        ):
+            message = self.recent.pop(0)
+            self.recent_size -= len(message.content)
+            self.spilled_revision = max(self.spilled_revision, revision.revision(message))
+            self._spill(tnetstring.dumps(message.get_state()))
+
+    def _spill(self, data: bytes) -> None:
+        with self.spill_lock:
+            shared = self.spill_file
+            if shared is not None:
+                shared.seek(0, 2)
+                if shared.tell() == self.spill_size:
+                    shared.write(data)
+                    self.spill_offsets.append(self.spill_size)
+                    self.spill_size += len(data)
+                    return
+        # There is no spill file yet, or a copy has appended to the shared one.
+        spill_file = tempfile.TemporaryFile(prefix="mitmproxy-websocket-", dir=self.spill_dir)
+        if shared is not None:
+            with self.spill_lock:
+                shared.seek(0)
+                _copy(shared, spill_file, self.spill_size)
+        self.spill_file = spill_file
+        self.spill_lock = threading.Lock()
+        self._spill(data)
+
+    def _load(self, index: int) -> WebSocketMessage:
+        from mitmproxy.io import tnetstring
+        with self.spill_lock:
+            # Messages have been spilled, so there is a spill file.
+            spill_file = cast(BinaryIO, self.spill_file)
+            spill_file.seek(self.spill_offsets[index])
+            state = tnetstring.load(spill_file)
+        return WebSocketMessage.from_state(state)
+
+    def __len__(self):
+        return len(self.spill_offsets) + len(self.recent)
+
+    def __getitem__(self, index):
+        with self.lock:
+            if isinstance(index, slice):
+                return [self[i] for i in range(*index.indices(len(self)))]
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("message index out of range")
+            if index < self.spilled:
+                return self._load(index)
+            return self.recent[index - self.spilled]
+
+    def __iter__(self):
+        i = 0
+        while True:
+            with self.lock:
+                if i >= len(self):
+                    return
+                message = self[i]
+            yield message
+            i += 1
+
+    def __eq__(self, other):
+        if isinstance(other, collections.abc.Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return "<WebSocketMessages ({} in memory, {} spilled)>".format(len(self.recent), self.spilled)
+
+    def __reduce__(self):
+        # Pickled as a plain list of messages, e.g. to pass flows between
+        # processes. Retention settings are not kept.
+        return WebSocketMessages, (list(self),)
+
+    def get_state(self):
+        with self.lock:
+            if self._snapshot:
+                return [m.get_state() for m in self.recent]
+            return [m.get_state() for m in self]
+
+    def set_state(self, state):
+        with self.lock:
+            self.recent = []
+            self.recent_size = 0
+            self.spill_offsets = []
+            self.spilled_revision = 0
+            # Copies may still use the spill file, it is closed once unreferenced.
+            self.spill_file = None
+            self.spill_lock = threading.Lock()
+            self.spill_size = 0
+            for s in state:
+                self.append(WebSocketMessage.from_state(s))
+
+    @contextlib.contextmanager
+    def spill_snapshot(self):
+        """
+        Freeze the message sequence and yield (spill_file, spill_size). While
+        the context is active, get_state() only covers the in-memory
+        messages, which directly follow the tnetstring-encoded spilled
+        messages in the spill file.
+        """
+        with self.lock:
+            self._snapshot = True
+            try:
+                yield self.spill_file, self.spill_size
+            finally:
+                self._snapshot = False
+
+    def write_spilled(self, fo) -> None:
+        """
+        Write the tnetstring-encoded spilled messages to fo.
+        """
+        with self.lock, self.spill_lock:
+            if self.spill_file is not None:
+                self.spill_file.seek(0)
+                _copy(self.spill_file, fo, self.spill_size)
+
+    def copy(self) -> "WebSocketMessages":
+        """
+        Copy the sequence with its retention settings. In-memory messages
+        are copied, the spill file is shared.
+        """
+        with self.lock:
+            c = WebSocketMessages()
+            c.max_count = self.max_count
+            c.max_size = self.max_size
+            c.spill_dir = self.spill_dir
+            c.recent = [m.copy() for m in self.recent]
+            c.recent_size = self.recent_size
+            c.spill_file = self.spill_file
+            c.spill_lock = self.spill_lock
+            c.spill_size = self.spill_size
+            c.spill_offsets = self.spill_offsets.copy()
+            c.spilled_revision = self.spilled_revision
+        return c
+
+
+def _copy(src, dst, size: int) -> None:
+    while size > 0:
+        chunk = src.read(min(size, 1024 * 1024))
+        if not chunk:
+            raise EOFError("spill file truncated")
+        dst.write(chunk)
+        size -= len(chunk)
+
+
 class WebSocketFlow(flow.Flow):
     """
     A WebSocketFlow is a simplified representation of a Websocket connection.
@@ -64,8 +277,8 @@ class WebSocketFlow(flow.Flow):
     def __init__(self, client_conn, server_conn, handshake_flow, live=None):
         super().__init__("websocket", client_conn, server_conn, live)
 
-        self.messages: List[WebSocketMessage] = []
-        """A list containing all WebSocketMessage's."""
+        self.messages: WebSocketMessages = WebSocketMessages()
+        """A sequence containing all WebSocketMessage's."""
         self.close_sender = 'client'
         """'client' if the client initiated connection closing."""
         self.close_code = CloseReason.NORMAL_CLOSURE
@@ -129,9 +342,37 @@ class WebSocketFlow(flow.Flow):
         f.set_state(state)
         return f
 
+    def __getstate__(self):
+        # Pending injected messages belong to the live connection.
+        d = super().__getstate__()
+        del d["_inject_messages_client"]
+        del d["_inject_messages_server"]
+        return d
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._inject_messages_client = queue.Queue(maxsize=1)
+        self._inject_messages_server = queue.Queue(maxsize=1)
+
+    def copy(self):
+        # Spilled messages are shared with the copy instead of being loaded.
+        with self.messages.spill_snapshot():
+            f = super().copy()
+        f.messages = self.messages.copy()
+        return f
+
     def __repr__(self):
         return "<WebSocketFlow ({} messages)>".format(len(self.messages))
 
+    def _state_parts(self):
+        # Spilled messages can no longer be changed.
+        return super()._state_parts() + self.messages.recent
+
+    def _state_token(self):
+        rev, containers = super()._state_token()
+        # Messages are appended in place.
+        return max(rev, self.messages.spilled_revision), containers, len(self.messages)
+
     def message_info(self, message: WebSocketMessage) -> str:
         return "{client} {direction} WebSocket {type} message {direction} {server}{endpoint}".format(
             type=message.type,
@@ -0,0 +1,64 @@
+"""
+    Microbenchmark for the addon event dispatch overhead with the default
+    addon set loaded. Run it directly:
+
+        python ./addon_dispatch.py
+"""
+import timeit
+
+from mitmproxy import addonmanager
+from mitmproxy import addons
+from mitmproxy import exceptions
+from mitmproxy.test import taddons
+from mitmproxy.test import tflow
+
+
+EVENTS = ["requestheaders", "request", "response", "tcp_message", "websocket_message", "update", "log"]
+MIN_RUNTIME = 0.2
+
+
+def measure(func):
+    number = 1
+    while True:
+        elapsed = timeit.timeit(func, number=number)
+        if elapsed >= MIN_RUNTIME:
+            return elapsed / number
+        number *= 4
+
+
+def traverse_all(manager, name, *args):
+    """
+        Dispatch by walking the whole addon tree for every event, for comparison.
+    """
+    for i in manager.chain:
+        try:
+            with addonmanager.safecall():
+                manager.invoke_addon(i, name, *args)
+        except exceptions.AddonHalt:
+            return
+
+
+def main():
+    with taddons.context(*addons.default_addons(), loadcore=False) as tctx:
+        manager = tctx.master.addons
+        args = dict(
+            requestheaders=tflow.tflow(),
+            request=tflow.tflow(),
+            response=tflow.tflow(resp=True),
+            tcp_message=tflow.ttcpflow(),
+            websocket_message=tflow.twebsocketflow(),
+            update=[tflow.tflow()],
+            log=None,
+        )
+        print("{:>18} {:>9} {:>14} {:>14}".format("event", "handlers", "traverse", "dispatch"))
+        for name in EVENTS:
+            handlers = sum(len(group) for _, group in manager.get_handlers(name))
+            traverse = measure(lambda: traverse_all(manager, name, args[name]))
+            dispatch = measure(lambda: manager.trigger(name, args[name]))
+            print("{:>18} {:>9} {:>11.2f} us {:>11.2f} us".format(
+                name, handlers, traverse * 1e6, dispatch * 1e6
+            ))
+
+
+if __name__ == "__main__":
+    main()
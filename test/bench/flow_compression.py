@@ -0,0 +1,83 @@
+"""
+    Microbenchmark for compressed flow files: write and read throughput and
+    compression ratio for different zlib levels. Pass flow dumps to
+    benchmark them, otherwise synthetic flows with JSON bodies are used:
+
+        python ./flow_compression.py [flowfile ...]
+"""
+import io
+import json
+import sys
+import timeit
+
+from mitmproxy.io import FlowReader, FlowWriter
+from mitmproxy.io import compressed
+from mitmproxy.test import tflow
+
+MIN_RUNTIME = 0.2
+LEVELS = [1, 6, 9]
+
+
+def measure(func):
+    number = 1
+    while True:
+        elapsed = timeit.timeit(func, number=number)
+        if elapsed >= MIN_RUNTIME:
+            return elapsed / number
+        number *= 4
+
+
+def synthetic():
+    flows = []
+    for i in range(200):
+        f = tflow.tflow(resp=True)
+        f.request.path = "/api/items?page=%d" % i
+        f.response.headers["content-type"] = "application/json"
+        f.response.content = json.dumps([
+            dict(id=i * 100 + j, name="item %d" % j, tags=["a", "b", "c"], price=j * 1.5)
+            for j in range(100)
+        ]).encode()
+        flows.append(f)
+    return flows
+
+
+def write(flows, level):
+    sio = io.BytesIO()
+    if level is None:
+        w = FlowWriter(sio)
+    else:
+        w = FlowWriter(compressed.BlockWriter(sio, level=level))
+    for f in flows:
+        w.add(f)
+    w.fo.flush()
+    return sio.getvalue()
+
+
+def read(data):
+    return list(FlowReader(io.BytesIO(data)).stream())
+
+
+def main():
+    if len(sys.argv) > 1:
+        flows = []
+        for path in sys.argv[1:]:
+            with open(path, "rb") as f:
+                flows.extend(FlowReader(f).stream())
+    else:
+        flows = synthetic()
+    plain = write(flows, None)
+    print("{} flows, {} bytes uncompressed".format(len(flows), len(plain)))
+    print("{:>8} {:>10} {:>8} {:>14} {:>14}".format("level", "size", "ratio", "write", "read"))
+    for level in [None] + LEVELS:
+        data = write(flows, level)
+        print("{:>8} {:>10} {:>7.1f}x {:>9.1f} MB/s {:>9.1f} MB/s".format(
+            "none" if level is None else level,
+            len(data),
+            len(plain) / len(data),
+            len(plain) / measure(lambda: write(flows, level)) / 1e6,
+            len(plain) / measure(lambda: read(data)) / 1e6,
+        ))
+
+
+if __name__ == "__main__":
+    main()
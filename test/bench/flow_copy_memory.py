@@ -0,0 +1,55 @@
+"""
+    Microbenchmark for the memory cost of flow duplication. Bodies are
+    immutable and shared between a flow, its copies and its backup, and
+    spilled WebSocket messages stay in the shared spill file:
+
+        python ./flow_copy_memory.py
+"""
+import tracemalloc
+
+from mitmproxy import websocket
+from mitmproxy.test import tflow
+
+BODY_SIZE = 50 * 1024 * 1024
+MESSAGES = 2000
+MESSAGE_SIZE = 10 * 1024
+
+
+def measure(func):
+    """Peak memory allocated while calling func."""
+    tracemalloc.start()
+    try:
+        result = func()  # noqa: F841
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def http_flow():
+    f = tflow.tflow(resp=True)
+    f.response.content = b"x" * BODY_SIZE
+    return f
+
+
+def websocket_flow():
+    f = tflow.twebsocketflow()
+    f.messages.set_retention(max_count=10)
+    for i in range(MESSAGES):
+        f.messages.append(websocket.WebSocketMessage(websocket.Opcode.BINARY, i % 2 == 0, b"x" * MESSAGE_SIZE))
+    return f
+
+
+def main():
+    f = http_flow()
+    print("HTTP flow with a {} MB body".format(BODY_SIZE // 1024 // 1024))
+    print("{:>12} {:>10.1f} KB".format("copy", measure(f.copy) / 1024))
+    print("{:>12} {:>10.1f} KB".format("backup", measure(f.backup) / 1024))
+    print("{:>12} {:>10.1f} KB".format("revert", measure(f.revert) / 1024))
+
+    f = websocket_flow()
+    print("WebSocket flow with {} spilled messages of {} KB".format(f.messages.spilled, MESSAGE_SIZE // 1024))
+    print("{:>12} {:>10.1f} KB".format("copy", measure(f.copy) / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+    Microbenchmark for flow state serialization, which is used whenever a
+    flow is saved, copied, backed up or sent to mitmweb:
+
+        python ./flow_state.py
+"""
+import time
+
+from mitmproxy import http
+from mitmproxy.io import tnetstring
+from mitmproxy.test import tflow
+
+NUMBER = 2000
+REPEAT = 5
+
+
+def measure(func, args):
+    """Best time per call over REPEAT runs of NUMBER calls."""
+    best = float("inf")
+    for _ in range(REPEAT):
+        argv = args()
+        start = time.perf_counter()
+        for a in argv:
+            func(a)
+        best = min(best, time.perf_counter() - start)
+    return best / NUMBER
+
+
+def main():
+    f = tflow.tflow(resp=True)
+    for i in range(20):
+        f.request.headers["x-header-%d" % i] = "value %d" % i
+        f.response.headers["x-header-%d" % i] = "value %d" % i
+    # from_state consumes its argument, so each call gets a fresh state.
+    data = tnetstring.dumps(f.get_state())
+    results = [
+        ("get_state", measure(lambda f: f.get_state(), lambda: [f] * NUMBER)),
+        ("from_state", measure(http.HTTPFlow.from_state, lambda: [tnetstring.loads(data) for _ in range(NUMBER)])),
+        ("copy", measure(lambda f: f.copy(), lambda: [f] * NUMBER)),
+    ]
+    for name, elapsed in results:
+        print("{:>12} {:>10.1f} us/flow {:>10.0f} flows/s".format(name, elapsed * 1e6, 1 / elapsed))
+
+
+if __name__ == "__main__":
+    main()
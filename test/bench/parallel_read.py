@@ -0,0 +1,59 @@
+"""
+    Benchmark for parallel decoding of flow files: read throughput with 1 to
+    N worker processes, compared to the sequential FlowReader. Pass a flow
+    dump to benchmark it, otherwise a synthetic dump is written to a
+    temporary file:
+
+        python ./parallel_read.py [flowfile] [max workers]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from mitmproxy.io import FlowReader, FlowWriter, ParallelFlowReader
+from mitmproxy.test import tflow
+
+
+def synthetic(path):
+    with open(path, "wb") as f:
+        w = FlowWriter(f)
+        for i in range(20000):
+            flow = tflow.tflow(resp=True)
+            flow.request.path = "/items/%d" % i
+            for j in range(20):
+                flow.response.headers["x-header-%d" % j] = "value %d" % j
+            w.add(flow)
+
+
+def measure(func):
+    start = time.perf_counter()
+    n = sum(1 for _ in func())
+    return n, time.perf_counter() - start
+
+
+def sequential(path):
+    with open(path, "rb") as f:
+        yield from FlowReader(f).stream()
+
+
+def main():
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    with tempfile.TemporaryDirectory() as tmp:
+        if len(sys.argv) > 1 and sys.argv[1]:
+            path = sys.argv[1]
+        else:
+            path = os.path.join(tmp, "flows")
+            synthetic(path)
+        size = os.path.getsize(path)
+        n, base = measure(lambda: sequential(path))
+        print("{} flows, {} bytes".format(n, size))
+        print("{:>10} {:>14} {:>10}".format("workers", "read", "speedup"))
+        print("{:>10} {:>9.1f} MB/s {:>9.2f}x".format("sequential", size / base / 1e6, 1))
+        for workers in range(1, max_workers + 1):
+            _, elapsed = measure(lambda: ParallelFlowReader(path, workers).stream())
+            print("{:>10} {:>9.1f} MB/s {:>9.2f}x".format(workers, size / elapsed / 1e6, base / elapsed))
+
+
+if __name__ == "__main__":
+    main()
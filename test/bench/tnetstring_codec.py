@@ -0,0 +1,74 @@
+"""
+    Microbenchmark for the tnetstring codec used by mitmproxy's flow files.
+    Pass flow dumps to benchmark them, otherwise a synthetic dump with many
+    headers and WebSocket messages is used:
+
+        python ./tnetstring_codec.py [flowfile ...]
+"""
+import io
+import sys
+import timeit
+
+from mitmproxy.io import tnetstring
+from mitmproxy.test import tflow
+from mitmproxy.websocket import WebSocketMessage
+
+MIN_RUNTIME = 0.2
+
+
+def measure(func):
+    number = 1
+    while True:
+        elapsed = timeit.timeit(func, number=number)
+        if elapsed >= MIN_RUNTIME:
+            return elapsed / number
+        number *= 4
+
+
+def synthetic():
+    f = tflow.tflow(resp=True)
+    for i in range(200):
+        f.request.headers["x-header-%d" % i] = "value %d" % i
+        f.response.headers["x-header-%d" % i] = "value %d" % i
+    ws = tflow.twebsocketflow(messages=[])
+    for i in range(20000):
+        ws.messages.append(WebSocketMessage(1, i % 2 == 0, b"message %d" % i))
+    return tnetstring.dumps(f.get_state()) * 10 + tnetstring.dumps(ws.get_state())
+
+
+def load_all(data):
+    fo = io.BufferedReader(io.BytesIO(data))
+    ret = []
+    while True:
+        try:
+            ret.append(tnetstring.load(fo))
+        except ValueError:
+            return ret
+
+
+def bench(data):
+    states = load_all(data)
+    chunks = [tnetstring.dumps(s) for s in states]
+    return {
+        "loads": measure(lambda: [tnetstring.loads(c) for c in chunks]),
+        "load": measure(lambda: load_all(data)),
+        "dumps": measure(lambda: [tnetstring.dumps(s) for s in states]),
+    }
+
+
+def main():
+    if len(sys.argv) > 1:
+        dumps = [(path, open(path, "rb").read()) for path in sys.argv[1:]]
+    else:
+        dumps = [("synthetic", synthetic())]
+    columns = ["loads", "load", "dumps"]
+    print("{:>30} {:>10} ".format("dump", "size") + " ".join("{:>14}".format(c) for c in columns))
+    for name, data in dumps:
+        results = bench(data)
+        print("{:>30} {:>10} ".format(name[-30:], len(data)) + " ".join(
+            "{:>9.1f} MB/s".format(len(data) / results[c] / 1e6) for c in columns
+        ))
+
+
+if __name__ == "__main__":
+    main()
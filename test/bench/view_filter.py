@@ -0,0 +1,46 @@
+"""
+    Microbenchmark for changing the view filter on a large store. Filters
+    on indexed predicates only check the candidate flows, others check
+    every flow in the store:
+
+        python ./view_filter.py [flows]
+"""
+import sys
+import time
+
+from mitmproxy import flowfilter
+from mitmproxy.addons import view
+from mitmproxy.test import tflow
+
+FILTERS = [
+    "~d host7.example",
+    "~m post & ~c 404",
+    "~t json",
+    "~u /item/7",
+]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    flows = []
+    for i in range(count):
+        f = tflow.tflow(resp=True)
+        f.request.host = "host%d.example" % (i % 100)
+        f.request.path = "/item/%d" % i
+        f.request.method = "POST" if i % 10 == 0 else "GET"
+        f.response.status_code = 404 if i % 7 == 0 else 200
+        f.response.headers["content-type"] = "application/json" if i % 50 == 0 else "text/html"
+        flows.append(f)
+    v = view.View()
+    v.add(flows)
+    print("{} flows".format(count))
+    for spec in FILTERS:
+        flt = flowfilter.parse(spec)
+        start = time.perf_counter()
+        v.set_filter(flt)
+        elapsed = time.perf_counter() - start
+        print("{:>20} {:>8} matches {:>10.1f} ms".format(spec, len(v), elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
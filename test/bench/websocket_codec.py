@@ -0,0 +1,52 @@
+"""
+    Microbenchmark for the WebSocket frame codec used by mitmproxy, pathod and
+    pathoc. Run it directly:
+
+        python ./websocket_codec.py
+"""
+import io
+import os
+import timeit
+
+from mitmproxy.net import tcp
+from mitmproxy.net import websockets
+
+
+SIZES = [16, 256, 4 * 1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+MIN_RUNTIME = 0.2
+
+
+def measure(func):
+    number = 1
+    while True:
+        elapsed = timeit.timeit(func, number=number)
+        if elapsed >= MIN_RUNTIME:
+            return elapsed / number
+        number *= 4
+
+
+def bench(size):
+    payload = os.urandom(size)
+    masker = websockets.Masker(os.urandom(4))
+    frame = websockets.Frame(payload, fin=True, opcode=websockets.OPCODE.BINARY, masking_key=os.urandom(4))
+    raw = bytes(frame)
+    return {
+        "mask": measure(lambda: masker.mask(1, payload)),
+        "serialize": measure(lambda: bytes(frame)),
+        "from_file": measure(lambda: websockets.Frame.from_file(tcp.Reader(io.BytesIO(raw)))),
+        "from_buffer": measure(lambda: websockets.Frame.from_buffer(raw)),
+    }
+
+
+def main():
+    columns = ["mask", "serialize", "from_file", "from_buffer"]
+    print("{:>10} ".format("size") + " ".join("{:>14}".format(c) for c in columns))
+    for size in SIZES:
+        results = bench(size)
+        print("{:>10} ".format(size) + " ".join(
+            "{:>9.1f} MB/s".format(size / results[c] / 1e6) for c in columns
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -50,17 +50,17 @@ class TestHARDump:
 
             CA = cookies.CookieAttrs
 
-            f = a.format_cookies([("n", "v", CA([("k", "v")]))])[0]
+            f = a.har.format_cookies([("n", "v", CA([("k", "v")]))])[0]
             assert f['name'] == "n"
             assert f['value'] == "v"
             assert not f['httpOnly']
             assert not f['secure']
 
-            f = a.format_cookies([("n", "v", CA([("httponly", None), ("secure", None)]))])[0]
+            f = a.har.format_cookies([("n", "v", CA([("httponly", None), ("secure", None)]))])[0]
             assert f['httpOnly']
             assert f['secure']
 
-            f = a.format_cookies([("n", "v", CA([("expires", "Mon, 24-Aug-2037 00:00:00 GMT")]))])[0]
+            f = a.har.format_cookies([("n", "v", CA([("expires", "Mon, 24-Aug-2037 00:00:00 GMT")]))])[0]
             assert f['expires']
 
     def test_binary(self, tmpdir, tdata):
@@ -18,6 +18,24 @@ def test_set():
             tctx.command(sa.set, "nonexistent")
 
 
+def test_addons_stats():
+    sa = core.Core()
+    with taddons.context(loadcore=False) as tctx:
+        tctx.master.addons.add(sa)
+        with pytest.raises(exceptions.CommandError):
+            sa.addons_stats()
+        tctx.configure(sa, addon_stats=True)
+        tctx.master.addons.trigger("configure", {"mode"})
+        stats = tctx.master.addons.stats
+        assert stats
+        tctx.master.addons.trigger("configure", {"mode"})
+        assert tctx.master.addons.stats is stats
+        rows = sa.addons_stats()
+        assert rows[0][:4] == ["core", "configure", "2", "0"]
+        tctx.configure(sa, addon_stats=False)
+        assert tctx.master.addons.stats is None
+
+
 def test_resume():
     sa = core.Core()
     with taddons.context(loadcore=False):
@@ -160,6 +178,9 @@ def test_validation_simple():
         with pytest.raises(exceptions.OptionsError):
             tctx.configure(sa, body_size_limit = "invalid")
         tctx.configure(sa, body_size_limit = "1m")
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(sa, websocket_retain_size = "invalid")
+        tctx.configure(sa, websocket_retain_size = "1m")
 
         with pytest.raises(exceptions.OptionsError, match="mutually exclusive"):
             tctx.configure(
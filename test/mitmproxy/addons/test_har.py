@@ -0,0 +1,186 @@
+import json
+from unittest import mock
+
+import pytest
+
+from mitmproxy import exceptions
+from mitmproxy.addons import har
+from mitmproxy.net.http import cookies
+from mitmproxy.test import taddons
+from mitmproxy.test import tflow
+from mitmproxy.test import tutils
+
+
+def flow(resp_content=b"message"):
+    times = dict(
+        timestamp_start=746203272,
+        timestamp_end=746203272,
+    )
+    return tflow.tflow(
+        req=tutils.treq(method=b"GET", **times),
+        resp=tutils.tresp(content=resp_content, **times)
+    )
+
+
+def rd(p):
+    with open(p, "r") as f:
+        return json.load(f)["log"]["entries"]
+
+
+def test_entry():
+    f = flow(resp_content=b"foo" + b"\xFF" * 10)
+    e = har.entry(f)
+    assert e["request"]["url"] == f.request.url
+    assert e["response"]["content"]["encoding"] == "base64"
+    assert e["timings"]["connect"] > -1
+    assert har.entry(f, new_connection=False)["timings"]["connect"] == -1
+
+    f = flow()
+    f.request.method = "POST"
+    f.request.headers["content-type"] = "application/x-www-form-urlencoded"
+    f.request.content = b"foo=bar&baz=s%c3%bc%c3%9f"
+    f.response.headers["random-junk"] = bytes(range(256))
+    f.response.headers["content-encoding"] = "gzip"
+    f.response.raw_content = b"invalid"
+    e = har.entry(f)
+    assert e["request"]["postData"]["params"][0] == {"name": "foo", "value": "bar"}
+    assert e["response"]["content"]["size"] == 7
+    json.dumps(e)
+
+
+def test_format_cookies():
+    CA = cookies.CookieAttrs
+
+    f = har.format_cookies([("n", "v", CA([("k", "v")]))])[0]
+    assert f['name'] == "n"
+    assert f['value'] == "v"
+    assert not f['httpOnly']
+    assert not f['secure']
+
+    f = har.format_cookies([("n", "v", CA([("httponly", None), ("secure", None)]))])[0]
+    assert f['httpOnly']
+    assert f['secure']
+
+    f = har.format_cookies([("n", "v", CA([("expires", "Mon, 24-Aug-2037 00:00:00 GMT")]))])[0]
+    assert f['expires']
+
+
+def test_writer(tmpdir):
+    p = str(tmpdir.join("foo.har"))
+    w = har.HARWriter(p)
+    w.close()
+    assert rd(p) == []
+
+    w = har.HARWriter(p)
+    flows = [flow(), flow()]
+    flows[1].server_conn = flows[0].server_conn
+    for f in flows:
+        w.add(f)
+    w.close()
+    entries = rd(p)
+    assert len(entries) == 2
+    assert entries[0]["timings"]["connect"] > -1
+    assert entries[1]["timings"]["connect"] == -1
+
+
+def test_writer_split(tmpdir):
+    p = str(tmpdir.join("foo.har"))
+    w = har.HARWriter(p, max_size=1)
+    for _ in range(3):
+        w.add(flow())
+    w.close()
+    assert w.paths == [str(tmpdir.join("foo.%s.har" % i)) for i in range(3)]
+    assert [len(rd(x)) for x in w.paths] == [1, 1, 1]
+
+    w = har.HARWriter(str(tmpdir.join("bar-{n}.har")), max_size=1)
+    w.close()
+    assert w.paths == [str(tmpdir.join("bar-0.har"))]
+
+
+def test_writer_connections(tmpdir, monkeypatch):
+    monkeypatch.setattr(har, "MAX_CONNECTIONS", 2)
+    w = har.HARWriter(str(tmpdir.join("foo.har")))
+    flows = [flow() for _ in range(3)]
+    for f in flows:
+        assert w._new_connection(f)
+    assert not w._new_connection(flows[2])
+    assert w._new_connection(flows[0])
+    w.close()
+
+
+def test_configure(tmpdir):
+    h = har.Har()
+    with taddons.context(h) as tctx:
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(h, har_file=str(tmpdir))
+        with pytest.raises(exceptions.OptionsError, match="Invalid filter"):
+            tctx.configure(h, har_filter="~~")
+        with pytest.raises(exceptions.OptionsError, match="Invalid size"):
+            tctx.configure(h, har_split_size="foo")
+        tctx.configure(h, har_filter="foo")
+        assert h.filt
+        tctx.configure(h, har_filter=None)
+        assert not h.filt
+
+
+def test_stream(tmpdir):
+    h = har.Har()
+    with taddons.context(h) as tctx:
+        p = str(tmpdir.join("foo.har"))
+        tctx.configure(h, har_file=p, har_filter="~u /foo")
+        f = flow()
+        f.request.path = "/foo"
+        h.response(f)
+        h.response(flow())
+        tctx.configure(h, har_file=None)
+        assert [e["request"]["url"] for e in rd(p)] == [f.request.url]
+
+        tctx.configure(h, har_file=p, har_filter=None, har_split_size="1")
+        h.response(flow())
+        h.response(flow())
+        h.done()
+        assert len(rd(str(tmpdir.join("foo.1.har")))) == 1
+
+
+def test_disabled():
+    h = har.Har()
+    with taddons.context(h) as tctx:
+        tctx.configure(h, har_filter="~u /foo")
+        with mock.patch("mitmproxy.addons.har.entry") as entry:
+            with mock.patch("mitmproxy.flowfilter.match") as match:
+                h.response(flow())
+        assert not entry.called
+        assert not match.called
+
+
+@pytest.mark.asyncio
+async def test_stream_error(tmpdir):
+    h = har.Har()
+    with taddons.context(h) as tctx:
+        tctx.configure(h, har_file=str(tmpdir.join("foo.har")))
+        h.writer.fo = mock.Mock(write=mock.Mock(side_effect=IOError("disk full")))
+        h.response(flow())
+        assert not h.writer
+        assert await tctx.master.await_log("Error writing to HAR file")
+
+
+@pytest.mark.asyncio
+async def test_offline(tmpdir):
+    h = har.Har()
+    with taddons.context(h) as tctx:
+        p = str(tmpdir.join("foo.har"))
+        tctx.configure(h, har_file=p)
+        await tctx.master.load_flow(flow())
+        await tctx.master.load_flow(tflow.tflow())
+        h.done()
+        assert len(rd(p)) == 1
+
+
+def test_file_command(tmpdir):
+    h = har.Har()
+    with taddons.context(h):
+        p = str(tmpdir.join("foo.har"))
+        h.file([flow(), tflow.tflow(), tflow.ttcpflow()], p)
+        assert len(rd(p)) == 1
+        with pytest.raises(exceptions.CommandError):
+            h.file([flow()], str(tmpdir))
@@ -83,6 +83,26 @@ class TestReadFile:
                 await rf.load_flows(corrupt_data)
             assert await tctx.master.await_log("file corrupted")
 
+    @pytest.mark.asyncio
+    async def test_parallel(self, tmpdir, data, corrupt_data):
+        rf = readfile.ReadFile()
+        with taddons.context(rf) as tctx:
+            tf = tmpdir.join("tfile")
+            tf.write(data.getvalue())
+            tctx.configure(rf, readfile_workers=2, readfile_filter="~tcp")
+            with asynctest.patch('mitmproxy.master.Master.load_flow') as mck:
+                assert await rf.load_flows_from_path(str(tf)) == 2
+                assert mck.await_count == 2
+
+            tf.write(corrupt_data.getvalue())
+            with pytest.raises(exceptions.FlowReadException):
+                await rf.load_flows_from_path(str(tf))
+            assert await tctx.master.await_log("corrupted")
+
+            with pytest.raises(exceptions.FlowReadException):
+                await rf.load_flows_from_path("nonexistent")
+            assert await tctx.master.await_log("nonexistent")
+
     @pytest.mark.asyncio
     async def test_nonexistent_file(self):
         rf = readfile.ReadFile()
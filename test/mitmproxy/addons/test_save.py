@@ -1,9 +1,15 @@
+import os
+import threading
+import time
+from unittest import mock
+
 import pytest
 
 from mitmproxy.test import taddons
 from mitmproxy.test import tflow
 
 from mitmproxy import io
+from mitmproxy.io import compressed
 from mitmproxy import exceptions
 from mitmproxy.addons import save
 from mitmproxy.addons import view
@@ -56,6 +62,296 @@ def test_websocket(tmpdir):
         assert rd(p)
 
 
+def rd_index(p):
+    with open(io.index_path(p), "rb") as f:
+        return io.read_index(f)
+
+
+def test_stream_index(tmpdir):
+    sa = save.Save()
+    with taddons.context(sa) as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(sa, save_stream_file=p, save_stream_index=True)
+        f = tflow.tflow(resp=True)
+        sa.request(f)
+        sa.response(f)
+        tctx.configure(sa, save_stream_file="+" + p)
+        f2 = tflow.tflow(resp=True)
+        sa.request(f2)
+        sa.response(f2)
+        f3 = tflow.ttcpflow()
+        sa.tcp_start(f3)
+        sa.tcp_end(f3)
+        tctx.configure(sa, save_stream_file=None)
+
+        entries = rd_index(p)
+        assert [e["id"] for e in entries] == [f.id, f2.id, f3.id]
+        with open(p, "rb") as fo:
+            assert io.FlowReader(fo).read_at(entries[1]).id == f2.id
+        # Entries made from the flow state match those made from the flows.
+        with open(p, "rb") as fo:
+            assert io.FlowReader(fo).build_index() == entries
+
+
+def test_stream_compress(tmpdir):
+    sa = save.Save()
+    with taddons.context(sa) as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(sa, save_stream_file=p, save_stream_compress=True, save_stream_index=True)
+        f = tflow.tflow(resp=True)
+        sa.request(f)
+        sa.response(f)
+        tctx.configure(sa, save_stream_file=None)
+        with open(p, "rb") as fo:
+            assert compressed.is_compressed(fo)
+
+        # Appending keeps the format of the existing file.
+        tctx.configure(sa, save_stream_file="+" + p, save_stream_compress=False)
+        f2 = tflow.tflow(resp=True)
+        sa.request(f2)
+        sa.response(f2)
+        tctx.configure(sa, save_stream_file=None)
+        assert [x.id for x in rd(p)] == [f.id, f2.id]
+        with open(p, "rb") as fo:
+            assert io.FlowReader(fo).read_at(rd_index(p)[1]).id == f2.id
+
+        tctx.configure(sa, save_stream_file=p)
+        tctx.configure(sa, save_stream_file=None)
+        with open(p, "rb") as fo:
+            assert not compressed.is_compressed(fo)
+
+
+def test_index_command(tmpdir):
+    sa = save.Save()
+    with taddons.context(sa) as tctx:
+        p = str(tmpdir.join("foo"))
+        flows = [tflow.tflow(resp=True), tflow.tflow(resp=True)]
+        sa.save(flows, p)
+        tctx.master.commands.call_strings("save.index", [p])
+        assert [e["id"] for e in rd_index(p)] == [f.id for f in flows]
+
+        with pytest.raises(exceptions.CommandError):
+            sa.index(str(tmpdir.join("bar")))
+        with open(p, "wb") as fo:
+            fo.write(b"bogus")
+        with pytest.raises(exceptions.CommandError):
+            sa.index(p)
+
+
+class SlowWriter:
+    def __init__(self):
+        self.fo = mock.Mock()
+        self.index = None
+        self.flows = []
+        self.gate = threading.Event()
+
+    def add(self, f):
+        self.gate.wait()
+        if f.request.path == "/error":
+            raise IOError("disk full")
+        self.flows.append(f)
+
+    def add_state(self, state):
+        self.gate.wait()
+        self.flows.append(state)
+
+
+def test_stream_writer_drop():
+    w = SlowWriter()
+    s = save.StreamWriter(w, max_queue=1, overflow="drop", sync="none")
+    flows = [tflow.tflow() for _ in range(5)]
+    assert s.add(flows[0])
+    while not s.queue.empty():
+        time.sleep(0.01)
+    assert s.add(flows[1])
+    assert not s.add(flows[2])
+    assert s.dropped == 1
+    w.gate.set()
+    s.close()
+    assert w.flows == flows[:2]
+    assert w.fo.close.called
+    assert not w.fo.flush.called
+
+
+def test_stream_writer_error():
+    w = SlowWriter()
+    w.gate.set()
+    s = save.StreamWriter(w, sync="flush")
+    f = tflow.tflow()
+    f.request.path = "/error"
+    s.add(f)
+    s.add(tflow.tflow())
+    s.close()
+    assert str(s.error) == "disk full"
+    assert not w.flows
+
+
+def test_stream_sync(tmpdir):
+    sa = save.Save()
+    with taddons.context(sa) as tctx:
+        p = str(tmpdir.join("foo"))
+        tctx.configure(
+            sa, save_stream_file=p, save_stream_index=True, save_stream_sync="fsync"
+        )
+        f = tflow.tflow(resp=True)
+        sa.request(f)
+        sa.response(f)
+        start = time.time()
+        # The flow file is synced before the index.
+        while not rd_index(p) and time.time() - start < 5:
+            time.sleep(0.01)
+        assert rd(p)
+        assert rd_index(p)
+        tctx.configure(sa, save_stream_file=None)
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(sa, save_stream_queue=-1)
+
+
+@pytest.mark.asyncio
+async def test_stream_errors():
+    sa = save.Save()
+    with taddons.context(sa) as tctx:
+        w = SlowWriter()
+        sa.stream = save.StreamWriter(w, max_queue=1, overflow="drop", sync="none")
+        sa.response(tflow.tflow(resp=True))
+        while not sa.stream.queue.empty():
+            time.sleep(0.01)
+        sa.response(tflow.tflow(resp=True))
+        sa.response(tflow.tflow(resp=True))
+        assert await tctx.master.await_log("dropping flows")
+
+        w.gate.set()
+        sa.stream.error = ValueError("oops")
+        sa.response(tflow.tflow(resp=True))
+        assert not sa.stream
+        assert await tctx.master.await_log("oops")
+        assert await tctx.master.await_log("dropped 1 flows")
+
+
+def test_stream_copies_flows():
+    sa = save.Save()
+    with taddons.context(sa):
+        w = SlowWriter()
+        sa.stream = save.StreamWriter(w, sync="none")
+        f = tflow.tflow(resp=True)
+        sa.request(f)
+        sa.response(f)
+        f.request.path = "/changed"
+        w.gate.set()
+        sa.done()
+        assert len(w.flows) == 1
+        assert w.flows[0]["id"] == f.id
+        assert w.flows[0]["request"]["path"] == b"/path"
+
+
+def test_snapshot():
+    f = tflow.tflow(resp=True)
+    assert save.snapshot(f) == f.get_state()
+    # The spill file is shared with a copy instead of being loaded.
+    f = tflow.twebsocketflow()
+    f.messages.set_retention(max_count=1)
+    c = save.snapshot(f)
+    assert c is not f
+    assert c.id == f.id
+    assert c.messages.spill_file is f.messages.spill_file
+
+
+def open_writer(path):
+    return io.FlowWriter(open(path.lstrip("+"), "ab" if path.startswith("+") else "wb"))
+
+
+def test_rotating_writer_paths(tmpdir):
+    p = str(tmpdir.join("foo"))
+    w = save.RotatingFlowWriter(p, open_writer, max_flows=1)
+    assert w.path(3) == p + ".3"
+    w.template = "+" + p + "-{n}-%Y"
+    assert w.path(3) == "+" + p + "-3-" + time.strftime("%Y")
+    w.fo.close()
+
+
+def test_rotating_writer(tmpdir, monkeypatch):
+    p = str(tmpdir.join("foo"))
+    w = save.RotatingFlowWriter(p, open_writer, max_flows=2)
+    flows = [tflow.tflow(resp=True) for _ in range(5)]
+    for f in flows:
+        w.add(f)
+    w.fo.close()
+    assert [[f.id for f in rd(p + ".%s" % i)] for i in range(3)] == [
+        [flows[0].id, flows[1].id], [flows[2].id, flows[3].id], [flows[4].id]
+    ]
+
+    size = len(io.tnetstring.dumps(flows[0].get_state()))
+    w = save.RotatingFlowWriter(p, open_writer, max_size=size * 2)
+    for f in flows:
+        w.add(f)
+    w.fo.close()
+    assert len(rd(p + ".0")) == 2
+
+    w = save.RotatingFlowWriter(p + "-{n}", open_writer, max_age=10)
+    w.add(flows[0])
+    w.add(flows[1])
+    monkeypatch.setattr(save.time, "time", lambda: w.opened + 10)
+    w.add(flows[2])
+    w.fo.close()
+    assert len(rd(p + "-0")) == 2
+    assert len(rd(p + "-1")) == 1
+
+
+def test_rotating_writer_strftime(tmpdir):
+    p = str(tmpdir.join("dump-%Y%m%d"))
+    w = save.RotatingFlowWriter(p, open_writer, max_flows=2, retain_size=10 ** 9)
+    flows = [tflow.tflow(resp=True) for _ in range(6)]
+    for f in flows:
+        w.add(f)
+    w.fo.close()
+    assert len(set(w.paths)) == len(w.paths) == 3
+    assert [len(rd(x)) for x in w.paths] == [2, 2, 2]
+    assert w.paths[0] == time.strftime(p) + ".0"
+
+
+def test_rotating_writer_retain(tmpdir):
+    p = str(tmpdir.join("foo"))
+    f = tflow.tflow(resp=True)
+    size = len(io.tnetstring.dumps(f.get_state()))
+
+    def open_indexed(path):
+        return io.FlowWriter(open(path, "wb"), open(io.index_path(path), "wb"))
+
+    w = save.RotatingFlowWriter(p, open_indexed, max_flows=1, retain_size=size * 3)
+    for _ in range(5):
+        w.add(tflow.tflow(resp=True))
+    w.fo.close()
+    w.index.close()
+    # Files are expired when a new, still empty file is started.
+    assert sorted(os.listdir(str(tmpdir))) == [
+        "foo.2", "foo.2.idx", "foo.3", "foo.3.idx", "foo.4", "foo.4.idx"
+    ]
+
+
+def test_stream_rotate(tmpdir):
+    sa = save.Save()
+    with taddons.context(sa) as tctx:
+        p = str(tmpdir.join("foo"))
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(sa, save_stream_rotate_size="foo")
+        tctx.configure(
+            sa,
+            save_stream_file=p,
+            save_stream_rotate_flows=1,
+            save_stream_compress=True,
+            save_stream_filter="!~q",
+        )
+        assert isinstance(sa.stream.writer, save.RotatingFlowWriter)
+        for _ in range(3):
+            f = tflow.tflow(resp=True)
+            sa.request(f)
+            sa.response(f)
+        sa.request(tflow.tflow())
+        tctx.configure(sa, save_stream_file=None)
+        assert [len(rd(p + ".%s" % i)) for i in range(3)] == [1, 1, 1]
+        assert not os.path.exists(p + ".3")
+
+
 def test_save_command(tmpdir):
     sa = save.Save()
     with taddons.context() as tctx:
@@ -76,6 +372,19 @@ def test_save_command(tmpdir):
         tctx.master.commands.call_strings("save.file", ["@shown", p])
 
 
+def test_save_lazy(tmpdir):
+    sa = save.Save()
+    with taddons.context():
+        p = str(tmpdir.join("foo"))
+        f = tflow.tflow(resp=True)
+        f.response.content = b"x" * io.io.LAZY_BODY_SIZE
+        sa.save([f], p)
+        with open(p, "rb") as fo:
+            loaded = list(io.FlowReader(fo, lazy=True).stream())
+        sa.save(loaded, p)
+        assert rd(p)[0].response.content == f.response.content
+
+
 def test_simple(tmpdir):
     sa = save.Save()
     with taddons.context(sa) as tctx:
@@ -192,6 +192,15 @@ class TestScriptLoader:
             sc.script_run([tflow.tflow(resp=True)], "/")
             assert await tctx.master.await_log("No such script")
 
+    def test_concurrent_stats(self):
+        sc = script.ScriptLoader()
+        with taddons.context(sc):
+            rows = sc.concurrent_stats()
+            assert [r[0] for r in rows] == [
+                "workers", "active", "queued", "completed", "killed", "mean wait", "max wait"
+            ]
+            assert all(isinstance(v, str) for _, v in rows)
+
     def test_simple(self, tdata):
         sc = script.ScriptLoader()
         with taddons.context(loadcore=False) as tctx:
@@ -1,11 +1,15 @@
+from unittest import mock
+
 import pytest
 
 from mitmproxy.test import tflow
+from mitmproxy.test import tutils
 
 from mitmproxy.addons import view
 from mitmproxy import flowfilter
 from mitmproxy import exceptions
 from mitmproxy import io
+from mitmproxy import http
 from mitmproxy.test import taddons
 from mitmproxy.tools.console import consoleaddons
 
@@ -125,6 +129,7 @@ def test_filter():
     assert len(v) == 4
 
     v[1].marked = True
+    v.update([v[1]])
     v.toggle_marked()
     assert len(v) == 1
     assert v[0].marked
@@ -132,6 +137,74 @@ def test_filter():
     assert len(v) == 4
 
 
+def test_index():
+    v = view.View()
+    flows = [tflow.tflow(resp=True) for _ in range(4)] + [tflow.tflow()]
+    flows[1].request.method = "POST"
+    flows[1].request.host = "example.com"
+    flows[2].response.status_code = 404
+    flows[3].response.headers["content-type"] = "text/html"
+    flows[4].request.headers["content-type"] = "application/json"
+    v.add(flows)
+
+    def ids(spec):
+        return [f.id for f in v.resolve(spec)]
+
+    for spec in [
+        "~m post", "~d example", "~d address", "~c 404", "~t html", "~t json", "~http", "~tcp",
+        "~m get & ~c 200", "~c 404 | ~m post", "~m get & !~c 200", "~m post | ~u foo",
+        "~d address & (~c 404 | ~m post)", "~q & ~t json",
+    ]:
+        assert ids(spec) == [f.id for f in flows if flowfilter.match(spec, f)], spec
+
+    assert v._index.lookup(flowfilter.parse("~m post")) == {flows[1].id}
+    assert v._index.lookup(flowfilter.parse("~m post & ~u foo")) == {flows[1].id}
+    assert v._index.lookup(flowfilter.parse("~m post | ~u foo")) is None
+    assert v._index.lookup(flowfilter.parse("!~m post")) is None
+
+    v.set_filter(flowfilter.parse("~c 500"))
+    assert len(v) == 0
+    flows[4].response = http.HTTPResponse.wrap(tutils.tresp(status_code=500))
+    v.update([flows[4]])
+    v.set_filter(flowfilter.parse("~c 500 | ~c 404"))
+    assert list(v) == [flows[2], flows[4]]
+
+    v.remove([flows[2]])
+    assert 404 not in v._index.index["code"]
+    v.clear()
+    assert not v._index.features
+
+
+def test_index_marked():
+    v = view.View()
+    flows = [tflow.tflow(resp=True) for _ in range(3)]
+    v.add(flows)
+    with taddons.context(v) as tctx:
+        c = tctx.master.addons.get("core")
+        assert v._index.lookup(flowfilter.parse("~marked")) == set()
+        c.mark([flows[0], flows[2]], True)
+        assert v._index.lookup(flowfilter.parse("~marked")) == {flows[0].id, flows[2].id}
+        c.mark_toggle([flows[0]])
+        assert v._index.lookup(flowfilter.parse("~marked")) == {flows[2].id}
+        assert v.resolve("@marked") == [flows[2]]
+
+        # Showing marked flows only checks the marked ones.
+        v.set_filter(mock.Mock(return_value=True))
+        v.filter.reset_mock()
+        v.toggle_marked()
+        assert list(v) == [flows[2]]
+        assert v.filter.call_count == 1
+
+
+def test_index_types():
+    index = view.FlowIndex()
+    flows = [tflow.ttcpflow(), tflow.twebsocketflow()]
+    for f in flows:
+        index.add(f)
+    assert index.lookup(flowfilter.parse("~tcp")) == {flows[0].id}
+    assert index.lookup(flowfilter.parse("~websocket & ~d example")) == {flows[1].id}
+
+
 def tdump(path, flows):
     with open(path, "wb") as f:
         w = io.FlowWriter(f)
@@ -176,6 +249,9 @@ async def test_load(tmpdir):
         assert len(v) == 2
         v.load_file(path)
         assert len(v) == 4
+        tctx.configure(v, lazy_bodies=True)
+        v.load_file(path)
+        assert len(v) == 6
         try:
             v.load_file("nonexistent_file_path")
         except IOError:
@@ -217,6 +293,7 @@ def test_resolve():
         f = flowfilter.parse("~m get")
         v.set_filter(f)
         v[0].marked = True
+        v.update([v[0]])
 
         def m(l):
             return [i.request.method for i in l]
@@ -286,6 +363,70 @@ def test_remove():
         assert len(v) == 0
 
 
+def test_retention():
+    v = view.View()
+    rec_view = Record()
+    rec_store = Record()
+    v.sig_view_remove.connect(rec_view)
+    v.sig_store_remove.connect(rec_store)
+    with taddons.context(v) as tctx:
+        flows = [tflow.tflow(resp=True) for _ in range(5)]
+        flows[0].marked = True
+        flows[1].intercepted = True
+        flows[2].request.path = "/keep"
+        tctx.configure(v, view_keep_filter="~u /keep")
+        v.add(flows)
+        assert v.store_count() == 5
+
+        tctx.configure(v, view_max_flows=4)
+        assert v.store_count() == 4
+        assert flows[3].id not in v._store
+        assert [c[1]["flow"] for c in rec_view.calls] == [flows[3]]
+        assert [c[1]["flow"] for c in rec_store.calls] == [flows[3]]
+        assert flows[3].id not in v._sizes
+
+        # Only flows that may be evicted are, even if the limit is not reached.
+        tctx.configure(v, view_max_flows=1)
+        assert list(v._store.values()) == flows[:3]
+
+        tctx.configure(v, view_max_flows=0, view_keep_filter=None)
+        with pytest.raises(exceptions.OptionsError, match="Invalid keep filter"):
+            tctx.configure(v, view_keep_filter="~~")
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(v, view_max_flows=-1)
+
+
+def test_retention_size(tmpdir):
+    v = view.View()
+    with taddons.context(v) as tctx:
+        with pytest.raises(exceptions.OptionsError, match="Invalid size"):
+            tctx.configure(v, view_max_size="foo")
+        p = str(tmpdir.join("evicted"))
+        tctx.configure(v, view_max_size="2k", view_evict_file=p)
+
+        flows = [tflow.tflow() for _ in range(3)]
+        for f in flows:
+            f.request.content = b"x" * 1000
+        v.add(flows)
+        assert v.store_count() == 2
+        assert v._size == 2000
+
+        # Responses count towards the limit once they arrive.
+        flows[2].response = http.HTTPResponse.wrap(tutils.tresp(content=b"y" * 100))
+        v.update([flows[2]])
+        assert list(v._store.values()) == [flows[2]]
+        assert v._size == 1100
+
+        tctx.configure(v, view_evict_file=None)
+        with open(p, "rb") as f:
+            assert [x.id for x in io.FlowReader(f).stream()] == [flows[0].id, flows[1].id]
+
+        v.clear()
+        assert v._size == 0
+        with pytest.raises(exceptions.OptionsError):
+            tctx.configure(v, view_evict_file=str(tmpdir))
+
+
 def test_setgetval():
     v = view.View()
     with taddons.context():
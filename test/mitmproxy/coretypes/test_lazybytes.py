@@ -0,0 +1,23 @@
+import hashlib
+import mmap
+from unittest import mock
+
+from mitmproxy.coretypes import lazybytes
+
+
+def test_lazybytes():
+    b = lazybytes.LazyBytes(b"foobarbaz", 3, 6)
+    assert len(b) == 3
+    assert b.load() == b"bar"
+    assert repr(b) == "LazyBytes(3 bytes)"
+
+
+def test_update_hash():
+    buf = mmap.mmap(-1, 9)
+    buf.write(b"foobarbaz")
+    h = hashlib.sha256()
+    with mock.patch("mitmproxy.coretypes.lazybytes.HASH_CHUNK_SIZE", 2):
+        lazybytes.LazyBytes(buf, 3, 8).update_hash(h)
+    assert h.hexdigest() == hashlib.sha256(b"barba").hexdigest()
+    # No views of the buffer are left behind.
+    buf.close()
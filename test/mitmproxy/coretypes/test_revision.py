@@ -0,0 +1,39 @@
+import pickle
+
+from mitmproxy.coretypes import revision
+
+
+class TObject(revision.Revisioned):
+    def __init__(self, x):
+        self.x = x
+
+
+def test_revision():
+    a = TObject(1)
+    b = TObject(2)
+    assert revision.revision(a) < revision.revision(b)
+    a.x = 3
+    assert revision.revision(a) > revision.revision(b)
+    assert vars(a) == {"x": 3}
+
+    c = pickle.loads(pickle.dumps(a))
+    assert c.x == 3
+    assert revision.revision(c) > revision.revision(a)
+
+    revision.stamp(b)
+    assert revision.revision(b) > revision.revision(c)
+    assert revision.revision(object.__new__(TObject)) == 0
+
+
+class TPartial(revision.Revisioned):
+    _revisioned = frozenset({"x"})
+
+
+def test_revisioned_attributes():
+    a = TPartial()
+    a.x = 1
+    rev = revision.revision(a)
+    a.y = 2
+    assert revision.revision(a) == rev
+    a.x = 3
+    assert revision.revision(a) > rev
@@ -0,0 +1,19 @@
+import os
+
+from mitmproxy.script import offload
+
+
+@offload
+def request(flow):
+    flow.request.headers["pid"] = str(os.getpid())
+    flow.request.content = flow.request.content[::-1]
+
+
+@offload
+def response(flow):
+    flow.response.headers["pid"] = str(os.getpid())
+
+
+@offload
+def error(flow):
+    raise ValueError("offload error")
@@ -0,0 +1,98 @@
+import io
+
+import pytest
+
+from mitmproxy import exceptions
+from mitmproxy.io import FlowReader, FlowWriter, read_index
+from mitmproxy.io import compressed
+from mitmproxy.io import tnetstring
+from mitmproxy.test import tflow
+
+
+def write_flows(flows, block_size=compressed.BLOCK_SIZE, index=None):
+    sio = io.BytesIO()
+    w = FlowWriter(compressed.BlockWriter(sio, block_size), index)
+    for f in flows:
+        w.add(f)
+    w.fo.flush()
+    sio.seek(0)
+    return sio
+
+
+def test_roundtrip():
+    flows = [tflow.tflow(resp=True) for _ in range(10)]
+    for f in flows:
+        f.response.content = b"x" * 10000
+    sio = write_flows(flows)
+    assert sio.getvalue().startswith(compressed.MAGIC)
+    assert len(sio.getvalue()) < 10000
+
+    r = FlowReader(sio)
+    assert isinstance(r.fo, compressed.BlockReader)
+    assert [f.get_state() for f in r.stream()] == [f.get_state() for f in flows]
+
+
+def test_plain():
+    sio = io.BytesIO()
+    FlowWriter(sio).add(tflow.tflow())
+    sio.seek(0)
+    assert not compressed.is_compressed(sio)
+    assert sio.tell() == 0
+    assert len(list(FlowReader(io.BufferedReader(io.BytesIO(sio.getvalue()))).stream())) == 1
+    assert not compressed.is_compressed(io.BytesIO())
+
+
+def test_buffered():
+    flows = [tflow.tflow(resp=True) for _ in range(3)]
+    sio = write_flows(flows, block_size=1)
+    r = FlowReader(io.BufferedReader(sio))
+    assert [f.id for f in r.stream()] == [f.id for f in flows]
+
+
+def test_blocks():
+    flows = [tflow.tflow(resp=True) for _ in range(5)]
+    sio = write_flows(flows, block_size=1)
+    sio.read(len(compressed.MAGIC))
+    blocks = []
+    while True:
+        try:
+            blocks.append(tnetstring.load(sio))
+        except ValueError:
+            break
+    # Each block holds whole flows and can be decoded on its own.
+    assert len(blocks) == 5
+    for b, f in zip(blocks, flows):
+        assert FlowReader(io.BytesIO(compressed.zlib.decompress(b))).build_index()[0]["id"] == f.id
+
+
+def test_index():
+    flows = [tflow.tflow(resp=True) for _ in range(20)]
+    idx = io.BytesIO()
+    sio = write_flows(flows, block_size=2000, index=idx)
+    idx.seek(0)
+    entries = read_index(idx)
+    assert len({e["offset"] for e in entries}) > 1
+    assert any(e["offset_in_block"] for e in entries)
+
+    r = FlowReader(sio)
+    assert r.build_index() == entries
+    for e, f in reversed(list(zip(entries, flows))):
+        assert r.read_at(e).id == f.id
+    with pytest.raises(exceptions.FlowReadException):
+        r.read_at(dict(entries[1], offset=1))
+
+
+def test_errors():
+    sio = io.BytesIO(compressed.MAGIC + tnetstring.dumps(b"bogus"))
+    with pytest.raises(exceptions.FlowReadException):
+        list(FlowReader(sio).stream())
+
+    sio = io.BytesIO(compressed.MAGIC + tnetstring.dumps([]))
+    with pytest.raises(exceptions.FlowReadException):
+        list(FlowReader(sio).stream())
+
+    r = compressed.BlockReader(io.BytesIO(b""))
+    assert r.read() == b""
+    assert r.peek() == b""
+    with pytest.raises(ValueError):
+        r.seek(0, 10)
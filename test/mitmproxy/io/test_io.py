@@ -1 +1,35 @@
-# TODO: write tests
+import os
+
+from mitmproxy import io
+from mitmproxy.test import tflow
+
+
+def test_create_replaces_mapped_file(tmpdir):
+    p = str(tmpdir.join("flows"))
+    flows = [tflow.tflow(resp=True) for _ in range(3)]
+    for f in flows:
+        f.response.content = b"x" * io.io.LAZY_BODY_SIZE
+    with io.create(p) as fo:
+        w = io.FlowWriter(fo)
+        for f in flows:
+            w.add(f)
+    inode = os.stat(p).st_ino
+
+    with open(p, "rb") as fo:
+        loaded = list(io.FlowReader(fo, lazy=True).stream())
+    # Writing the lazily read flows back to their own file must not
+    # truncate the mapping they refer to.
+    with io.create(p) as fo:
+        w = io.FlowWriter(fo)
+        for f in loaded:
+            w.add(f)
+    assert os.stat(p).st_ino != inode
+    with open(p, "rb") as fo:
+        assert [f.response.content for f in io.FlowReader(fo).stream()] == [f.response.content for f in flows]
+
+    del loaded
+    inode = os.stat(p).st_ino
+    io.create(p).close()
+    assert os.stat(p).st_ino == inode
+    assert os.path.getsize(p) == 0
+    assert os.listdir(str(tmpdir)) == ["flows"]
@@ -0,0 +1,58 @@
+import io
+
+import pytest
+
+from mitmproxy import exceptions
+from mitmproxy.io import FlowWriter, ParallelFlowReader
+from mitmproxy.io import compressed
+from mitmproxy.io import parallel
+from mitmproxy.test import tflow
+
+
+def tflows():
+    return [tflow.tflow(resp=True), tflow.ttcpflow(), tflow.twebsocketflow()] * 3
+
+
+def write_flows(path, flows, compress=False):
+    with open(path, "wb") as f:
+        fo = compressed.BlockWriter(f, block_size=1) if compress else f
+        w = FlowWriter(fo)
+        for flow in flows:
+            w.add(flow)
+        fo.flush()
+
+
+def test_record_offsets():
+    sio = io.BytesIO(b"1:a,2:bc,")
+    assert list(parallel.record_offsets(sio)) == [0, 4]
+    with pytest.raises(exceptions.FlowReadException):
+        list(parallel.record_offsets(io.BytesIO(b"1:a,bogus")))
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_stream(tmpdir, compress):
+    path = str(tmpdir.join("flows"))
+    flows = tflows()
+    write_flows(path, flows, compress)
+
+    r = ParallelFlowReader(path, workers=2, chunk_size=1)
+    is_compressed, chunks = r.chunks()
+    assert is_compressed == compress
+    assert len(chunks) == len(flows)
+    assert [f.id for f in r.stream()] == [f.id for f in flows]
+
+    r = ParallelFlowReader(path, workers=2, flt="~tcp")
+    assert len(r.chunks()[1]) == 1
+    assert [f.id for f in r.stream()] == [f.id for f in flows if f.type == "tcp"]
+
+
+def test_errors(tmpdir):
+    path = str(tmpdir.join("flows"))
+    write_flows(path, [])
+    assert not list(ParallelFlowReader(path, workers=1).stream())
+
+    write_flows(path, tflows())
+    with open(path, "ab") as f:
+        f.write(b"10:truncated")
+    with pytest.raises(exceptions.FlowReadException):
+        list(ParallelFlowReader(path, workers=1, chunk_size=1).stream())
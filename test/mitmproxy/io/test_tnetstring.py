@@ -4,6 +4,7 @@ import math
 import io
 import struct
 
+from mitmproxy.coretypes.lazybytes import LazyBytes
 from mitmproxy.io import tnetstring
 
 MAXINT = 2 ** (struct.Struct('i').size * 8 - 1) - 1
@@ -92,6 +93,38 @@ class Test_Format(unittest.TestCase):
         i2 = tnetstring.loads(s)
         self.assertEqual(i1, i2)
 
+    def test_pop_remainder(self):
+        first = tnetstring.dumps([b"a", {"b": 1}])
+        data = first + tnetstring.dumps(None) + b"rest"
+        self.assertEqual(([b"a", {"b": 1}], b"0:~rest"), tnetstring.pop(data))
+        self.assertEqual((None, b"rest"), tnetstring.pop(memoryview(data)[len(first):]))
+        self.assertEqual([b"a", {"b": 1}], tnetstring.loads(bytearray(data)))
+
+    def test_invalid(self):
+        for data in [b"", b"5", b"x:hello,", b"-1:,", b"5:hell,", b"5:hello", b"6:1:a,1:]", b"4:true?"]:
+            with self.assertRaises(ValueError):
+                tnetstring.loads(data)
+
+    def test_load_at(self):
+        data = tnetstring.dumps([b"a", 1]) + tnetstring.dumps({"x": 2})
+        value, offset = tnetstring.load_at(data, 0)
+        self.assertEqual([b"a", 1], value)
+        self.assertEqual(({"x": 2}, len(data)), tnetstring.load_at(data, offset))
+        with self.assertRaises(ValueError):
+            tnetstring.load_at(data, len(data))
+
+    def test_load_at_lazy(self):
+        state = {"content": b"x" * 10, "other": b"y" * 10, "nested": [{"content": b"z"}, {"content": None}]}
+        data = tnetstring.dumps(state)
+        value, _ = tnetstring.load_at(data, 0, ("content",), 5)
+        self.assertIsInstance(value["content"], LazyBytes)
+        self.assertEqual(b"x" * 10, value["content"].load())
+        self.assertEqual(b"y" * 10, value["other"])
+        self.assertEqual([{"content": b"z"}, {"content": None}], value["nested"])
+
+        value, _ = tnetstring.load_at(data, 0, ("content",))
+        self.assertIsInstance(value["nested"][0]["content"], LazyBytes)
+
 
 class Test_FileLoading(unittest.TestCase):
 
@@ -128,6 +161,22 @@ class Test_FileLoading(unittest.TestCase):
             tnetstring.load(s)
         self.assertEqual(s.read(1), b':')
 
+    def test_buffered(self):
+        data = b"".join(tnetstring.dumps(v) for v in FORMAT_EXAMPLES.values())
+        s = io.BufferedReader(io.BytesIO(data + b"OK"))
+        for expect in FORMAT_EXAMPLES.values():
+            self.assertEqual(expect, tnetstring.load(s))
+        self.assertEqual(b'OK', s.read())
+
+        s = io.BufferedReader(io.BytesIO(b'1000000000:pwned!,'))
+        with self.assertRaises(ValueError):
+            tnetstring.load(s)
+        self.assertEqual(s.read(1), b':')
+
+        s = io.BufferedReader(io.BytesIO(b'5:abc'))
+        with self.assertRaises(ValueError):
+            tnetstring.load(s)
+
 
 def suite():
     loader = unittest.TestLoader()
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
+import hashlib
 
 import pytest
 
 from mitmproxy.test import tutils
+from mitmproxy.coretypes import lazybytes
 from mitmproxy.net import http
 
 
@@ -54,6 +56,34 @@ class TestMessageData:
 
         assert data1 == data2
 
+    def test_lazy_content(self):
+        data = tutils.tresp().data
+        data.content = lazybytes.LazyBytes(b"xxfooxx", 2, 5)
+        assert data == tutils.tresp(content=b"foo").data
+        assert data.get_state()["content"] == b"foo"
+
+        data.content = lazybytes.LazyBytes(b"xxfooxx", 2, 5)
+        assert data.content == b"foo"
+        assert isinstance(vars(data)["content"], lazybytes.LazyBytes)
+
+    def test_raw_content_size(self):
+        resp = tutils.tresp()
+        resp.data.content = lazybytes.LazyBytes(b"xxfooxx", 2, 5)
+        assert resp.raw_content_size == 3
+        assert isinstance(vars(resp.data)["content"], lazybytes.LazyBytes)
+        resp.raw_content = None
+        assert resp.raw_content_size == 0
+
+    def test_raw_content_hash(self):
+        resp = tutils.tresp()
+        resp.data.content = lazybytes.LazyBytes(b"xxfooxx", 2, 5)
+        assert resp.raw_content_hash == hashlib.sha256(b"foo").hexdigest()
+        assert isinstance(vars(resp.data)["content"], lazybytes.LazyBytes)
+        resp.raw_content = b"foo"
+        assert resp.raw_content_hash == hashlib.sha256(b"foo").hexdigest()
+        resp.raw_content = b""
+        assert resp.raw_content_hash is None
+
 
 class TestMessage:
 
@@ -658,6 +658,12 @@ class TestFileLike:
         d = s.read(-1)
         assert d.startswith(b"abc") and d.endswith(b"xyz")
 
+    def test_read1(self):
+        s = tcp.Reader(BytesIO(b"foobar"))
+        assert s.read1(4) == b"foob"
+        assert s.read1(4) == b"ar"
+        assert s.read1(4) == b""
+
     def test_wrap(self):
         s = BytesIO(b"foobar\nfoobar")
         s.flush()
@@ -2,6 +2,7 @@ import os
 import codecs
 import pytest
 
+from mitmproxy import exceptions
 from mitmproxy.net import websockets
 from mitmproxy.test import tutils
 
@@ -164,3 +165,20 @@ class TestFrame:
         )
         serialized = bytes(frame)
         assert frame == websockets.Frame.from_bytes(serialized)
+
+    def test_from_buffer(self):
+        f1 = websockets.Frame(b"foo", fin=True, masking_key=b"test")
+        f2 = websockets.Frame(b"bar" * 100, opcode=websockets.OPCODE.BINARY)
+        data = bytearray(bytes(f1) + bytes(f2))
+
+        frame, length = websockets.Frame.from_buffer(data)
+        assert frame == f1
+        assert length == len(bytes(f1))
+        frame, length = websockets.Frame.from_buffer(data, length)
+        assert frame == f2
+        assert frame.payload == b"bar" * 100
+
+        with pytest.raises(exceptions.TcpReadIncomplete, match="Expected 300 bytes"):
+            websockets.Frame.from_buffer(data[:-1], len(bytes(f1)))
+        with pytest.raises(exceptions.TcpReadIncomplete, match="Expected 2 bytes"):
+            websockets.Frame.from_bytes(b"\x81")
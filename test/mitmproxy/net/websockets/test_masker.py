@@ -21,3 +21,13 @@ class TestMasker:
 
         data = websockets.Masker(b"abcd")(data)
         assert data == b"".join(input)
+
+    @pytest.mark.parametrize("offset", [0, 1, 2, 3, 5])
+    @pytest.mark.parametrize("length", [0, 1, 3, 4, 7, 1000])
+    def test_mask_offset(self, offset, length):
+        key = b"\x01\x80\xff\x7f"
+        data = bytes(range(256)) * 4
+        data = data[:length]
+        expected = bytes(c ^ key[(offset + i) % 4] for i, c in enumerate(data))
+        assert websockets.Masker(key).mask(offset, data) == expected
+        assert websockets.Masker(key).mask(offset, memoryview(data)) == expected
@@ -13,6 +13,7 @@ import mitmproxy.net
 from ...net import tservers as net_tservers
 from mitmproxy import exceptions
 from mitmproxy.net.http import http1, http2
+from mitmproxy.proxy.protocol import http2 as http2_layer
 from pathod.language import generators
 
 from ... import tservers
@@ -966,3 +967,104 @@ class TestResponseStreaming(_Http2Test):
             assert data
         else:
             assert data is None
+
+
+class TestLargeResponseStreaming(_Http2Test):
+    body = generators.RandomGenerator("bytes", 256 * 1024)[:]
+    position = 0
+
+    @classmethod
+    def send_body(cls, h2_conn, stream_id, wfile):
+        while cls.position < len(cls.body):
+            window = min(h2_conn.local_flow_control_window(stream_id), h2_conn.max_outbound_frame_size)
+            if window == 0:
+                break
+            chunk = cls.body[cls.position:cls.position + window]
+            h2_conn.send_data(stream_id, chunk)
+            cls.position += len(chunk)
+        if cls.position == len(cls.body):
+            h2_conn.end_stream(stream_id)
+            cls.position += 1
+        wfile.write(h2_conn.data_to_send())
+        wfile.flush()
+
+    @classmethod
+    def handle_server_event(cls, event, h2_conn, rfile, wfile):
+        if isinstance(event, h2.events.ConnectionTerminated):
+            return False
+        elif isinstance(event, h2.events.RequestReceived):
+            cls.position = 0
+            h2_conn.send_headers(event.stream_id, [(':status', '200')])
+            cls.send_body(h2_conn, event.stream_id, wfile)
+        elif isinstance(event, h2.events.WindowUpdated) and cls.position <= len(cls.body):
+            cls.send_body(h2_conn, 1, wfile)
+        return True
+
+    @pytest.mark.parametrize('streaming', [True, False])
+    def test_large_response_streaming(self, streaming):
+        class Stream:
+            def responseheaders(self, f):
+                f.response.stream = streaming
+
+        self.master.addons.add(Stream())
+        h2_conn = self.setup_connection()
+        self._send_request(
+            self.client.wfile,
+            h2_conn,
+            headers=[
+                (':authority', "127.0.0.1:{}".format(self.server.server.address[1])),
+                (':method', 'GET'),
+                (':scheme', 'https'),
+                (':path', '/'),
+            ]
+        )
+
+        response_body_buffer = b''
+        done = False
+        while not done:
+            raw = b''.join(http2.read_raw_frame(self.client.rfile))
+            events = h2_conn.receive_data(raw)
+            for event in events:
+                if isinstance(event, h2.events.DataReceived):
+                    response_body_buffer += event.data
+                    h2_conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    done = True
+            self.client.wfile.write(h2_conn.data_to_send())
+            self.client.wfile.flush()
+
+        assert response_body_buffer == self.body
+
+
+class TestFlowControlledQueue:
+
+    def test_deferred(self):
+        acknowledged = []
+        q = http2_layer.FlowControlledQueue()
+        q.put(b"foo", 3, acknowledged.append)
+        q.put(b"barbaz", 10, acknowledged.append)
+        assert q.buffered_length == 9
+        assert q.qsize() == 2
+        assert not acknowledged
+
+        assert q.get() == b"foo"
+        assert acknowledged == [3]
+        assert q.buffered_length == 6
+        assert q.get() == b"barbaz"
+        assert acknowledged == [3, 10]
+        assert q.buffered_length == 0
+        assert q.max_buffered_length == 9
+
+    def test_acknowledge_all(self):
+        acknowledged = []
+        q = http2_layer.FlowControlledQueue()
+        q.put(b"foo", 3, acknowledged.append)
+        q.put(b"bar", 3, acknowledged.append)
+        q.acknowledge_all()
+        assert acknowledged == [6]
+
+        q.put(b"baz", 3, acknowledged.append)
+        assert acknowledged == [6, 3]
+        assert [q.get(), q.get(), q.get()] == [b"foo", b"bar", b"baz"]
+        assert acknowledged == [6, 3]
+        assert q.buffered_length == 0
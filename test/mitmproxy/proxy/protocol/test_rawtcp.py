@@ -1 +1,59 @@
-# TODO: write tests
+import os
+import socket
+from unittest import mock
+
+import pytest
+
+from mitmproxy import script
+from mitmproxy.proxy.protocol import rawtcp
+from mitmproxy.test import taddons
+
+
+@pytest.mark.skipif(not hasattr(os, "splice"), reason="requires os.splice")
+def test_splice():
+    layer = mock.Mock(splice_size=rawtcp.RawTCPLayer.splice_size)
+    a, b = socket.socketpair()
+    c, d = socket.socketpair()
+    pipe = os.pipe()
+    try:
+        a.sendall(b"foo" * 1000)
+        assert rawtcp.RawTCPLayer._splice(layer, b, c, pipe) == 3000
+        assert d.recv(4096) == b"foo" * 1000
+        a.shutdown(socket.SHUT_WR)
+        assert rawtcp.RawTCPLayer._splice(layer, b, c, pipe) == 0
+    finally:
+        for s in (a, b, c, d):
+            s.close()
+        os.close(pipe[0])
+        os.close(pipe[1])
+
+
+def test_can_splice(monkeypatch):
+    layer = mock.Mock(ignore=True)
+    monkeypatch.setattr(os, "splice", mock.Mock(), raising=False)
+    assert rawtcp.RawTCPLayer.can_splice(layer)
+    layer.ignore = False
+    assert not rawtcp.RawTCPLayer.can_splice(layer)
+    # Without splice(), the buffered relay is used.
+    layer.ignore = True
+    monkeypatch.delattr(os, "splice")
+    assert not rawtcp.RawTCPLayer.can_splice(layer)
+
+
+def test_blocking():
+    class Modifier:
+        @script.modifies_messages
+        def tcp_message(self, f):
+            pass
+
+    with taddons.context() as tctx:
+        layer = mock.Mock(
+            config=mock.Mock(options=tctx.options),
+            channel=mock.Mock(master=tctx.master),
+        )
+        assert rawtcp.RawTCPLayer.blocking(layer)
+        tctx.options.update(tcp_async_messages=True)
+        assert not rawtcp.RawTCPLayer.blocking(layer)
+        # Addons loaded while the connection is open are taken into account.
+        tctx.master.addons.add(Modifier())
+        assert rawtcp.RawTCPLayer.blocking(layer)
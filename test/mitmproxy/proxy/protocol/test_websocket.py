@@ -15,6 +15,7 @@ from ...net import tservers as net_tservers
 from ... import tservers
 
 from mitmproxy.net import websockets
+from mitmproxy.proxy.protocol import websocket
 
 
 class _WebSocketServerBase(net_tservers.ServerTestBase):
@@ -221,6 +222,57 @@ class TestSimple(_WebSocketTest):
         assert frame.payload == b'foo'
 
 
+class TestRawPassthrough(_WebSocketTest):
+
+    @classmethod
+    def handle_websockets(cls, rfile, wfile):
+        first = websockets.Frame.from_file(rfile)
+        second = websockets.Frame.from_file(rfile)
+        # report the framing the server has seen back to the client
+        wfile.write(bytes(websockets.Frame(fin=0, opcode=websockets.OPCODE.BINARY, payload=first.header.masking_key)))
+        wfile.write(bytes(websockets.Frame(fin=1, opcode=websockets.OPCODE.CONTINUE, payload=second.header.masking_key)))
+        wfile.flush()
+
+    def test_raw_passthrough(self):
+        self.setup_connection()
+
+        self.client.wfile.write(bytes(websockets.Frame(fin=0, opcode=websockets.OPCODE.TEXT, payload=b'foo', masking_key=b'abcd')))
+        self.client.wfile.write(bytes(websockets.Frame(fin=1, opcode=websockets.OPCODE.CONTINUE, payload=b'bar', masking_key=b'efgh')))
+        self.client.wfile.flush()
+
+        first = websockets.Frame.from_file(self.client.rfile)
+        second = websockets.Frame.from_file(self.client.rfile)
+        assert (first.header.fin, first.payload) == (0, b'abcd')
+        assert (second.header.fin, second.payload) == (1, b'efgh')
+        assert self.master.state.flows[1].messages[0].content == 'foobar'
+        assert self.master.state.flows[1].messages[1].content == b'abcdefgh'
+
+
+class TestRawFrameBuffer:
+
+    def test_receive_bytes(self):
+        frames = [
+            websockets.Frame(fin=0, opcode=websockets.OPCODE.TEXT, payload=b'foo', masking_key=b'abcd'),
+            websockets.Frame(fin=1, opcode=websockets.OPCODE.PING, payload=b'ping'),
+            websockets.Frame(fin=1, opcode=websockets.OPCODE.CONTINUE, payload=b'bar' * 100),
+            websockets.Frame(fin=1, opcode=websockets.OPCODE.BINARY, payload=b'baz'),
+        ]
+        data = b''.join(bytes(f) for f in frames)
+
+        buf = websocket.RawFrameBuffer()
+        for i in range(0, len(data), 7):
+            buf.receive_bytes(data[i:i + 7])
+        assert not buf.buffer
+        assert buf.pop_message() == [bytes(frames[0]), bytes(frames[2])]
+        assert buf.pop_message() == [bytes(frames[3])]
+        assert not buf.messages
+
+        buf.receive_bytes(bytes(frames[0])[:-1])
+        assert not buf.frames
+        buf.receive_bytes(bytes(frames[0])[-1:])
+        assert buf.frames == [bytes(frames[0])]
+
+
 class TestKillFlow(_WebSocketTest):
 
     @classmethod
@@ -78,6 +78,13 @@ class TcpMixin:
         self.options.ignore_hosts = self._ignore_backup
         del self._ignore_backup
 
+    def test_ignore_large(self):
+        self._ignore_on()
+        i = self.pathod("200:b@300k")
+        self._ignore_off()
+        assert i.status_code == 200
+        assert len(i.content) == 300 * 1024
+
     def test_ignore(self):
         n = self.pathod("304")
         self._ignore_on()
@@ -121,6 +128,13 @@ class TcpMixin:
         self.options.tcp_hosts = self._tcpproxy_backup
         del self._tcpproxy_backup
 
+    def test_tcp_large(self):
+        self._tcpproxy_on()
+        i = self.pathod("200:b@300k")
+        self._tcpproxy_off()
+        assert i.status_code == 200
+        assert len(i.content) == 300 * 1024
+
     def test_tcp(self):
         n = self.pathod("304")
         self._tcpproxy_on()
@@ -538,6 +552,25 @@ class TestTransparent(tservers.TransparentProxyTest, CommonMixin, TcpMixin):
         self._tcpproxy_off()
         assert d.content == b"bar"
 
+    @pytest.mark.parametrize("script_name, content", [
+        ("tcp_stream_modify.py", b"foo"),
+        ("tcp_stream_modify_declared.py", b"bar"),
+    ])
+    def test_tcp_async_messages(self, tdata, script_name, content):
+        s = script.Script(
+            tdata.path("mitmproxy/data/addonscripts/" + script_name),
+            False,
+        )
+        self.set_addons(s)
+        self.options.tcp_async_messages = True
+        try:
+            self._tcpproxy_on()
+            d = self.pathod('200:b"foo"')
+            self._tcpproxy_off()
+        finally:
+            self.options.tcp_async_messages = False
+        assert d.content == content
+
 
 class TestTransparentSSL(tservers.TransparentProxyTest, CommonMixin, TcpMixin):
     ssl = True
@@ -1,9 +1,15 @@
+import threading
+
 import pytest
 
 from mitmproxy.test import tflow
 from mitmproxy.test import taddons
 
 from mitmproxy import controller
+from mitmproxy import exceptions
+from mitmproxy.addons import script
+from mitmproxy.script import concurrent
+from mitmproxy.script.concurrent import ThreadPool, pool
 import time
 
 from .. import tservers
@@ -57,3 +63,134 @@ class TestConcurrent(tservers.MasterTest):
                     if f1.reply.state == f2.reply.state == "committed":
                         return
                 raise ValueError("Script never acked")
+
+
+class TestThreadPool:
+    def test_pool(self):
+        pool = ThreadPool(max_workers=2, max_queue=1, overflow="kill")
+        release = threading.Event()
+        done = []
+
+        def block():
+            release.wait()
+            done.append(1)
+
+        start = time.time()
+        for i in range(2):
+            assert pool.submit("request", block)
+            while pool.stats()["active"] < i + 1:
+                assert time.time() - start < 5
+                time.sleep(0.01)
+        assert pool.submit("request", block)
+        assert not pool.submit("request", block)
+
+        stats = pool.stats()
+        assert stats["workers"] == 2
+        assert stats["queued"] == 1
+        assert stats["killed"] == 1
+
+        release.set()
+        while len(done) < 3:
+            assert time.time() - start < 5
+            time.sleep(0.01)
+        start = time.time()
+        while pool.stats()["completed"] < 3:
+            assert time.time() - start < 5
+            time.sleep(0.01)
+        stats = pool.stats()
+        assert stats["active"] == stats["queued"] == 0
+        assert stats["max_wait_time"] >= stats["avg_wait_time"] > 0
+
+    def test_hold(self):
+        pool = ThreadPool(max_workers=1, max_queue=1, overflow="block")
+        release = threading.Event()
+        done = []
+
+        def block():
+            release.wait()
+            done.append(1)
+
+        start = time.time()
+        assert pool.submit("request", block)
+        while not pool.stats()["active"]:
+            assert time.time() - start < 5
+            time.sleep(0.01)
+        # The queue is full, but submitting does not wait for room.
+        for _ in range(3):
+            assert pool.submit("request", block)
+        assert len(pool.queue) == 1
+        assert len(pool.held) == 2
+        assert pool.stats()["queued"] == 3
+
+        release.set()
+        while len(done) < 4:
+            assert time.time() - start < 5
+            time.sleep(0.01)
+        assert not pool.held
+
+    def test_configure_pool(self):
+        pool = ThreadPool(max_workers=3, max_queue=1, overflow="block")
+        release = threading.Event()
+
+        start = time.time()
+        for i in range(3):
+            assert pool.submit("request", release.wait)
+            while pool.stats()["active"] < i + 1:
+                assert time.time() - start < 5
+                time.sleep(0.01)
+        for _ in range(3):
+            assert pool.submit("request", release.wait)
+        assert len(pool.held) == 2
+
+        # Held back calls are queued once the queue grows.
+        pool.configure(max_workers=1, max_queue=0, overflow="block")
+        assert not pool.held
+        assert len(pool.queue) == 3
+
+        # Workers over the limit retire.
+        release.set()
+        while pool.stats()["workers"] > 1 or pool.stats()["completed"] < 6:
+            assert time.time() - start < 5
+            time.sleep(0.01)
+        assert not pool.stats()["queued"]
+
+    @pytest.mark.asyncio
+    async def test_error(self):
+        pool = ThreadPool(max_workers=1)
+
+        def fail():
+            raise ValueError("concurrent error")
+
+        with taddons.context() as tctx:
+            assert pool.submit("request", fail)
+            assert await tctx.master.await_log("concurrent error")
+            # The worker survives the error.
+            done = threading.Event()
+            assert pool.submit("request", done.set)
+            assert done.wait(5)
+
+    @pytest.mark.asyncio
+    async def test_kill_overflow(self, monkeypatch):
+        monkeypatch.setattr(pool, "submit", lambda name, fn: False)
+        f = tflow.tflow()
+        f.reply = controller.Reply(f)
+
+        def request(flow):
+            pass
+
+        with taddons.context() as tctx:
+            concurrent(request)(f)
+            assert await tctx.master.await_log("queue is full")
+        assert f.reply.state == "committed"
+        assert f.reply.q.get() == exceptions.Kill
+
+    def test_configure(self):
+        sl = script.ScriptLoader()
+        with taddons.context(sl) as tctx:
+            tctx.configure(sl, concurrent_workers=4, concurrent_queue=8, concurrent_overflow="kill")
+            assert pool.max_workers == 4
+            assert pool.max_queue == 8
+            assert pool.overflow == "kill"
+            with pytest.raises(exceptions.OptionsError):
+                tctx.configure(sl, concurrent_workers=0)
+            tctx.configure(sl, concurrent_workers=32, concurrent_queue=1024, concurrent_overflow="block")
@@ -0,0 +1,16 @@
+import pytest
+
+from mitmproxy.script import modifies_messages
+
+
+def test_modifies_messages():
+    @modifies_messages
+    def tcp_message(f):
+        pass
+
+    assert tcp_message.modifies_messages
+
+    with pytest.raises(NotImplementedError, match="'request'"):
+        @modifies_messages
+        def request(f):
+            pass
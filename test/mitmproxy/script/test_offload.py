@@ -0,0 +1,163 @@
+import asyncio
+import concurrent.futures
+import os
+import time
+from unittest import mock
+
+import pytest
+
+from mitmproxy import exceptions
+from mitmproxy.addons import script
+from mitmproxy.script import offload
+from mitmproxy.script.offload import ProcessPool, pool
+from mitmproxy.test import taddons
+from mitmproxy.test import tflow
+
+
+async def invoke(tctx, sc, event, f):
+    f.reply._state = "start"
+    tctx.master.addons.invoke_addon(sc, event, f)
+    await invoke_done(f)
+
+
+async def invoke_done(f):
+    start = time.time()
+    while time.time() - start < 10:
+        if f.reply.state == "committed":
+            return
+        await asyncio.sleep(0.01)
+    raise ValueError("Script never acked")
+
+
+class TestOffload:
+    @pytest.mark.asyncio
+    async def test_offload(self, tdata):
+        with taddons.context() as tctx:
+            sc = tctx.script(
+                tdata.path("mitmproxy/data/addonscripts/offload_decorator.py")
+            )
+            f = tflow.tflow(resp=True)
+            server_conn = f.server_conn
+            response_content = f.response.content
+            await invoke(tctx, sc, "request", f)
+            await invoke(tctx, sc, "response", f)
+            assert f.request.content == b"content"[::-1]
+            assert f.request.headers["pid"] != str(os.getpid())
+            assert f.response.headers["pid"] != str(os.getpid())
+            assert f.response.content == response_content
+            assert f.server_conn is server_conn
+
+    @pytest.mark.asyncio
+    async def test_offload_err(self, tdata):
+        with taddons.context() as tctx:
+            sc = tctx.script(
+                tdata.path("mitmproxy/data/addonscripts/offload_decorator.py")
+            )
+            f = tflow.tflow(err=True)
+            await invoke(tctx, sc, "error", f)
+            assert await tctx.master.await_log("offload error")
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("change", ["edit", "kill"])
+    async def test_flow_changed(self, tdata, monkeypatch, change):
+        future = concurrent.futures.Future()
+        monkeypatch.setattr(pool, "submit", lambda ref, state: future)
+        with taddons.context() as tctx:
+            sc = tctx.script(
+                tdata.path("mitmproxy/data/addonscripts/offload_decorator.py")
+            )
+            f = tflow.tflow()
+            f.reply._state = "start"
+            sc.request(f)
+            assert f.reply.state == "taken"
+
+            state = f.get_state()
+            state["request"]["headers"] = ((b"pid", b"1"),)
+            if change == "edit":
+                f.request.headers["live"] = "1"
+            else:
+                f.kill()
+            future.set_result((state, ["request"]))
+            assert await tctx.master.await_log("flow changed while the hook ran")
+            assert f.reply.state == "committed"
+            assert "pid" not in f.request.headers
+            if change == "edit":
+                assert f.request.headers["live"] == "1"
+            else:
+                assert f.reply.value == exceptions.Kill
+
+    @pytest.mark.asyncio
+    async def test_unchanged(self, tdata, monkeypatch):
+        future = concurrent.futures.Future()
+        monkeypatch.setattr(pool, "submit", lambda ref, state: future)
+        with taddons.context() as tctx:
+            sc = tctx.script(
+                tdata.path("mitmproxy/data/addonscripts/offload_decorator.py")
+            )
+            f = tflow.tflow()
+            f.reply._state = "start"
+            sc.request(f)
+            with mock.patch.object(f, "set_state") as set_state:
+                f.marked = True
+                state = f.get_state()
+                state["request"]["content"] = None
+                future.set_result((state, ["request"]))
+                await invoke_done(f)
+                # The hook changed nothing, so the live change is kept as well.
+                assert not set_state.called
+            assert f.marked
+
+    def test_submit_err(self, tdata, monkeypatch):
+        def submit(ref, state):
+            raise RuntimeError("pool is broken")
+
+        monkeypatch.setattr(pool, "submit", submit)
+        with taddons.context() as tctx:
+            sc = tctx.script(
+                tdata.path("mitmproxy/data/addonscripts/offload_decorator.py")
+            )
+            f = tflow.tflow()
+            f.reply._state = "start"
+            with pytest.raises(RuntimeError, match="pool is broken"):
+                sc.request(f)
+            # The reply has not been taken, so the flow is acked as usual.
+            assert f.reply.state == "start"
+
+    def test_unsupported(self):
+        def configure(updated):
+            pass
+
+        with pytest.raises(NotImplementedError, match="not supported"):
+            offload(configure)
+
+        class Addon:
+            def request(self, f):
+                pass
+
+        with pytest.raises(NotImplementedError, match="module-level"):
+            offload(Addon.request)
+
+        with pytest.raises(NotImplementedError, match="not supported"):
+            offload(os.kill)(object())
+
+
+class TestProcessPool:
+    def test_configure(self):
+        p = ProcessPool(2)
+        assert p.max_workers == 2
+        p.submit(("mitmproxy.flow", "", "Flow.backup"), tflow.tflow().get_state()).result()
+        p.configure(2)
+        assert p.executor
+        p.configure(0)
+        assert p.max_workers == (os.cpu_count() or 1)
+        assert not p.executor
+        p.shutdown()
+
+    def test_options(self):
+        sl = script.ScriptLoader()
+        with taddons.context(sl) as tctx:
+            tctx.configure(sl, offload_workers=3)
+            assert script.offload_pool.max_workers == 3
+            with pytest.raises(exceptions.OptionsError):
+                tctx.configure(sl, offload_workers=-1)
+            tctx.configure(sl, offload_workers=0)
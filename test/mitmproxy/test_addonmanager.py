@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 from unittest import mock
 
@@ -7,7 +9,9 @@ from mitmproxy import addonmanager
 from mitmproxy import exceptions
 from mitmproxy import options
 from mitmproxy import command
+from mitmproxy import controller
 from mitmproxy import master
+from mitmproxy import script
 from mitmproxy.test import taddons
 from mitmproxy.test import tflow
 
@@ -86,6 +90,60 @@ async def test_lifecycle():
     a._configure_all(o, o.keys())
 
 
+class AsyncAddon:
+    def __init__(self):
+        self.events = []
+        self.gate = asyncio.Event()
+
+    async def request(self, f):
+        self.events.append(("request", f.request.path))
+        if f.request.path == "/wait":
+            await self.gate.wait()
+        self.events.append(("request done", f.request.path))
+
+    async def running(self):
+        self.events.append("running")
+
+    async def error(self, f):
+        raise ValueError("async error")
+
+
+@pytest.mark.asyncio
+async def test_async_handlers():
+    a = AsyncAddon()
+    with taddons.context(a, loadcore=False) as tctx:
+        f1 = tflow.tflow()
+        f1.request.path = "/wait"
+        f1.reply = controller.Reply(f1)
+        f2 = tflow.tflow()
+        f2.reply = controller.Reply(f2)
+
+        t1 = asyncio.ensure_future(tctx.master.addons.handle_lifecycle("request", f1))
+        await asyncio.sleep(0)
+        assert f1.reply.state == "start"
+        # Another flow is handled while the first one is waiting.
+        await tctx.master.addons.handle_lifecycle("request", f2)
+        assert f2.reply.state == "committed"
+        assert not t1.done()
+
+        a.gate.set()
+        await t1
+        assert f1.reply.state == "committed"
+        assert a.events == [
+            ("request", "/wait"),
+            ("request", "/path"),
+            ("request done", "/path"),
+            ("request done", "/wait"),
+        ]
+
+        tctx.master.addons.trigger("running")
+        await asyncio.sleep(0)
+        assert a.events[-1] == "running"
+
+        await tctx.master.addons.handle_lifecycle("error", tflow.tflow(err=True))
+        assert await tctx.master.await_log("async error")
+
+
 def test_defaults():
     assert addons.default_addons()
 
@@ -190,6 +248,96 @@ def test_nesting():
     assert not a.get("four")
 
 
+def test_handlers():
+    o = options.Options()
+    m = master.Master(o)
+    a = addonmanager.AddonManager(m)
+    one = TAddon("one", addons=[TAddon("two")])
+    a.add(one, TAddon("three"))
+    assert a.get_handlers("request") == []
+    assert [group for _, group in a.get_handlers("running")] == [
+        [one, a.get("two")], [a.get("three")]
+    ]
+    assert "running" in a.handlers
+
+    ns = TAddon("four")
+    one.addons.append(ns)
+    a.trigger("running")
+    assert not ns.running_called
+    a.invalidate()
+    a.trigger("running")
+    assert ns.running_called
+
+    a.remove(a.get("three"))
+    assert [group for _, group in a.get_handlers("running")] == [
+        [one, a.get("two"), ns]
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stats():
+    a = AsyncAddon()
+    with taddons.context(a, THalt(), loadcore=False) as tctx:
+        am = tctx.master.addons
+        am.trigger("running")
+        assert am.stats is None
+
+        am.stats = addonmanager.HandlerStats()
+        am.trigger("running")
+        await am.async_trigger("error", tflow.tflow(err=True))
+        a.gate.set()
+        await am.async_trigger("request", tflow.tflow())
+        assert await tctx.master.await_log("async error")
+
+        stats = {(s["addon"], s["event"]): s for s in am.stats.summary()}
+        assert set(stats) == {
+            ("asyncaddon", "running"),
+            ("asyncaddon", "error"),
+            ("asyncaddon", "request"),
+            ("thalt", "running"),
+        }
+        assert stats[("asyncaddon", "running")]["count"] == 1
+        assert stats[("asyncaddon", "error")]["errors"] == 1
+        assert stats[("thalt", "running")]["errors"] == 0
+        s = stats[("asyncaddon", "request")]
+        assert s["count"] == 1
+        assert s["errors"] == 0
+        assert s["mean"] == s["total"] == s["max"] > 0
+        assert sum(n for _, n in s["histogram"]) == 1
+        assert s["histogram"][-1][0] is None
+
+
+def test_stats_error():
+    class Err:
+        def running(self):
+            raise ValueError("sync error")
+
+    with taddons.context(loadcore=False) as tctx:
+        tctx.master.addons.stats = addonmanager.HandlerStats()
+        tctx.master.addons.add(Err(), THalt(), TAddon("one"))
+        tctx.master.addons.trigger("running")
+        stats = {(s["addon"], s["event"]): s for s in tctx.master.addons.stats.summary()}
+        assert stats[("err", "running")]["errors"] == 1
+        assert stats[("thalt", "running")]["count"] == 1
+        assert ("one", "running") not in stats
+
+
+def test_modifies_messages():
+    class Modifier:
+        @script.modifies_messages
+        def tcp_message(self, f):
+            pass
+
+    o = options.Options()
+    m = master.Master(o)
+    a = addonmanager.AddonManager(m)
+    a.add(TAddon("one"))
+    assert not a.modifies_messages("tcp_message")
+    a.add(TAddon("two", addons=[Modifier()]))
+    assert a.modifies_messages("tcp_message")
+    assert not a.modifies_messages("websocket_message")
+
+
 class D:
     def __init__(self):
         self.w = None
@@ -5,6 +5,7 @@ import pytest
 from mitmproxy.exceptions import Kill, ControlException
 from mitmproxy import controller
 from mitmproxy.test import taddons
+from mitmproxy.test import tflow
 import mitmproxy.ctx
 
 
@@ -26,6 +27,102 @@ async def test_master():
         assert ctx.master.should_exit.is_set()
 
 
+class TAskAddon:
+    def __init__(self, intercept=None, kill=None):
+        self.events = []
+        self.intercept = intercept
+        self.kill = kill
+
+    def handle(self, name, f):
+        self.events.append(name)
+        if name == self.intercept:
+            f.intercept()
+        if name == self.kill:
+            f.reply.kill()
+
+    def responseheaders(self, f):
+        self.handle("responseheaders", f)
+
+    def response(self, f):
+        self.handle("response", f)
+
+
+@pytest.mark.asyncio
+async def test_ask_without_handlers():
+    with taddons.context(loadcore=False) as tctx:
+        f = tflow.tflow(resp=True)
+        assert tctx.master.channel.ask("request", f) is f
+        assert f.reply.state == "committed"
+        assert tctx.master.channel.ask_all(["request", "response"], f) is f
+
+
+class TUpdateAddon:
+    def __init__(self):
+        self.updated = 0
+
+    def update(self, flows):
+        self.updated += len(flows)
+
+
+@pytest.mark.asyncio
+async def test_ask_update_only():
+    a = TUpdateAddon()
+    with taddons.context(a, loadcore=False) as tctx:
+        f = tflow.tflow(resp=True)
+        loop = asyncio.get_event_loop()
+        assert await loop.run_in_executor(None, tctx.master.channel.ask, "responseheaders", f) is f
+        assert a.updated == 1
+        ret = await loop.run_in_executor(
+            None, tctx.master.channel.ask_all, ["responseheaders", "response"], f
+        )
+        assert ret is f
+        assert a.updated == 3
+
+
+@pytest.mark.asyncio
+async def test_ask_all():
+    a = TAskAddon()
+    with taddons.context(a, loadcore=False) as tctx:
+        f = tflow.tflow(resp=True)
+        loop = asyncio.get_event_loop()
+        ret = await loop.run_in_executor(
+            None, tctx.master.channel.ask_all, ["request", "responseheaders", "response"], f
+        )
+        assert ret is f
+        assert a.events == ["responseheaders", "response"]
+        assert f.reply.state == "committed"
+
+
+@pytest.mark.asyncio
+async def test_ask_all_intercept():
+    a = TAskAddon(intercept="responseheaders")
+    with taddons.context(a, loadcore=False) as tctx:
+        f = tflow.tflow(resp=True)
+        loop = asyncio.get_event_loop()
+        ret = loop.run_in_executor(
+            None, tctx.master.channel.ask_all, ["responseheaders", "response"], f
+        )
+        while not f.intercepted:
+            await asyncio.sleep(0.01)
+        assert a.events == ["responseheaders"]
+        f.resume()
+        assert await ret is f
+        assert a.events == ["responseheaders", "response"]
+
+
+@pytest.mark.asyncio
+async def test_ask_all_kill():
+    a = TAskAddon(kill="responseheaders")
+    with taddons.context(a, loadcore=False) as tctx:
+        f = tflow.tflow(resp=True)
+        loop = asyncio.get_event_loop()
+        with pytest.raises(Kill):
+            await loop.run_in_executor(
+                None, tctx.master.channel.ask_all, ["responseheaders", "response"], f
+            )
+        assert a.events == ["responseheaders"]
+
+
 class TestReply:
     def test_simple(self):
         reply = controller.Reply(42)
@@ -6,6 +6,7 @@ import mitmproxy.io
 from mitmproxy import flowfilter
 from mitmproxy import options
 from mitmproxy.io import tnetstring
+from mitmproxy.coretypes.lazybytes import LazyBytes
 from mitmproxy.exceptions import FlowReadException
 from mitmproxy import flow
 from mitmproxy import http
@@ -49,6 +50,86 @@ class TestSerialize:
         r = mitmproxy.io.FlowReader(sio)
         assert len(list(r.stream()))
 
+    def test_index(self):
+        sio = io.BytesIO()
+        idx = io.BytesIO()
+        w = mitmproxy.io.FlowWriter(sio, idx)
+        flows = [tflow.tflow(resp=True), tflow.ttcpflow(), tflow.twebsocketflow()]
+        for f in flows:
+            w.add(f)
+
+        idx.seek(0)
+        entries = mitmproxy.io.read_index(idx)
+        assert [e["id"] for e in entries] == [f.id for f in flows]
+        assert [e["type"] for e in entries] == ["http", "tcp", "websocket"]
+        assert entries[0]["host"] == "address"
+        assert entries[0]["timestamp"] == flows[0].request.timestamp_start
+
+        sio.seek(0)
+        r = mitmproxy.io.FlowReader(sio)
+        assert r.build_index() == entries
+        for e, f in reversed(list(zip(entries, flows))):
+            assert r.read_at(e).get_state() == f.get_state()
+
+        with pytest.raises(FlowReadException, match="does not match"):
+            r.read_at(dict(entries[1], id="foo"))
+        with pytest.raises(FlowReadException, match="Invalid data format"):
+            r.read_at(dict(entries[1], offset=1))
+        with pytest.raises(FlowReadException, match="Invalid index format"):
+            mitmproxy.io.read_index(io.BytesIO(b"bogus"))
+        with pytest.raises(FlowReadException, match="Invalid index format"):
+            mitmproxy.io.read_index(io.BytesIO(b"3:foo,"))
+        with pytest.raises(FlowReadException, match="Invalid data format"):
+            mitmproxy.io.FlowReader(io.BytesIO(b"bogus")).build_index()
+
+    def test_index_write_error(self):
+        class BrokenFile(io.BytesIO):
+            def write(self, data):
+                raise IOError("disk full")
+
+        idx = io.BytesIO()
+        w = mitmproxy.io.FlowWriter(BrokenFile(), idx)
+        with pytest.raises(IOError):
+            w.add(tflow.tflow())
+        assert not idx.getvalue()
+
+    def test_lazy(self, tmpdir):
+        path = str(tmpdir.join("flows"))
+        flows = [tflow.tflow(resp=True) for _ in range(3)]
+        flows[0].response.content = b"x" * mitmproxy.io.io.LAZY_BODY_SIZE
+        flows[1].backup()
+        flows[1].response.content = b"y" * mitmproxy.io.io.LAZY_BODY_SIZE
+        with open(path, "wb") as f:
+            w = mitmproxy.io.FlowWriter(f)
+            for i in flows:
+                w.add(i)
+
+        with open(path, "rb") as f:
+            r = mitmproxy.io.FlowReader(f, lazy=True)
+            assert r.mmap is not None
+            loaded = list(r.stream())
+            r = mitmproxy.io.FlowReader(f, lazy=True)
+            entries = r.build_index()
+        assert isinstance(vars(loaded[0].response.data)["content"], LazyBytes)
+        assert isinstance(vars(loaded[1].response.data)["content"], LazyBytes)
+        assert not isinstance(vars(loaded[2].response.data)["content"], LazyBytes)
+        assert not loaded[0].modified()
+        assert loaded[1].modified()
+        with open(path, "rb") as f:
+            eager = [f.get_state() for f in mitmproxy.io.FlowReader(f).stream()]
+        assert [f.get_state() for f in loaded] == eager
+        assert r.read_at(entries[1]).get_state() == eager[1]
+
+        with open(path, "wb"):
+            pass
+        with open(path, "rb") as f:
+            r = mitmproxy.io.FlowReader(f, lazy=True)
+            assert r.mmap is None
+            assert not list(r.stream())
+
+        r = mitmproxy.io.FlowReader(io.BytesIO(b""), lazy=True)
+        assert r.mmap is None
+
     def test_error(self):
         sio = io.BytesIO()
         sio.write(b"bogus")
@@ -1,3 +1,5 @@
+from unittest import mock
+
 import pytest
 
 from mitmproxy.test import tflow
@@ -5,6 +7,7 @@ from mitmproxy.net.http import Headers
 import mitmproxy.io
 from mitmproxy import flowfilter
 from mitmproxy.exceptions import Kill, ControlException
+from mitmproxy import controller
 from mitmproxy import flow
 from mitmproxy import http
 
@@ -145,6 +148,67 @@ class TestHTTPFlow:
         f.revert()
         assert f.request.content == b"foo"
 
+    def test_copy_shares_content(self):
+        f = tflow.tflow(resp=True)
+        f.response.content = b"x" * 1024
+        f2 = f.copy()
+        assert f2.response.raw_content is f.response.raw_content
+        f.backup()
+        f.response.content = b"y"
+        assert f2.response.content == b"x" * 1024
+        f.revert()
+        assert f.response.raw_content is f2.response.raw_content
+
+    def test_modified_tracking(self):
+        f = tflow.tflow(resp=True)
+        f.backup()
+        with mock.patch.object(f, "get_state", wraps=f.get_state) as get_state:
+            assert not f.modified()
+            f.reply = controller.DummyReply()
+            f.live = False
+            assert not f.modified()
+
+            f.metadata["foo"] = "bar"
+            assert f.modified()
+            del f.metadata["foo"]
+
+            f.client_conn.tls_extensions.append((0, b"foo"))
+            assert f.modified()
+            f.client_conn.tls_extensions.pop()
+            assert not f.modified()
+
+            f.request.stream = True
+            assert not f.modified()
+            f.request.headers["foo"] = "bar"
+            assert f.modified()
+            assert get_state.call_count == 0
+
+        f.revert()
+        assert not f.modified()
+        f.backup()
+        f.response.status_code = 404
+        assert f.modified()
+
+        f.revert()
+        f.backup()
+        f.response = None
+        assert f.modified()
+        f.revert()
+        assert f.response
+        assert not f.modified()
+
+    def test_modified_tracking_loaded(self):
+        f = tflow.tflow(resp=True)
+        f.backup()
+        f.response.status_code = 404
+        f = http.HTTPFlow.from_state(f.get_state())
+        with mock.patch.object(f, "get_state", wraps=f.get_state) as get_state:
+            assert f.modified()
+            assert f.modified()
+            assert get_state.call_count == 1
+            f.response.status_code = 200
+            assert not f.modified()
+
     def test_backup_idempotence(self):
         f = tflow.tflow(resp=True)
         f.backup()
@@ -2,6 +2,7 @@ import typing
 
 import pytest
 
+from mitmproxy import stateobject
 from mitmproxy.stateobject import StateObject
 
 
@@ -144,3 +145,12 @@ def test_none():
     a = Child(42)
     a.set_state({"x": None})
     assert a.x is None
+
+
+def test_serializers_cached():
+    a = TList([Child(1)])
+    a.get_state()
+    assert stateobject._serializers(TList) is stateobject._serializers(TList)
+    assert stateobject._serializers(TList) is not stateobject._serializers(Child)
+    assert stateobject.get_state(typing.List[Child], [Child(1)]) == [{"x": 1}]
+    assert stateobject.make_object(typing.List[Child], [{"x": 1}]) == [Child(1)]
@@ -41,6 +41,20 @@ class TestTCPFlow:
         assert f.error.get_state() == f2.error.get_state()
         assert f.error is not f2.error
 
+    def test_modified(self):
+        f = tflow.ttcpflow()
+        f.backup()
+        assert not f.modified()
+        f.messages[0].content = b"foo"
+        assert f.modified()
+
+        f.revert()
+        f.backup()
+        f.messages.append(tcp.TCPMessage(True, b"foo"))
+        assert f.modified()
+        f.revert()
+        assert not f.modified()
+
     def test_match(self):
         f = tflow.ttcpflow()
         assert not flowfilter.match("~b nonexistent", f)
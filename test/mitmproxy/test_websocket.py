@@ -1,8 +1,11 @@
 import io
+import pickle
 import pytest
 
 from mitmproxy.io import tnetstring
 from mitmproxy import flowfilter
+from mitmproxy import io as mio
+from mitmproxy import websocket
 from mitmproxy.exceptions import Kill, ControlException
 from mitmproxy.test import tflow
 
@@ -87,6 +90,32 @@ class TestWebSocketFlow:
         tnetstring.dump(d, b)
         assert b.getvalue()
 
+    def test_pickle(self):
+        f = websocket.WebSocketFlow.from_state(tflow.twebsocketflow().get_state())
+        f.messages.set_retention(max_count=1)
+        g = pickle.loads(pickle.dumps(f))
+        assert g.get_state() == f.get_state()
+        assert not g.messages.spilled
+        g.inject_message(g.server_conn, "foo")
+        assert g._inject_messages_server.qsize() == 1
+
+    def test_modified(self):
+        f = tflow.twebsocketflow()
+        f.backup()
+        assert not f.modified()
+        f.messages[-1].kill()
+        assert f.modified()
+
+        f.revert()
+        f.backup()
+        f.messages.set_retention(max_count=1)
+        assert f.messages.spilled
+        assert not f.modified()
+        f.messages.append(websocket.WebSocketMessage(websocket.Opcode.TEXT, True, b"foo"))
+        assert f.modified()
+        f.revert()
+        assert not f.modified()
+
     def test_message_kill(self):
         f = tflow.twebsocketflow()
         assert not f.messages[-1].killed
@@ -104,3 +133,123 @@ class TestWebSocketFlow:
 
         f.inject_message(f.server_conn, 'foobar')
         assert f._inject_messages_client.qsize() == 1
+
+
+class TestWebSocketMessages:
+
+    def messages(self, n, **retention):
+        messages = websocket.WebSocketMessages()
+        messages.set_retention(**retention)
+        for i in range(n):
+            messages.append(websocket.WebSocketMessage(
+                websocket.Opcode.BINARY, i % 2 == 0, b"x" * i
+            ))
+        return messages
+
+    def test_unbounded(self):
+        messages = self.messages(10)
+        assert len(messages) == 10
+        assert not messages.spilled
+        assert messages.spill_file is None
+
+    @pytest.mark.parametrize("retention", [
+        dict(max_count=3),
+        dict(max_size=25),
+    ])
+    def test_spill(self, retention):
+        messages = self.messages(10, **retention)
+        assert len(messages) == 10
+        assert len(messages.recent) == 3
+        assert messages.spilled == 7
+        assert [len(m.content) for m in messages] == list(range(10))
+        assert messages[0].content == b""
+        assert messages[6].content == b"x" * 6
+        assert messages[-1].content == b"x" * 9
+        assert messages[-1] is messages.recent[-1]
+        assert [len(m.content) for m in messages[5:8]] == [5, 6, 7]
+        assert [len(m.content) for m in reversed(messages)] == list(reversed(range(10)))
+        with pytest.raises(IndexError):
+            messages[10]
+
+    def test_keeps_latest(self):
+        messages = self.messages(3, max_size=1)
+        assert messages.spilled == 2
+        assert messages[-1] is messages.recent[0]
+
+    def test_set_retention(self):
+        messages = self.messages(10)
+        messages.set_retention(max_count=4)
+        assert messages.spilled == 6
+        assert [len(m.content) for m in messages] == list(range(10))
+
+    def test_state(self):
+        messages = self.messages(10, max_count=3)
+        state = messages.get_state()
+        assert len(state) == 10
+
+        f = websocket.WebSocketFlow(None, None, None)
+        f.messages.set_retention(max_count=2)
+        f.messages.set_state(state)
+        assert f.messages.spilled == 8
+        assert f.messages.get_state() == state
+
+    def test_eq(self):
+        assert websocket.WebSocketMessages() == []
+        messages = self.messages(2)
+        assert messages == list(messages)
+        assert messages != 42
+
+    def test_copy(self):
+        messages = self.messages(10, max_count=3)
+        c = messages.copy()
+        assert c.spill_file is messages.spill_file
+        assert c.max_count == 3
+        assert c.get_state() == messages.get_state()
+        assert c.recent[0] is not messages.recent[0]
+
+        # Both sides spill more messages, the second one to a private file.
+        for m in (messages, c, messages):
+            m.append(websocket.WebSocketMessage(websocket.Opcode.TEXT, True, b"foo%d" % len(m)))
+        assert c.spill_file is not messages.spill_file
+        assert [m.content for m in messages[9:]] == [b"x" * 9, b"foo10", b"foo11"]
+        assert [m.content for m in c[9:]] == [b"x" * 9, b"foo10"]
+        assert messages.spilled == 9
+        assert c.spilled == 8
+
+        messages.set_state([])
+        assert len(c) == 11
+
+    def test_flow_copy(self):
+        f = tflow.twebsocketflow()
+        f.messages.set_retention(max_count=1)
+        for i in range(5):
+            f.messages.append(websocket.WebSocketMessage(websocket.Opcode.TEXT, True, b"foo%d" % i))
+        f2 = f.copy()
+        assert f2.messages.spill_file is f.messages.spill_file
+        assert f2.messages.get_state() == f.messages.get_state()
+        assert f2.id != f.id
+
+        b = io.BytesIO()
+        mio.FlowWriter(b).add(f2)
+        b.seek(0)
+        assert list(mio.FlowReader(b).stream())[0].messages.get_state() == f.messages.get_state()
+
+    def test_flow_writer(self):
+        f = tflow.twebsocketflow()
+        f.messages.set_retention(max_count=1)
+        for i in range(5):
+            f.messages.append(websocket.WebSocketMessage(websocket.Opcode.TEXT, True, b"foo%d" % i))
+        assert f.messages.spilled
+        state = f.get_state()
+
+        b = io.BytesIO()
+        w = mio.FlowWriter(b)
+        w.add(f)
+        w.add(tflow.twebsocketflow())
+        assert tnetstring.loads(b.getvalue()) == tnetstring.loads(tnetstring.dumps(state))
+
+        b.seek(0)
+        flows = list(mio.FlowReader(b).stream())
+        assert len(flows) == 2
+        assert tnetstring.dumps(flows[0].get_state()) == tnetstring.dumps(state)
+        assert len(flows[1].messages) == 3
@@ -254,6 +254,17 @@ class TestApp(tornado.testing.AsyncHTTPTestCase):
         assert resp.code == 200
         assert json(resp)[0]["level"] == "info"
 
+    def test_addon_stats(self):
+        assert json(self.fetch("/addons/stats")) == dict(enabled=False, handlers=[])
+        self.master.options.addon_stats = True
+        try:
+            self.master.addons.trigger("running")
+            j = json(self.fetch("/addons/stats.json"))
+            assert j["enabled"]
+            assert j["handlers"][0]["count"] == 1
+        finally:
+            self.master.options.addon_stats = False
+
     def test_settings(self):
         assert json(self.fetch("/settings"))["mode"] == "regular"
 